@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*
+"""
+压测Senta的asyncio攒batch前端：N个并发客户端各自循环发送单条文本，统计吞吐和p50/p99延迟，
+并和不攒batch（max_batch_size=1）的情况对比
+
+usage:
+    PYTHONPATH=. python benchmark/bench_async_batching.py --concurrency 1,8,32,64 --num_requests 512
+"""
+import argparse
+import asyncio
+import logging
+import time
+
+import numpy as np
+
+from bench_bucket_predict import build_mixed_corpus
+from senta import Senta
+from senta.utils.args import ArgumentGroup
+
+
+async def run_load(batcher, texts, concurrency, num_requests):
+    """closed-loop压测：concurrency个客户端一共发num_requests条请求
+    :return: 每条请求的延迟(秒)，总耗时(秒)
+    """
+    latencies = []
+    next_index = [0]
+
+    async def client():
+        """一个客户端，收到上一条的结果之后才发下一条"""
+        while next_index[0] < num_requests:
+            text = texts[next_index[0] % len(texts)]
+            next_index[0] += 1
+            begin_time = time.time()
+            await batcher.predict(text)
+            latencies.append(time.time() - begin_time)
+
+    begin_time = time.time()
+    await asyncio.gather(*[client() for _ in range(concurrency)])
+    return latencies, time.time() - begin_time
+
+
+async def bench(senta, texts, args):
+    """对每个并发度分别压测攒batch和不攒batch两种模式"""
+    print("%-12s %-8s %12s %10s %10s %10s" % ("concurrency", "mode", "req/s", "p50(ms)", "p99(ms)", "avg_batch"))
+    for concurrency in [int(c) for c in args.concurrency.split(",")]:
+        for mode, max_batch_size in [("single", 1), ("batched", args.max_batch_size)]:
+            batcher = senta.async_batcher(max_batch_size=max_batch_size, max_wait_ms=args.max_wait_ms)
+            latencies, total_time = await run_load(batcher, texts, concurrency, args.num_requests)
+            stats = batcher.stats()
+            await batcher.close()
+            print("%-12d %-8s %12.1f %10.1f %10.1f %10.2f" % (concurrency, mode, len(latencies) / total_time,
+                                                               np.percentile(latencies, 50) * 1000,
+                                                               np.percentile(latencies, 99) * 1000,
+                                                               stats["avg_batch_size"]))
+
+
+def main():
+    """main"""
+    parser = argparse.ArgumentParser(__doc__)
+    bench_g = ArgumentGroup(parser, "benchmark", "async micro-batching benchmark options.")
+    bench_g.add_arg("model_class", str, "ernie_1.0_skep_large_ch", "pre-trained model name.")
+    bench_g.add_arg("task", str, "sentiment_classify", "task name.")
+    bench_g.add_arg("use_cuda", bool, False, "whether to run on gpu.")
+    bench_g.add_arg("num_predictors", int, 1, "number of pooled predictors.")
+    bench_g.add_arg("concurrency", str, "1,8,32,64", "comma separated numbers of concurrent clients.")
+    bench_g.add_arg("num_requests", int, 512, "requests per run.")
+    bench_g.add_arg("max_batch_size", int, 32, "max texts per batch in batched mode.")
+    bench_g.add_arg("max_wait_ms", float, 5, "max wait of the first text in a batch.")
+    args = parser.parse_args()
+    logging.getLogger().setLevel(logging.WARNING)
+
+    texts = build_mixed_corpus(1024, 0.0, is_ch=args.model_class.endswith("_ch"))
+    senta = Senta()
+    senta.init_model(model_class=args.model_class, task=args.task, use_cuda=args.use_cuda,
+                     num_predictors=args.num_predictors)
+    senta.predict(texts[:args.max_batch_size])
+
+    asyncio.run(bench(senta, texts, args))
+
+
+if __name__ == "__main__":
+    main()
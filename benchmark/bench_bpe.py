@@ -0,0 +1,120 @@
+# -*- coding: utf-8 -*
+"""
+对比BpeEncoder.bpe改用堆合并之前（每次合并后用min重新扫描所有相邻pair）和之后的吞吐，并检查两者的结果逐字节相同；
+再用带大量唯一url、话题标签的文本测试有上限的LRU缓存：缓存大小不超过容量，以及命中率
+
+usage:
+    PYTHONPATH=. python benchmark/bench_bpe.py --input_file ./data/en/finetune/SST-2/dev --cache_capacity 10000
+"""
+import argparse
+import logging
+import random
+import time
+
+from bench_wordpiece import read_texts
+from senta.data.tokenizer.tokenization_utils import BpeEncoder, get_pairs
+from senta.utils.args import ArgumentGroup
+
+
+def legacy_bpe(encoder, token):
+    """改用堆之前的合并循环，不带缓存，作为对照"""
+    word = tuple(token)
+    pairs = get_pairs(word)
+
+    if not pairs:
+        return token
+
+    while True:
+        bigram = min(pairs, key=lambda pair: encoder.bpe_ranks.get(pair, float('inf')))
+        if bigram not in encoder.bpe_ranks:
+            break
+        first, second = bigram
+        new_word = []
+        i = 0
+        while i < len(word):
+            try:
+                j = word.index(first, i)
+                new_word.extend(word[i:j])
+                i = j
+            except ValueError:
+                new_word.extend(word[i:])
+                break
+
+            if word[i] == first and i < len(word) - 1 and word[i + 1] == second:
+                new_word.append(first + second)
+                i += 2
+            else:
+                new_word.append(word[i])
+                i += 1
+        word = tuple(new_word)
+        if len(word) == 1:
+            break
+        pairs = get_pairs(word)
+    return ' '.join(word)
+
+
+def add_noise(texts, ratio, seed=1):
+    """给一部分文本加上只出现一次的url和话题标签，模拟用户生成的文本"""
+    rng = random.Random(seed)
+    noisy = []
+    for index, text in enumerate(texts):
+        if rng.random() < ratio:
+            text = "%s https://t.co/%x%d #%s%d" % (text, rng.getrandbits(40), index,
+                                                   rng.choice(["love", "fail", "mood", "review"]), index)
+        noisy.append(text)
+    return noisy
+
+
+def byte_words(encoder, texts):
+    """按BpeEncoder.encode的方式切出要做bpe的词"""
+    words = []
+    for text in texts:
+        for token in encoder.pat.findall(text):
+            words.append(''.join(encoder.byte_encoder[b] for b in token.encode('utf-8')))
+    return words
+
+
+def main():
+    """main"""
+    parser = argparse.ArgumentParser(__doc__)
+    bench_g = ArgumentGroup(parser, "benchmark", "bpe benchmark options.")
+    bench_g.add_arg("bpe_json_file", str, "./model_files/dict/roberta_en.encoder.json", "encoder json.")
+    bench_g.add_arg("bpe_vocab_file", str, "./model_files/dict/roberta_en.vocab.bpe", "bpe merges.")
+    bench_g.add_arg("input_file", str, "./data/en/finetune/SST-2/dev", "SST-2 file or dir.")
+    bench_g.add_arg("num_texts", int, 2000, "number of texts, 0 means all.")
+    bench_g.add_arg("noise_ratio", float, 0.5, "ratio of texts that get a unique url and hashtag.")
+    bench_g.add_arg("cache_capacity", int, 10000, "bpe cache capacity.")
+    bench_g.add_arg("repeat", int, 3, "passes over the corpus with the cache on.")
+    args = parser.parse_args()
+    logging.getLogger().setLevel(logging.INFO)
+
+    encoder = BpeEncoder(args.bpe_json_file, args.bpe_vocab_file, cache_capacity=args.cache_capacity)
+    texts = add_noise(read_texts(args.input_file, args.num_texts, is_ch=False), args.noise_ratio)
+    words = byte_words(encoder, texts)
+    unique_words = list(set(words))
+
+    # 不经过缓存，只比较合并算法
+    begin_time = time.time()
+    legacy_results = [legacy_bpe(encoder, word) for word in unique_words]
+    legacy_time = time.time() - begin_time
+    begin_time = time.time()
+    heap_results = [' '.join(encoder.merge(word)) if len(word) > 1 else word for word in unique_words]
+    heap_time = time.time() - begin_time
+    mismatch = sum(1 for a, b in zip(legacy_results, heap_results) if a != b)
+    print("%d texts, %d words, %d unique" % (len(texts), len(words), len(unique_words)))
+    print("merge  legacy min-scan: %.3fs, %.0f words/s" % (legacy_time, len(unique_words) / legacy_time))
+    print("merge  heap           : %.3fs, %.0f words/s" % (heap_time, len(unique_words) / heap_time))
+    print("merge  speedup: %.2fx, mismatches: %d" % (legacy_time / heap_time, mismatch))
+
+    # 带缓存的encode，缓存大小不超过cache_capacity
+    begin_time = time.time()
+    for _ in range(args.repeat):
+        for text in texts:
+            encoder.encode(text)
+    encode_time = time.time() - begin_time
+    print("encode with cache: %.0f texts/s, cache %s" % (len(texts) * args.repeat / encode_time,
+                                                          encoder.cache_stats()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+# -*- coding: utf-8 -*
+"""
+对比Senta.predict整批padding与按长度分桶两种方式的padding token数和耗时
+
+usage:
+    PYTHONPATH=. python benchmark/bench_bucket_predict.py --model_class ernie_1.0_skep_large_ch --num_texts 512
+    PYTHONPATH=. python benchmark/bench_bucket_predict.py --input_file ./reviews.txt --bucket_bounds 32,64,128,256,512
+"""
+import argparse
+import logging
+import random
+import time
+
+from senta import Senta
+from senta.data.util_helper import convert_texts_to_src_ids, split_batch_by_length
+from senta.utils.args import ArgumentGroup
+
+CH_CHARS = u"这个酒店的服务非常好房间干净位置方便但是早餐一般价格有点贵下次还会再来"
+EN_WORDS = ["the", "movie", "is", "a", "sometimes", "tedious", "film", "but", "acting", "was",
+            "great", "and", "plot", "really", "boring", "i", "love", "this", "laptop", "screen"]
+
+
+def build_mixed_corpus(num_texts, long_ratio, is_ch, seed=1):
+    """生成长短混合的语料：大部分是短文本，少量是长评论"""
+    rng = random.Random(seed)
+    texts = []
+    for _ in range(num_texts):
+        if rng.random() < long_ratio:
+            length = rng.randint(200, 480)
+        else:
+            length = rng.randint(5, 30)
+        if is_ch:
+            texts.append(u"".join(rng.choice(CH_CHARS) for _ in range(length)))
+        else:
+            texts.append(" ".join(rng.choice(EN_WORDS) for _ in range(length)))
+    return texts
+
+
+def padded_tokens(seq_lens, batches):
+    """一组batch在padding之后实际送进模型的token数"""
+    total = 0
+    for batch_index in batches:
+        total += max(seq_lens[i] for i in batch_index) * len(batch_index)
+    return total
+
+
+def timed_predict(senta, texts, bucket_bounds, batch_size, repeat):
+    """返回最后一次的预测结果和平均耗时"""
+    results = None
+    begin_time = time.time()
+    for _ in range(repeat):
+        results = senta.predict(texts, bucket_bounds=bucket_bounds, batch_size=batch_size)
+    return results, (time.time() - begin_time) / repeat
+
+
+def main():
+    """main"""
+    parser = argparse.ArgumentParser(__doc__)
+    bench_g = ArgumentGroup(parser, "benchmark", "bucketed predict benchmark options.")
+    bench_g.add_arg("model_class", str, "ernie_1.0_skep_large_ch", "pre-trained model name.")
+    bench_g.add_arg("task", str, "sentiment_classify", "task name.")
+    bench_g.add_arg("use_cuda", bool, False, "whether to run on gpu.")
+    bench_g.add_arg("input_file", str, None, "one text per line, a synthetic corpus is used if not set.")
+    bench_g.add_arg("num_texts", int, 512, "number of synthetic texts.")
+    bench_g.add_arg("long_ratio", float, 0.05, "ratio of long reviews in the synthetic corpus.")
+    bench_g.add_arg("bucket_bounds", str, "32,64,128,256,512", "comma separated bucket bounds.")
+    bench_g.add_arg("batch_size", int, 32, "max texts per batch.")
+    bench_g.add_arg("repeat", int, 3, "timed runs per mode.")
+    args = parser.parse_args()
+    logging.getLogger().setLevel(logging.INFO)
+
+    if args.input_file:
+        with open(args.input_file, "r") as fr:
+            texts = [line.strip("\r\n") for line in fr if line.strip()]
+    else:
+        texts = build_mixed_corpus(args.num_texts, args.long_ratio, is_ch=args.model_class.endswith("_ch"))
+    bucket_bounds = [int(b) for b in args.bucket_bounds.split(",")]
+
+    senta = Senta()
+    senta.init_model(model_class=args.model_class, task=args.task, use_cuda=args.use_cuda)
+
+    model = senta.get_model()
+    src_ids = convert_texts_to_src_ids(texts, model.tokenizer, model.max_seq_len, model.truncation_type)
+    seq_lens = [len(src_id) for src_id in src_ids]
+    real_tokens = sum(seq_lens)
+    plain_tokens = padded_tokens(seq_lens, split_batch_by_length(seq_lens, None, args.batch_size))
+    bucket_tokens = padded_tokens(seq_lens, split_batch_by_length(seq_lens, bucket_bounds, args.batch_size))
+
+    # 预热一次，避免mkldnn/cudnn的初始化计入耗时
+    senta.predict(texts[:args.batch_size])
+    plain_results, plain_time = timed_predict(senta, texts, None, args.batch_size, args.repeat)
+    bucket_results, bucket_time = timed_predict(senta, texts, bucket_bounds, args.batch_size, args.repeat)
+    mismatch = sum(1 for a, b in zip(plain_results, bucket_results) if a != b)
+
+    print("texts: %d, real tokens: %d" % (len(texts), real_tokens))
+    print("file order : padded tokens %d (%.2fx real), %.3fs" % (plain_tokens, plain_tokens / real_tokens,
+                                                                  plain_time))
+    print("bucketed   : padded tokens %d (%.2fx real), %.3fs" % (bucket_tokens, bucket_tokens / real_tokens,
+                                                                  bucket_time))
+    print("padded token savings: %.1f%%, speedup: %.2fx, label mismatches: %d"
+          % (100.0 * (plain_tokens - bucket_tokens) / plain_tokens, plain_time / bucket_time, mismatch))
+
+
+if __name__ == "__main__":
+    main()
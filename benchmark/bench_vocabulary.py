@@ -0,0 +1,94 @@
+# -*- coding: utf-8 -*
+"""
+对比每个tokenizer各自解析词表（改动之前：FullTokenizer自己、BasicTokenizer、WordPieceTokenizer各一份OrderedDict，
+train/dev/test/predict四个reader再乘4）与进程内共享的紧凑Vocabulary的加载耗时和RSS。每种方式在单独的子进程里跑，
+RSS互不影响
+
+usage:
+    PYTHONPATH=. python benchmark/bench_vocabulary.py --vocab_path ./model_files/dict/ernie_2.0_large_en.vocab.txt
+"""
+import argparse
+import collections
+import logging
+import multiprocessing
+import resource
+import time
+
+from senta.data.tokenizer.tokenization_wp import FullTokenizer
+from senta.data.vocabulary import get_vocabulary
+from senta.utils.args import ArgumentGroup
+from senta.utils.util_helper import convert_to_unicode
+
+
+def legacy_load_vocab(vocab_path):
+    """改动之前Vocabulary.load_vocab的实现，作为对照"""
+    vocab_dict = collections.OrderedDict()
+    id_dict = collections.OrderedDict()
+    file_vocab = open(vocab_path, encoding='utf-8')
+    for num, line in enumerate(file_vocab):
+        items = convert_to_unicode(line.strip()).split("\t")
+        if len(items) > 2:
+            break
+        token = items[0]
+        if len(items) == 2:
+            index = items[1]
+        else:
+            index = num
+        token = token.strip()
+
+        vocab_dict[token] = int(index)
+        id_dict[index] = token
+    return vocab_dict, id_dict
+
+
+def rss_mb():
+    """
+    :return: 当前进程的RSS(MB)，没有/proc时用ru_maxrss
+    """
+    try:
+        with open("/proc/self/status") as fr:
+            for line in fr:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024.0
+    except IOError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+
+
+def run(mode, vocab_path, num_readers, queue):
+    """在子进程里加载num_readers个reader需要的词表"""
+    before = rss_mb()
+    begin_time = time.time()
+    keep = []
+    for _ in range(num_readers):
+        if mode == "legacy":
+            # 每个FullTokenizer解析3次
+            keep.extend(legacy_load_vocab(vocab_path) for _ in range(3))
+        elif mode == "shared":
+            keep.extend(get_vocabulary(vocab_path, "[UNK]") for _ in range(3))
+        else:
+            keep.append(FullTokenizer(vocab_path))
+    queue.put((mode, time.time() - begin_time, before, rss_mb()))
+
+
+def main():
+    """main"""
+    parser = argparse.ArgumentParser(__doc__)
+    bench_g = ArgumentGroup(parser, "benchmark", "vocabulary benchmark options.")
+    bench_g.add_arg("vocab_path", str, "./model_files/dict/ernie_2.0_large_en.vocab.txt", "vocab file.")
+    bench_g.add_arg("num_readers", int, 4, "number of readers, each one builds a FullTokenizer.")
+    args = parser.parse_args()
+    logging.getLogger().setLevel(logging.WARNING)
+
+    print("%-10s %10s %12s %12s %12s" % ("mode", "load(s)", "rss_before", "rss_after", "delta(MB)"))
+    for mode in ["legacy", "shared", "tokenizer"]:
+        queue = multiprocessing.Queue()
+        process = multiprocessing.Process(target=run, args=(mode, args.vocab_path, args.num_readers, queue))
+        process.start()
+        mode, cost, before, after = queue.get()
+        process.join()
+        print("%-10s %10.3f %12.1f %12.1f %12.1f" % (mode, cost, before, after, after - before))
+
+
+if __name__ == "__main__":
+    main()
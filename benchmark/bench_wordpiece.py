@@ -0,0 +1,132 @@
+# -*- coding: utf-8 -*
+"""
+对比WordPieceTokenizer逐个缩短子串查词表与前缀树最长匹配两种实现的耗时，并检查两者的切分结果完全相同。
+英文用SST-2和ernie_2.0_large_en的词表，中文用ChnSentiCorp和ernie_1.0_large_ch的词表，
+数据没有下载时用合成的语料
+
+usage:
+    PYTHONPATH=. python benchmark/bench_wordpiece.py --en_data ./data/en/finetune/SST-2/dev \\
+        --ch_data ./data/ch/finetune/Chnsenticorp/dev --repeat 5
+"""
+import argparse
+import logging
+import os
+import time
+
+from bench_bucket_predict import build_mixed_corpus
+from senta.data.tokenizer.tokenization_wp import BasicTokenizer, WordPieceTokenizer
+from senta.utils.args import ArgumentGroup
+from senta.utils.util_helper import whitespace_tokenize
+
+
+def legacy_tokenize(tokenizer, text):
+    """改用前缀树之前的WordPieceTokenizer.tokenize，作为对照"""
+    output_tokens = []
+    vocab_dict = tokenizer.vocabulary.vocab_dict
+    for token in whitespace_tokenize(text):
+        chars = list(token)
+        if len(chars) > tokenizer.max_input_chars_per_word:
+            output_tokens.append(tokenizer.unk_token)
+            continue
+
+        is_bad = False
+        start = 0
+        sub_tokens = []
+        while start < len(chars):
+            end = len(chars)
+            cur_substr = None
+            while start < end:
+                substr = "".join(chars[start:end])
+                if start > 0:
+                    substr = "##" + substr
+                if substr in vocab_dict:
+                    cur_substr = substr
+                    break
+                end -= 1
+            if cur_substr is None:
+                is_bad = True
+                break
+            sub_tokens.append(cur_substr)
+            start = end
+
+        if is_bad:
+            output_tokens.append(tokenizer.unk_token)
+        else:
+            output_tokens.extend(sub_tokens)
+    return output_tokens
+
+
+def read_texts(data_path, num_texts, is_ch):
+    """读取data_path（文件或目录）里每行第一列的文本，路径不存在时生成合成语料"""
+    if not data_path or not os.path.exists(data_path):
+        logging.info("%s not found, use a synthetic corpus" % data_path)
+        return build_mixed_corpus(num_texts, 0.05, is_ch)
+    if os.path.isdir(data_path):
+        files = [os.path.join(data_path, name) for name in sorted(os.listdir(data_path))]
+    else:
+        files = [data_path]
+    texts = []
+    for file_name in files:
+        with open(file_name, "r", encoding="utf-8") as fr:
+            for line in fr:
+                text = line.rstrip("\r\n").split("\t")[0]
+                if text and text != "text_a":
+                    texts.append(text)
+    return texts[:num_texts] if num_texts > 0 else texts
+
+
+def timed(tokenize, words, repeat):
+    """
+    :return: 最后一轮的结果和最快一轮的耗时(秒)
+    """
+    results = None
+    best = None
+    for _ in range(repeat):
+        begin_time = time.time()
+        results = [tokenize(word) for word in words]
+        cost = time.time() - begin_time
+        best = cost if best is None else min(best, cost)
+    return results, best
+
+
+def bench(name, vocab_file, data_path, num_texts, repeat, is_ch):
+    """在一份语料上对比两种实现"""
+    texts = read_texts(data_path, num_texts, is_ch)
+    begin_time = time.time()
+    tokenizer = WordPieceTokenizer(vocab_file=vocab_file)
+    build_time = time.time() - begin_time
+    # WordPieceTokenizer的输入是BasicTokenizer切好的词，这一步不计入耗时
+    basic_tokenizer = BasicTokenizer(vocab_file=vocab_file)
+    words = [" ".join(basic_tokenizer.tokenize(text)) for text in texts]
+    num_words = sum(len(word.split()) for word in words)
+
+    legacy_results, legacy_time = timed(lambda word: legacy_tokenize(tokenizer, word), words, repeat)
+    trie_results, trie_time = timed(tokenizer.tokenize, words, repeat)
+    mismatch = sum(1 for a, b in zip(legacy_results, trie_results) if a != b)
+
+    print("%s: %d texts, %d words, %d pieces, trie built in %.3fs"
+          % (name, len(texts), num_words, sum(len(r) for r in trie_results), build_time))
+    print("    legacy: %.3fs, %.0f words/s" % (legacy_time, num_words / legacy_time))
+    print("    trie  : %.3fs, %.0f words/s" % (trie_time, num_words / trie_time))
+    print("    speedup: %.2fx, mismatches: %d" % (legacy_time / trie_time, mismatch))
+
+
+def main():
+    """main"""
+    parser = argparse.ArgumentParser(__doc__)
+    bench_g = ArgumentGroup(parser, "benchmark", "wordpiece benchmark options.")
+    bench_g.add_arg("en_vocab", str, "./model_files/dict/ernie_2.0_large_en.vocab.txt", "english vocab.")
+    bench_g.add_arg("en_data", str, "./data/en/finetune/SST-2/dev", "SST-2 file or dir.")
+    bench_g.add_arg("ch_vocab", str, "./model_files/dict/ernie_1.0_large_ch.vocab.txt", "chinese vocab.")
+    bench_g.add_arg("ch_data", str, "./data/ch/finetune/Chnsenticorp/dev", "ChnSentiCorp file or dir.")
+    bench_g.add_arg("num_texts", int, 2000, "texts per corpus, 0 means all.")
+    bench_g.add_arg("repeat", int, 3, "timed runs per implementation, the fastest one counts.")
+    args = parser.parse_args()
+    logging.getLogger().setLevel(logging.INFO)
+
+    bench("SST-2", args.en_vocab, args.en_data, args.num_texts, args.repeat, is_ch=False)
+    bench("ChnSentiCorp", args.ch_vocab, args.ch_data, args.num_texts, args.repeat, is_ch=True)
+
+
+if __name__ == "__main__":
+    main()
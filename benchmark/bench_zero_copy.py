@@ -0,0 +1,61 @@
+# -*- coding: utf-8 -*
+"""
+对比Senta.predict走PaddleTensor + predictor.run与走ZeroCopyPredictor两种方式，在小batch下每个batch的耗时。
+batch越小，输入输出的拷贝和转换在总耗时里占比越大
+
+usage:
+    PYTHONPATH=. python benchmark/bench_zero_copy.py --model_class ernie_1.0_skep_large_ch --batch_sizes 1,2,4,8,16
+"""
+import argparse
+import logging
+import time
+
+from bench_bucket_predict import build_mixed_corpus
+from senta import Senta
+from senta.utils.args import ArgumentGroup
+
+
+def timed_batches(senta, texts, batch_size, num_batches):
+    """
+    :return: 每个batch的平均耗时(秒)，以及所有batch的预测结果
+    """
+    results = []
+    begin_time = time.time()
+    for i in range(num_batches):
+        start = i * batch_size % len(texts)
+        results.extend(senta.predict(texts[start: start + batch_size]))
+    return (time.time() - begin_time) / num_batches, results
+
+
+def main():
+    """main"""
+    parser = argparse.ArgumentParser(__doc__)
+    bench_g = ArgumentGroup(parser, "benchmark", "zero copy benchmark options.")
+    bench_g.add_arg("model_class", str, "ernie_1.0_skep_large_ch", "pre-trained model name.")
+    bench_g.add_arg("task", str, "sentiment_classify", "task name.")
+    bench_g.add_arg("use_cuda", bool, False, "whether to run on gpu.")
+    bench_g.add_arg("batch_sizes", str, "1,2,4,8,16", "comma separated batch sizes.")
+    bench_g.add_arg("num_batches", int, 200, "timed batches per batch size and mode.")
+    args = parser.parse_args()
+    logging.getLogger().setLevel(logging.WARNING)
+
+    texts = build_mixed_corpus(1024, 0.0, is_ch=args.model_class.endswith("_ch"))
+    tensor_senta = Senta()
+    tensor_senta.init_model(model_class=args.model_class, task=args.task, use_cuda=args.use_cuda)
+    zero_copy_senta = Senta()
+    zero_copy_senta.init_model(model_class=args.model_class, task=args.task, use_cuda=args.use_cuda, zero_copy=True)
+    # 预热一次，避免mkldnn/cudnn的初始化计入耗时
+    tensor_senta.predict(texts[:8])
+    zero_copy_senta.predict(texts[:8])
+
+    print("%-10s %14s %14s %10s %10s" % ("batch_size", "tensor(ms)", "zero_copy(ms)", "speedup", "mismatch"))
+    for batch_size in [int(b) for b in args.batch_sizes.split(",")]:
+        tensor_time, tensor_results = timed_batches(tensor_senta, texts, batch_size, args.num_batches)
+        zero_copy_time, zero_copy_results = timed_batches(zero_copy_senta, texts, batch_size, args.num_batches)
+        mismatch = sum(1 for a, b in zip(tensor_results, zero_copy_results) if a != b)
+        print("%-10d %14.2f %14.2f %9.2fx %10d" % (batch_size, tensor_time * 1000, zero_copy_time * 1000,
+                                                   tensor_time / zero_copy_time, mismatch))
+
+
+if __name__ == "__main__":
+    main()
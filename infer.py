@@ -3,6 +3,7 @@
 import os
 import sys
 from senta.inference.inference import Inference
+from senta.inference.sharded_inference import run_sharded_inference
 from senta.common.register import RegisterSet
 from senta.common import register
 from senta.data.data_set import DataSet
@@ -50,13 +51,19 @@ if __name__ == "__main__":
 
     register.import_modules()
 
+    inference_params_dict = _params.get("inference")
+    if inference_params_dict.get("num_workers", 1) > 1:
+        # 每个子进程自己加载predictor，主进程只负责切分输入和合并结果
+        run_sharded_inference(_params, inference_params_dict["num_workers"], args.log_dir)
+        logging.info("os exit.")
+        os._exit(0)
+
     dataset_reader_params_dict = _params.get("dataset_reader")
     dataset_reader = dataset_reader_from_params(dataset_reader_params_dict)
 
     model_params_dict = _params.get("model")
     model = model_from_params(model_params_dict)
 
-    inference_params_dict = _params.get("inference")
     inference = build_inference(inference_params_dict, dataset_reader, model)
 
     inference.do_inference()
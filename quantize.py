@@ -0,0 +1,75 @@
+# -*- coding: utf-8 -*
+"""
+CPU INT8离线量化，配置文件与infer.py相同，inference_model_path是要量化的FP32模型。用dev集的前calib_samples条样本
+（或calib_data_path的前calib_samples条）校准，INT8模型写到output_path，目录结构和infer_data_params.json与FP32模型相同，
+把配置里的inference_model_path换成它就能用；再用dev集里紧接着的eval_samples条样本（有calib_data_path时是dev集的前
+eval_samples条）对比FP32和INT8的准确率与速度，两部分不重叠，结果和切分方式写在output_path/quantization_report.json
+
+usage:
+    python quantize.py --param_path ./config/ernie_1.0_skep_large_ch.Chnsenticorp.infer.json \\
+        --dev_data_path ./data/ch/finetune/Chnsenticorp/dev --output_path ./output/inference_int8
+"""
+import argparse
+import logging
+import os
+
+from infer import build_inference, dataset_reader_from_params, model_from_params
+from senta.common import register
+from senta.inference.quantization import run_quantization
+from senta.utils import log
+from senta.utils import params
+from senta.utils.args import ArgumentGroup
+
+
+def build_arguments():
+    """build_arguments"""
+    parser = argparse.ArgumentParser(__doc__)
+    model_g = ArgumentGroup(parser, "model", "model configuration and paths.")
+    model_g.add_arg("param_path", str, None, "path to parameter file describing the fp32 model")
+    model_g.add_arg("log_dir", str, "log", "log dir")
+    quant_g = ArgumentGroup(parser, "quantization", "post-training quantization options.")
+    quant_g.add_arg("dev_data_path", str, None, "dev set in the predict_reader format, with labels.")
+    quant_g.add_arg("output_path", str, None, "dir of the int8 inference model.")
+    quant_g.add_arg("calib_data_path", str, None, "calibration data in the predict_reader format, "
+                    "default: the first calib_samples dev examples.")
+    quant_g.add_arg("calib_samples", int, 256, "number of examples used for calibration.")
+    quant_g.add_arg("calib_batch_size", int, 16, "calibration batch size.")
+    quant_g.add_arg("eval_samples", int, 1000, "number of dev examples used to compare fp32 and int8, "
+                    "never overlapping the calibration examples.")
+    quant_g.add_arg("algo", str, "KL", "activation scale algorithm: KL, abs_max or min_max.")
+    quant_g.add_arg("quantizable_op_type", str, "mul,matmul", "comma separated op types to quantize.")
+    quant_g.add_arg("repeat", int, 1, "timed passes over the eval examples, the fastest one counts.")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = build_arguments()
+    log.init_log(os.path.join(args.log_dir, "quantize"), level=logging.INFO)
+    param_dict = params.from_file(args.param_path)
+    _params = params.replace_none(param_dict)
+
+    register.import_modules()
+
+    inference_params = _params.get("inference")
+    if inference_params.get("PADDLE_USE_GPU"):
+        raise ValueError("int8 quantization targets cpu inference, set PADDLE_USE_GPU to false")
+    reader_params = _params.get("dataset_reader")
+    if args.dev_data_path:
+        reader_params["predict_reader"]["config"]["data_path"] = args.dev_data_path
+    # 对比的基准是默认配置的FP32模型
+    inference_params["cpu_tuning"] = False
+    dataset_reader = dataset_reader_from_params(reader_params)
+    model = model_from_params(_params.get("model"))
+    inference = build_inference(inference_params, dataset_reader, model)
+
+    report = run_quantization(inference, args.output_path,
+                              calib_samples=args.calib_samples,
+                              calib_batch_size=args.calib_batch_size,
+                              eval_samples=args.eval_samples,
+                              algo=args.algo,
+                              quantizable_op_type=[op for op in args.quantizable_op_type.split(",") if op],
+                              repeat=args.repeat,
+                              calib_data_path=args.calib_data_path)
+    logging.info("quantization report: %s" % report)
+    print(report)
+    os._exit(0)
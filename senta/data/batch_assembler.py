@@ -0,0 +1,98 @@
+# -*- coding: utf-8 -*
+"""
+:py:class:`BatchAssembler`
+"""
+import itertools
+import threading
+
+import numpy as np
+import paddle
+
+
+class BatchAssembler(object):
+    """BatchAssembler: 把一个batch的id序列padding成ernie的6个输入：src_ids, sent_ids, pos_ids, mask, task_ids, seq_lens，
+    结果与pad_src_ids完全一致。每个输入有一块预先分配的连续内存，按需扩容，之后的batch在上面原地填充，不再逐个元素拼python list；
+    (batch_size, seq_len)不超过已分配大小的batch都直接复用，返回的数组是这块内存上reshape出来的连续view。
+
+    reuse_buffers=True时，返回的数组在同一线程的下一次assemble之后会被覆盖，只能在下一次调用之前用完
+    （比如array2tensor或copy_from_cpu之后就可以丢掉）；不同线程各用各的内存。
+    """
+
+    def __init__(self, padding_id=0, reuse_buffers=True):
+        """
+        :param padding_id: padding用的id
+        :param reuse_buffers: False时每次都分配新内存，返回的数组可以长期持有
+        """
+        self.padding_id = padding_id
+        self.reuse_buffers = reuse_buffers
+        if paddle.__version__[:3] <= '1.5':
+            self.seq_lens_shape = [-1, 1]
+        else:
+            self.seq_lens_shape = [-1]
+        self._local = threading.local()
+
+    def assemble(self, src_ids, sentence_ids=None):
+        """
+        :param src_ids: list of list，已经加好[CLS]/[SEP]
+        :param sentence_ids: list of list，句子对输入时的text_type_ids，为None时全部是0
+        :return: return_list，顺序与structure_fields_dict一致
+        """
+        batch_size = len(src_ids)
+        seq_lens = np.fromiter((len(src_id) for src_id in src_ids), dtype="int64", count=batch_size)
+        max_len = int(seq_lens.max()) if batch_size else 0
+        size = batch_size * max_len
+        # mask[i, j]表示第i条的第j个位置是不是真实token
+        mask = np.arange(max_len) < seq_lens[:, None]
+
+        padded_ids = self._buffer("src_ids", "int64", size).reshape([batch_size, max_len])
+        padded_ids.fill(self.padding_id)
+        padded_ids[mask] = np.fromiter(itertools.chain.from_iterable(src_ids), dtype="int64",
+                                       count=int(seq_lens.sum()))
+
+        sent_ids_batch = self._buffer("sent_ids", "int64", size).reshape([batch_size, max_len])
+        sent_ids_batch.fill(self.padding_id)
+        if sentence_ids is None:
+            sent_ids_batch[mask] = 0
+        else:
+            sent_ids_batch[mask] = np.fromiter(itertools.chain.from_iterable(sentence_ids), dtype="int64",
+                                               count=int(seq_lens.sum()))
+
+        pos_ids_batch = self._buffer("pos_ids", "int64", size).reshape([batch_size, max_len])
+        pos_ids_batch.fill(self.padding_id)
+        np.copyto(pos_ids_batch, np.arange(max_len, dtype="int64")[None, :], where=mask)
+
+        task_ids_batch = self._buffer("task_ids", "int64", size).reshape([batch_size, max_len])
+        task_ids_batch.fill(self.padding_id)
+        task_ids_batch[mask] = 0
+
+        input_mask = self._buffer("mask", "float32", size).reshape([batch_size, max_len])
+        np.copyto(input_mask, mask)
+
+        batch_seq_lens = self._buffer("seq_lens", "int64", batch_size)
+        batch_seq_lens[:] = seq_lens
+
+        return [padded_ids.reshape([-1, max_len, 1]),
+                sent_ids_batch.reshape([-1, max_len, 1]),
+                pos_ids_batch.reshape([-1, max_len, 1]),
+                input_mask.reshape([-1, max_len, 1]),
+                task_ids_batch.reshape([-1, max_len, 1]),
+                batch_seq_lens.reshape(self.seq_lens_shape)]
+
+    def _buffer(self, name, dtype, size):
+        """
+        :return: 长度为size的一维数组，reuse_buffers时是当前线程这块内存的前size个元素
+        """
+        if not self.reuse_buffers:
+            return np.empty(size, dtype=dtype)
+        buffers = getattr(self._local, "buffers", None)
+        if buffers is None:
+            buffers = self._local.buffers = {}
+        buf = buffers.get(name)
+        if buf is None or buf.size < size:
+            # 按2的幂扩容，长度略有变化的batch不用重新分配
+            capacity = 1
+            while capacity < size:
+                capacity *= 2
+            buf = np.empty(capacity, dtype=dtype)
+            buffers[name] = buf
+        return buf[:size]
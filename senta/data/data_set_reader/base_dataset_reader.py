@@ -14,6 +14,8 @@ class BaseDataSetReader(object):
     核心内容是读取明文文件，转换成id，按py_reader需要的tensor格式灌进去，然后通过调用run方法让整个循环跑起来。
     py_reader拿出的来的是lod-tensor形式的id，这些id可以用来做后面的embedding等计算。
     """
+    # 明文文件的第一行是否是表头，按字节切分文件时每一片都要带上表头
+    has_header = False
 
     def __init__(self, name, fields, config):
         self.name = name
@@ -23,6 +25,16 @@ class BaseDataSetReader(object):
         self.current_example = 0
         self.current_epoch = 0
         self.num_examples = 0
+        self.token_cache = None
+
+    def normalize_text(self, name, text):
+        """
+        明文字段的逐行预处理，read_files读文件和Inference.prepare_examples直接预测都经过这里，保证两条路径的输入一致
+        :param name: 字段名，即表头中的列名
+        :param text: 字段的明文
+        :return: 预处理之后的明文，默认不做处理
+        """
+        return text
 
     def create_reader(self):
         """ 
@@ -109,6 +121,52 @@ class BaseDataSetReader(object):
         else:
             raise ValueError("paddle_py_reader is None")
 
+    def enable_token_cache(self, capacity):
+        """给各个field_reader打开明文到id的LRU缓存，重复出现的文本不再分词
+        :param capacity: 每个缓存最多保存的文本条数
+        :return:
+        """
+        for field in self.fields:
+            if field.field_reader:
+                field.field_reader.enable_token_cache(capacity)
+
+    def example_lengths(self, examples):
+        """按token长度排序样本时用，长度是各个文本field序列化之后的长度之和
+        :param examples: read_files读出的样本
+        :return: 每条样本的长度，没有文本field时返回None
+        """
+        lengths = None
+        for index, field in enumerate(self.fields):
+            if not field.field_reader:
+                continue
+            field_lengths = field.field_reader.token_lengths([example[index] for example in examples])
+            if field_lengths is None:
+                continue
+            if lengths is None:
+                lengths = field_lengths
+            else:
+                lengths = [a + b for a, b in zip(lengths, field_lengths)]
+        return lengths
+
+    def enable_profiler(self, profiler):
+        """让各个field_reader把分词和padding的耗时记到profiler里
+        :param profiler: senta.inference.metrics.LatencyProfiler
+        :return:
+        """
+        for field in self.fields:
+            if field.field_reader:
+                field.field_reader.enable_profiler(profiler)
+
+    def token_cache_stats(self):
+        """
+        :return: dict, field名 -> 缓存的命中率等统计，没有打开缓存时为空
+        """
+        stats = {}
+        for field in self.fields:
+            if field.field_reader and field.field_reader.token_cache:
+                stats[field.name] = field.field_reader.token_cache.stats()
+        return stats
+
     def get_train_progress(self):
         """Gets progress for training phase."""
         return self.current_example, self.current_epoch
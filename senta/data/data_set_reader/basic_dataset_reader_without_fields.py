@@ -24,6 +24,7 @@ from senta.common.register import RegisterSet
 from senta.common.rule import InstanceName
 from senta.data.data_set_reader.base_dataset_reader import BaseDataSetReader
 from senta.data.data_set_reader.basic_dataset_reader import BasicDataSetReader
+from senta.data.tokenizer.tokenization_cache import TokenizationCache
 from senta.data.tokenizer.tokenization_spm import preprocess_text
 from senta.data.tokenizer.tokenization_utils import convert_to_unicode
 
@@ -34,6 +35,7 @@ from senta.data.tokenizer.tokenization_utils import convert_to_unicode
 @RegisterSet.data_set_reader.register
 class TaskBaseReader(BasicDataSetReader):
     """task base reader class"""
+    has_header = True
 
     def __init__(self,
                  name,
@@ -109,6 +111,61 @@ class TaskBaseReader(BasicDataSetReader):
     #     examples = self.read_files(self.config.data_path)
     #     return len(examples)
 
+    def enable_token_cache(self, capacity):
+        """打开明文到id的LRU缓存，重复出现的文本不再分词
+        :param capacity: 最多缓存的文本条数
+        :return:
+        """
+        self.token_cache = TokenizationCache(self.tokenizer, capacity)
+
+    def token_cache_stats(self):
+        """
+        :return: dict, 缓存的命中率等统计，没有打开缓存时为空
+        """
+        if self.token_cache is None:
+            return {}
+        return {self.name: self.token_cache.stats()}
+
+    def example_lengths(self, examples):
+        """
+        :param examples: read_files读出的样本
+        :return: 每条样本所有文本field分词之后加上[CLS]/[SEP]、截断之后的长度；打开了token_cache时分词结果会被复用
+        """
+        lengths = []
+        for example in examples:
+            values = self.get_all_text_field(example)
+            num = sum(len(self.tokenize_text(convert_to_unicode(text), self.tokenizer)) for text in values)
+            lengths.append(min(num + len(values) + 1, self.max_seq_len))
+        return lengths
+
+    def tokenize_text(self, text, tokenizer):
+        """打开token_cache时返回缓存的id，否则返回tokenizer切出来的token
+        :param text:
+        :param tokenizer:
+        :return: list
+        """
+        if self.token_cache is not None:
+            return self.token_cache.encode(text)
+        return tokenizer.tokenize(text)
+
+    def convert_tokens_to_ids(self, tokens, tokenizer):
+        """和tokenize_text配套使用，打开token_cache时tokens已经是id了
+        :param tokens:
+        :param tokenizer:
+        :return: list
+        """
+        if self.token_cache is not None:
+            return tokens
+        return tokenizer.convert_tokens_to_ids(tokens)
+
+    def special_tokens(self):
+        """
+        :return: [CLS]和[SEP]，打开token_cache时是对应的id
+        """
+        if self.token_cache is not None:
+            return self.cls_id, self.sep_id
+        return "[CLS]", "[SEP]"
+
     def truncate_seq_pair(self, tokens_a, tokens_b, max_length):
         """Truncates a sequence pair in place to the maximum length."""
 
@@ -168,23 +225,24 @@ class TaskBaseReader(BasicDataSetReader):
         all_tokens = []
         for text in values:
             text_a = convert_to_unicode(text)
-            tokens = tokenizer.tokenize(text_a)
+            tokens = self.tokenize_text(text_a, tokenizer)
             all_tokens.append(tokens)
 
         self.truncate_seqs(all_tokens, max_seq_length - len(all_tokens))
 
+        cls_token, sep_token = self.special_tokens()
         tokens = []
         text_type_ids = []
-        tokens.append("[CLS]")
+        tokens.append(cls_token)
         text_type_ids.append(0)
         for i, _tokens in enumerate(all_tokens):
             for token in _tokens:
                 tokens.append(token)
                 text_type_ids.append(i)
             text_type_ids.append(i)
-            tokens.append("[SEP]")
+            tokens.append(sep_token)
 
-        token_ids = tokenizer.convert_tokens_to_ids(tokens)
+        token_ids = self.convert_tokens_to_ids(tokens, tokenizer)
         position_ids = list(range(len(token_ids)))
         task_ids = [0] * len(token_ids)
 
@@ -219,7 +277,7 @@ class TaskBaseReader(BasicDataSetReader):
         else:
             text_a = convert_to_unicode(preprocess_text(example.text_a,
                                                         lower=self.do_lower_case))
-        tokens_a = tokenizer.tokenize(text_a)
+        tokens_a = self.tokenize_text(text_a, tokenizer)
         tokens_b = None
         if "text_b" in example._fields:
             if is_zh:
@@ -227,7 +285,7 @@ class TaskBaseReader(BasicDataSetReader):
             else:
                 text_b = convert_to_unicode(preprocess_text(example.text_b,
                                                             lower=self.do_lower_case))
-            tokens_b = tokenizer.tokenize(text_b)
+            tokens_b = self.tokenize_text(text_b, tokenizer)
 
         if tokens_b:
             # Modifies `tokens_a` and `tokens_b` in place so that the total
@@ -239,24 +297,25 @@ class TaskBaseReader(BasicDataSetReader):
             if len(tokens_a) > max_seq_length - 2:
                 tokens_a = tokens_a[0:(max_seq_length - 2)]
 
+        cls_token, sep_token = self.special_tokens()
         tokens = []
         text_type_ids = []
-        tokens.append("[CLS]")
+        tokens.append(cls_token)
         text_type_ids.append(0)
         for token in tokens_a:
             tokens.append(token)
             text_type_ids.append(0)
-        tokens.append("[SEP]")
+        tokens.append(sep_token)
         text_type_ids.append(0)
 
         if tokens_b:
             for token in tokens_b:
                 tokens.append(token)
                 text_type_ids.append(1)
-            tokens.append("[SEP]")
+            tokens.append(sep_token)
             text_type_ids.append(1)
 
-        token_ids = tokenizer.convert_tokens_to_ids(tokens)
+        token_ids = self.convert_tokens_to_ids(tokens, tokenizer)
         position_ids = list(range(len(token_ids)))
         task_ids = [0] * len(token_ids)
 
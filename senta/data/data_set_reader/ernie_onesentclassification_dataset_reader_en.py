@@ -19,6 +19,8 @@ from senta.data.data_set_reader.basic_dataset_reader import BasicDataSetReader
 class OneSentClassifyReaderEn(BasicDataSetReader):
     """BasicDataSetReader:一个基础的data_set_reader，实现了文件读取，id序列化，token embedding化等基本操作
     """
+    # read_files把每个文件的第一行当作表头
+    has_header = True
 
     def __init__(self, name, fields, config):
         BaseDataSetReader.__init__(self, name, fields, config)
@@ -60,7 +62,7 @@ class OneSentClassifyReaderEn(BasicDataSetReader):
                 for line in reader:
                     for index, text in enumerate(line):
                         if index in text_indices:
-                            line[index] = text  # .replace(' ', '')
+                            line[index] = self.normalize_text(headers[index], text)
                         elif index in label_indices:
 
                             text_ind = text_indices[0]
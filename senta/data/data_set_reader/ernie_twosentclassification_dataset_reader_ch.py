@@ -81,6 +81,17 @@ class TwoSentClassifyReaderCh(TaskBaseReader):
 
         return fields_instance
 
+    def normalize_text(self, name, text):
+        """
+        除label之外的字段去掉空格
+        :param name: 字段名
+        :param text: 字段的明文
+        :return: 去掉空格之后的明文
+        """
+        if name == "label":
+            return text
+        return text.replace(' ', '')
+
     def read_files(self, file_path, quotechar=None):
         """Reads a tab separated value file."""
         with open(file_path, "r") as f:
@@ -95,7 +106,7 @@ class TwoSentClassifyReaderCh(TaskBaseReader):
                 for line in reader:
                     for index, text in enumerate(line):
                         if index in text_indices:
-                            line[index] = text.replace(' ', '')
+                            line[index] = self.normalize_text(headers[index], text)
                     example = Example(*line)
                     examples.append(example)
                 return examples
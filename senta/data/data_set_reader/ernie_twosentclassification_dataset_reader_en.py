@@ -159,7 +159,7 @@ class TwoSentClassifyReaderEn(TaskBaseReader):
                 for line in reader:
                     for index, text in enumerate(line):
                         if index in text_indices:
-                            line[index] = text  # .replace(' ', '')
+                            line[index] = self.normalize_text(headers[index], text)
                         elif index in label_indices:
 
                             text_ind = text_indices[0]
@@ -14,6 +14,8 @@ class BaseFieldReader(object):
         self.field_config = field_config
         self.tokenizer = None  # 用来分词，需要各个子类实现
         self.token_embedding = None  # 用来生成embedding向量，需要各个子类实现
+        self.token_cache = None  # TokenizationCache，调用enable_token_cache之后才有
+        self.profiler = None  # LatencyProfiler，调用enable_profiler之后才有，记录分词和padding的耗时
 
     def init_reader(self):
         """ 初始化reader格式
@@ -28,6 +30,27 @@ class BaseFieldReader(object):
         """
         raise NotImplementedError
 
+    def enable_token_cache(self, capacity):
+        """打开明文到id的LRU缓存，只有用到了token_cache的子类才需要实现
+        :param capacity: 最多缓存的文本条数
+        :return:
+        """
+        pass
+
+    def token_lengths(self, batch_text):
+        """按token长度排序batch时用，只有文本类的field_reader需要实现
+        :param batch_text: 一组明文
+        :return: 每条明文序列化之后的长度（含特殊token、截断之后），不是文本时返回None
+        """
+        return None
+
+    def enable_profiler(self, profiler):
+        """记录convert_texts_to_ids里分词("tokenize")和padding("pad")的耗时以及token数，只有实现了的子类才会记录
+        :param profiler: senta.inference.metrics.LatencyProfiler
+        :return:
+        """
+        self.profiler = profiler
+
     def get_field_length(self):
         """获取当前这个field在进行了序列化之后，在field_id_list中占多少长度
         :return:
@@ -4,12 +4,14 @@
 
 """
 import logging
+import time
 
 import paddle
 
 from senta.common.register import RegisterSet
 from senta.common.rule import DataShape, FieldLength, InstanceName
 from senta.data.field_reader.base_field_reader import BaseFieldReader
+from senta.data.tokenizer.tokenization_cache import TokenizationCache
 from senta.data.util_helper import pad_batch_data
 from senta.modules.token_embedding.ernie_embedding import ErnieTokenEmbedding
 from senta.utils.util_helper import truncation_words
@@ -84,28 +86,51 @@ class ErnieTextFieldReader(BaseFieldReader):
         types.append('int64')
         return shape, types, levels
 
+    def enable_token_cache(self, capacity):
+        """打开明文到id的LRU缓存，重复的文本不再分词
+        :param capacity: 最多缓存的文本条数
+        :return:
+        """
+        if self.field_config.need_convert and self.tokenizer:
+            self.token_cache = TokenizationCache(self.tokenizer, capacity)
+
+    def token_lengths(self, batch_text):
+        """
+        :param batch_text: 一组明文
+        :return: 每条明文加上[CLS]/[SEP]、截断之后的token数；打开了token_cache时分词结果会被之后的convert_texts_to_ids复用
+        """
+        if self.field_config.need_convert and self.token_cache:
+            nums = [len(self.token_cache.encode(text)) for text in batch_text]
+        elif self.field_config.need_convert:
+            nums = [len(tokens) for tokens in self.tokenizer.tokenize_batch(batch_text)]
+        else:
+            nums = [len(text.split(" ")) for text in batch_text]
+        return [min(num, self.field_config.max_seq_len - 2) + 2 for num in nums]
+
     def convert_texts_to_ids(self, batch_text):
         """将一个batch的明文text转成id
         :param batch_text:
         :return:
         """
+        tokenize_time = time.time()
         src_ids = []
         position_ids = []
         task_ids = []
         sentence_ids = []
-        for text in batch_text:
+        if self.field_config.need_convert and self.token_cache:
+            batch_ids = [self.token_cache.encode(text) for text in batch_text]
+        elif self.field_config.need_convert:
+            # 整批分词，tokenizer可以复用同一批里重复的词、一次调用sentencepiece
+            batch_ids = self.tokenizer.encode_texts(batch_text)
+        for index, text in enumerate(batch_text):
             if self.field_config.need_convert:
-                tokens_text = self.tokenizer.tokenize(text)
+                ids_text = batch_ids[index]
                 # 加上截断策略
-                if len(tokens_text) > self.field_config.max_seq_len - 2:
-                    tokens_text = truncation_words(tokens_text, self.field_config.max_seq_len - 2,
-                                                   self.field_config.truncation_type)
-                tokens = []
-                tokens.append("[CLS]")
-                for token in tokens_text:
-                    tokens.append(token)
-                tokens.append("[SEP]")
-                src_id = self.tokenizer.convert_tokens_to_ids(tokens)
+                if len(ids_text) > self.field_config.max_seq_len - 2:
+                    ids_text = truncation_words(ids_text, self.field_config.max_seq_len - 2,
+                                                self.field_config.truncation_type)
+                src_id = [self.tokenizer.covert_token_to_id("[CLS]")] + ids_text + \
+                         [self.tokenizer.covert_token_to_id("[SEP]")]
             else:
                 if isinstance(text, str):
                     src_id = text.split(" ")
@@ -124,6 +149,7 @@ class ErnieTextFieldReader(BaseFieldReader):
             task_ids.append(task_id)
             sentence_ids.append(sentence_id)
 
+        pad_time = time.time()
         return_list = []
         padded_ids, input_mask, batch_seq_lens = pad_batch_data(src_ids,
                                                                 pad_idx=self.field_config.padding_id,
@@ -140,6 +166,10 @@ class ErnieTextFieldReader(BaseFieldReader):
         return_list.append(task_ids_batch)  # append task_ids
         return_list.append(batch_seq_lens)  # append seq_lens
 
+        if self.profiler is not None:
+            self.profiler.observe("tokenize", pad_time - tokenize_time)
+            self.profiler.observe("pad", time.time() - pad_time)
+            self.profiler.add_tokens(sum(len(src_id) for src_id in src_ids))
         return return_list
 
     def structure_fields_dict(self, fields_id, start_index, need_emb=True):
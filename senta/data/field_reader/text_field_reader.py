@@ -3,6 +3,8 @@
 :py:class:`TextFieldReader`
 
 """
+import time
+
 from senta.common.register import RegisterSet
 from senta.common.rule import DataShape, FieldLength, InstanceName
 from senta.data.field_reader.base_field_reader import BaseFieldReader
@@ -54,24 +56,36 @@ class TextFieldReader(BaseFieldReader):
 
         return shape, types, levels
 
+    def token_lengths(self, batch_text):
+        """
+        :param batch_text: 一组明文
+        :return: 每条明文截断之后的token数
+        """
+        if self.field_config.need_convert:
+            nums = [len(tokens) for tokens in self.tokenizer.tokenize_batch(batch_text)]
+        else:
+            nums = [len(text.split(" ")) for text in batch_text]
+        return [min(num, self.field_config.max_seq_len) for num in nums]
+
     def convert_texts_to_ids(self, batch_text):
         """将一个batch的明文text转成id
         :param batch_text:
         :return:
         """
+        tokenize_time = time.time()
         src_ids = []
-        for text in batch_text:
-            if self.field_config.need_convert:
-                tokens = self.tokenizer.tokenize(text)
-                src_id = self.tokenizer.convert_tokens_to_ids(tokens)
-            else:
-                src_id = text.split(" ")
+        if self.field_config.need_convert:
+            text_ids = self.tokenizer.encode_texts(batch_text)
+        else:
+            text_ids = [text.split(" ") for text in batch_text]
+        for src_id in text_ids:
 
             # 加上截断策略
             if len(src_id) > self.field_config.max_seq_len:
                 src_id = truncation_words(src_id, self.field_config.max_seq_len, self.field_config.truncation_type)
             src_ids.append(src_id)
 
+        pad_time = time.time()
         return_list = []
         padded_ids, batch_seq_lens = pad_batch_data(src_ids,
                                                     pad_idx=self.field_config.padding_id,
@@ -80,6 +94,10 @@ class TextFieldReader(BaseFieldReader):
         return_list.append(padded_ids)
         return_list.append(batch_seq_lens)
 
+        if self.profiler is not None:
+            self.profiler.observe("tokenize", pad_time - tokenize_time)
+            self.profiler.observe("pad", time.time() - pad_time)
+            self.profiler.add_tokens(sum(len(src_id) for src_id in src_ids))
         return return_list
 
     def structure_fields_dict(self, fields_id, start_index, need_emb=True):
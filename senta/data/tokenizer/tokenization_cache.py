@@ -0,0 +1,37 @@
+# -*- coding: utf-8 -*
+"""
+:py:class:`TokenizationCache`
+"""
+from senta.utils.lru_cache import LRUCache
+
+
+class TokenizationCache(object):
+    """TokenizationCache: 明文到token id的LRU缓存，重复出现的文本不再走纯python的分词逻辑。
+    缓存的是tokenize + convert_tokens_to_ids的结果，不含[CLS]/[SEP]，也没有截断，所以同一个tokenizer下
+    单句、句子对等不同的拼接方式可以共用一份缓存。
+    """
+
+    def __init__(self, tokenizer, capacity=100000):
+        """
+        :param tokenizer: 绑定的tokenizer，不同词表的tokenizer不能共用一个cache
+        :param capacity: 最多缓存的文本条数
+        """
+        self.tokenizer = tokenizer
+        self.cache = LRUCache(capacity)
+
+    def encode(self, text):
+        """
+        :param text: 明文
+        :return: token id的list，调用方可以随意修改
+        """
+        ids = self.cache.get(text)
+        if ids is None:
+            ids = tuple(self.tokenizer.convert_tokens_to_ids(self.tokenizer.tokenize(text)))
+            self.cache.put(text, ids)
+        return list(ids)
+
+    def stats(self):
+        """
+        :return: 命中率等统计，见LRUCache.stats
+        """
+        return self.cache.stats()
@@ -0,0 +1,125 @@
+# -*- coding: utf-8 -*
+"""
+:py:class:`CharTable`
+"""
+import threading
+import unicodedata
+
+import six
+
+from senta.utils.util_helper import is_control, is_whitespace, is_punctuation
+
+# 按字处理和按词处理结果可能不同的字符替换成它，str.translate之后出现它就退回BasicTokenizer原来的逐步处理。
+# \x00本身会被删掉，替换结果里不会出现
+FALLBACK = u"\x00"
+
+# 希腊文大写Σ转小写时，在词尾是ς，其他位置是σ，要看上下文
+FINAL_SIGMA = u"Σ"
+
+
+def is_chinese_char(cp):
+    """Checks whether CP is the codepoint of a CJK character."""
+    # This defines a "chinese character" as anything in the CJK Unicode block:
+    #     https://en.wikipedia.org/wiki/CJK_Unified_Ideographs_(Unicode_block)
+    #
+    # Note that the CJK Unicode block is NOT all Japanese and Korean characters,
+    # despite its name. The modern Korean Hangul alphabet is a different block,
+    # as is Japanese Hiragana and Katakana. Those alphabets are used to write
+    # space-separated words, so they are not treated specially and handled
+    # like the all of the other languages.
+    if ((cp >= 0x4E00 and cp <= 0x9FFF) or  #
+            (cp >= 0x3400 and cp <= 0x4DBF) or  #
+            (cp >= 0x20000 and cp <= 0x2A6DF) or  #
+            (cp >= 0x2A700 and cp <= 0x2B73F) or  #
+            (cp >= 0x2B740 and cp <= 0x2B81F) or  #
+            (cp >= 0x2B820 and cp <= 0x2CEAF) or
+            (cp >= 0xF900 and cp <= 0xFAFF) or  #
+            (cp >= 0x2F800 and cp <= 0x2FA1F)):  #
+        return True
+
+    return False
+
+
+class CharTable(dict):
+    """CharTable: BasicTokenizer一次遍历的归一化表，codepoint -> 替换串，直接传给str.translate：
+        要删掉的字符（\\x00、\\ufffd、控制字符） -> None
+        空白 -> " "
+        汉字、标点 -> 两边加空格的自身
+        其他字符 -> 小写、NFD、去掉Mn之后的结果（do_lower_case为False时是自身）
+    translate之后按空白切开，就是_clean_text、_tokenize_chinese_chars、小写去重音、_run_split_on_punc
+    逐步处理的结果。每个字符第一次出现时才分类，之后查表，不再逐字调用unicodedata.category
+    """
+
+    def __init__(self, do_lower_case=True):
+        """
+        :param do_lower_case: 与BasicTokenizer的do_lower_case相同
+        """
+        super(CharTable, self).__init__()
+        self.do_lower_case = do_lower_case
+
+    def __missing__(self, cp):
+        """str.translate查不到的字符在这里分类，结果记到表里"""
+        replacement = self.classify(six.unichr(cp))
+        self[cp] = replacement
+        return replacement
+
+    def normalize(self, char):
+        """
+        :return: (小写、NFD之后的串, 再去掉Mn之后的串)
+        """
+        if not self.do_lower_case:
+            return char, char
+        decomposed = unicodedata.normalize("NFD", char.lower())
+        return decomposed, u"".join(c for c in decomposed if unicodedata.category(c) != "Mn")
+
+    def classify(self, char):
+        """
+        :param char: 一个字符
+        :return: 替换串，None表示删掉，FALLBACK表示这个字符不能按字处理
+        """
+        cp = ord(char)
+        if cp == 0 or cp == 0xfffd or is_control(char):
+            return None
+        # \u2028等不是Zs，_clean_text会保留，whitespace_tokenize也会在这里切开
+        if is_whitespace(char) or char.isspace():
+            return u" "
+        decomposed, normalized = self.normalize(char)
+        if is_chinese_char(cp) or is_punctuation(char):
+            # 兼容区汉字、希腊文问号等NFD会变成别的字符，按词处理时可能和前后粘在一起
+            return u" %s " % char if normalized == char else FALLBACK
+        if self.do_lower_case and char == FINAL_SIGMA:
+            return FALLBACK
+        for c in normalized:
+            if is_punctuation(c) or c.isspace():
+                return FALLBACK
+        for c in decomposed:
+            # 不是Mn的组合字符会被NFD跨字符重排序，按字处理顺序可能不同
+            if unicodedata.combining(c) and unicodedata.category(c) != "Mn":
+                return FALLBACK
+        return normalized
+
+    def tokenize(self, text):
+        """
+        :param text: unicode明文
+        :return: token的list，text里有不能按字处理的字符时返回None
+        """
+        text = text.translate(self)
+        if FALLBACK in text:
+            return None
+        return text.split()
+
+
+_char_tables = {}
+_char_tables_lock = threading.Lock()
+
+
+def get_char_table(do_lower_case=True):
+    """同一个do_lower_case的BasicTokenizer共用一张表，进程内只分类一次
+    :param do_lower_case:
+    :return: CharTable
+    """
+    key = bool(do_lower_case)
+    with _char_tables_lock:
+        if key not in _char_tables:
+            _char_tables[key] = CharTable(key)
+        return _char_tables[key]
@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*
+"""
+:py:class:`VocabTrie`
+"""
+
+# 结点里标记"到这里是一个完整的词"的key，值是这个词本身。单个字符不会是空串，不会和子结点冲突
+TERMINAL = ""
+
+
+class VocabTrie(object):
+    """VocabTrie: 词表的字符前缀树，每个结点是字符 -> 子结点的dict。WordPiece/SentencePiece的贪心最长匹配
+    从起点往后逐字符走一遍就能找到最长的词，不用对每个候选的结束位置都拼一次子串再查词表
+    """
+
+    def __init__(self, tokens):
+        """
+        :param tokens: 词表里的词，如Vocabulary.vocab_dict
+        """
+        self.root = {}
+        for token in tokens:
+            self.add(token)
+
+    def add(self, token):
+        """
+        :param token: 非空的词
+        :return:
+        """
+        node = self.root
+        for char in token:
+            child = node.get(char)
+            if child is None:
+                child = node[char] = {}
+            node = child
+        node[TERMINAL] = token
+
+    def subtrie(self, prefix):
+        """
+        :param prefix: 如"##"、u"▁"
+        :return: 以prefix开头的词组成的子树，从这里往下匹配相当于给子串加上prefix再查词表；没有这样的词时返回空dict
+        """
+        node = self.root
+        for char in prefix:
+            node = node.get(char)
+            if node is None:
+                return {}
+        return node
+
+    def split(self, word, first_node, rest_node):
+        """贪心最长匹配，结果与逐个缩短子串查词表相同
+        :param word: 一个词，不含空白
+        :param first_node: 匹配第一片用的子树
+        :param rest_node: 匹配之后各片用的子树
+        :return: 切分出的词的list，有一处匹配不上时返回None
+        """
+        sub_tokens = []
+        start = 0
+        length = len(word)
+        node = first_node
+        while start < length:
+            matched = None
+            end = start
+            i = start
+            while i < length:
+                node = node.get(word[i])
+                if node is None:
+                    break
+                i += 1
+                token = node.get(TERMINAL)
+                if token is not None:
+                    matched = token
+                    end = i
+            if matched is None:
+                return None
+            sub_tokens.append(matched)
+            start = end
+            node = rest_node
+        return sub_tokens
+
+
+def build_vocab_trie(vocabulary):
+    """给Vocabulary.get_index用，同一份词表的tokenizer共用一棵前缀树
+    :param vocabulary: senta.data.vocabulary.Vocabulary
+    :return: VocabTrie
+    """
+    return VocabTrie(vocabulary.vocab_dict)
@@ -19,15 +19,20 @@ from __future__ import division
 from __future__ import print_function
 
 import collections
+import heapq
+import itertools
 import json
 import unicodedata
 from functools import lru_cache
 
+import numpy as np
 # import re
 import regex as re
 import six
 from six.moves import range
 
+from senta.utils.lru_cache import LRUCache
+
 
 def load_vocab(vocab_file):
     """Loads a vocabulary file into a dictionary."""
@@ -114,6 +119,40 @@ def whitespace_tokenize(text):
     return tokens
 
 
+def pack_ids(id_lists, return_lengths=False, return_offsets=False):
+    """把每条文本的id拼成一维数组，encode_batch的返回格式
+    :param id_lists: 每条文本的id list
+    :param return_lengths: 同时返回每条文本的id数
+    :param return_offsets: 同时返回每条文本在ids里的起点，长度是文本数+1，第i条是ids[offsets[i]: offsets[i + 1]]
+    :return: ids，或者[ids, lengths, offsets]中要求返回的那几项，都是int64的一维数组
+    """
+    lengths = np.fromiter((len(ids) for ids in id_lists), dtype="int64", count=len(id_lists))
+    ids = np.fromiter(itertools.chain.from_iterable(id_lists), dtype="int64", count=int(lengths.sum()))
+    return_list = [ids]
+    if return_lengths:
+        return_list.append(lengths)
+    if return_offsets:
+        offsets = np.zeros([len(id_lists) + 1], dtype="int64")
+        np.cumsum(lengths, out=offsets[1:])
+        return_list.append(offsets)
+    return return_list if len(return_list) > 1 else return_list[0]
+
+
+def sentencepiece_encode(sp_model, texts, out_type=str):
+    """一次编码一组文本，sentencepiece>=0.1.91的Encode支持list输入，在C++里逐条处理；老版本逐条调用
+    :param sp_model: SentencePieceProcessor
+    :param texts: 文本list
+    :param out_type: str返回piece，int返回id
+    :return: 每条文本的piece或id的list
+    """
+    try:
+        return sp_model.Encode(list(texts), out_type=out_type)
+    except (AttributeError, TypeError):
+        if out_type is int:
+            return [sp_model.EncodeAsIds(text) for text in texts]
+        return [sp_model.EncodeAsPieces(text) for text in texts]
+
+
 def _is_whitespace(char):
     """Checks whether `chars` is a whitespace character."""
     # \t, \n, and \r are technically control characters but we treat them
@@ -174,6 +213,18 @@ class PreTrainedFullTokenizer(object):
         """ convert_ids_to_tokens interface"""
         raise NotImplementedError
 
+    def tokenize_batch(self, texts):
+        """ tokenize a list of texts"""
+        return [self.tokenize(text) for text in texts]
+
+    def encode_texts(self, texts):
+        """ ids of a list of texts, one list per text"""
+        return [self.convert_tokens_to_ids(tokens) for tokens in self.tokenize_batch(texts)]
+
+    def encode_batch(self, texts, return_lengths=False, return_offsets=False):
+        """ flat ids of a list of texts, see pack_ids"""
+        return pack_ids(self.encode_texts(texts), return_lengths, return_offsets)
+
 
 class PreTrainedBasicTokenizer(object):
     """base BasicTokenizer class """
@@ -391,11 +442,13 @@ def get_pairs(word):
 class BpeEncoder(object):
     """BpeEncoder"""
 
-    def __init__(self, encoder_json_file, vocab_bpe_file, errors='replace'):
+    def __init__(self, encoder_json_file, vocab_bpe_file, errors='replace', cache_capacity=100000):
         """Constructs a BpeEncoder.
         Args:
             encoder_json_file:
             vocab_bpe_file:
+            cache_capacity: max number of words whose bpe result is cached, the least recently used ones are
+                evicted so that a long running service does not grow on unique urls/hashtags.
         """
         self.encoder = self.__get_encoder(encoder_json_file)
         self.decoder = {v: k for k, v in self.encoder.items()}
@@ -403,7 +456,7 @@ class BpeEncoder(object):
         self.byte_encoder = bytes_to_unicode()
         self.byte_decoder = {v: k for k, v in self.byte_encoder.items()}
         self.bpe_ranks = self.__get_bpe_ranks(vocab_bpe_file)
-        self.cache = {}
+        self.cache = LRUCache(cache_capacity)
         self.pat = re.compile(r"""'s|'t|'re|'ve|'m|'ll|'d| ?\p{L}+| ?\p{N}+| ?[^\s\p{L}\p{N}]+|\s+(?!\S)|\s+""")
 
     def __get_encoder(self, encoder_json_file):
@@ -422,46 +475,75 @@ class BpeEncoder(object):
         """
         bpe
         """
-        if token in self.cache:
-            return self.cache[token]
-        word = tuple(token)
-        pairs = get_pairs(word)
-
-        if not pairs:
+        if len(token) < 2:
             return token
+        word = self.cache.get(token)
+        if word is not None:
+            return word
+        word = ' '.join(self.merge(token))
+        self.cache.put(token, word)
+        return word
 
-        while True:
-            bigram = min(pairs, key=lambda pair: self.bpe_ranks.get(pair, float('inf')))
-            if bigram not in self.bpe_ranks:
-                break
-            first, second = bigram
-            new_word = []
-            i = 0
-            while i < len(word):
-                try:
-                    j = word.index(first, i)
-                    new_word.extend(word[i:j])
-                    i = j
-                except:
-                    new_word.extend(word[i:])
-                    break
-
-                if word[i] == first and i < len(word) - 1 and word[i + 1] == second:
-                    new_word.append(first + second)
-                    i += 2
-                else:
-                    new_word.append(word[i])
-                    i += 1
-            new_word = tuple(new_word)
-            word = new_word
-            if len(word) == 1:
-                break
-            else:
-                pairs = get_pairs(word)
-        word = ' '.join(word)
-        self.cache[token] = word
+    def merge(self, token):
+        """
+        Applies the merges to a word with a heap of adjacent pairs keyed by (rank, position), instead of
+        rescanning every pair with min() after each merge. All occurrences of the lowest ranked pair are merged
+        left to right before the pairs they create are considered, same as the rescanning loop.
+        Args:
+            token: byte encoded word, at least 2 symbols
+        Returns:
+            the merged symbols in order
+        """
+        symbols = list(token)
+        size = len(symbols)
+        next_index = list(range(1, size)) + [-1]
+        prev_index = list(range(-1, size - 1))
+        ranks = self.bpe_ranks
+        heap = []
+        for i in range(size - 1):
+            rank = ranks.get((symbols[i], symbols[i + 1]))
+            if rank is not None:
+                heap.append((rank, i, symbols[i], symbols[i + 1]))
+        heapq.heapify(heap)
+
+        while heap:
+            rank = heap[0][0]
+            new_pairs = []
+            # a merge never recreates the pair being merged, so no entry with this rank is added during the round
+            while heap and heap[0][0] == rank:
+                _, i, first, second = heapq.heappop(heap)
+                j = next_index[i]
+                # stale entry: one side was merged since it was pushed
+                if symbols[i] != first or j == -1 or symbols[j] != second:
+                    continue
+                symbols[i] = first + second
+                symbols[j] = None
+                next_index[i] = next_index[j]
+                if next_index[j] != -1:
+                    prev_index[next_index[j]] = i
+                if prev_index[i] != -1:
+                    new_pairs.append((symbols[prev_index[i]], symbols[i], prev_index[i]))
+                if next_index[i] != -1:
+                    new_pairs.append((symbols[i], symbols[next_index[i]], i))
+            for first, second, i in new_pairs:
+                pair_rank = ranks.get((first, second))
+                if pair_rank is not None:
+                    heapq.heappush(heap, (pair_rank, i, first, second))
+
+        word = []
+        i = 0
+        while i != -1:
+            word.append(symbols[i])
+            i = next_index[i]
         return word
 
+    def cache_stats(self):
+        """
+        Returns:
+            size, hits, misses, evictions and hit_rate of the bpe cache
+        """
+        return self.cache.stats()
+
     def encode(self, text):
         """
         encode
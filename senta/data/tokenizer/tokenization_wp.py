@@ -30,7 +30,9 @@ from senta.utils.util_helper import convert_to_unicode, whitespace_tokenize, is_
 
 import sentencepiece as sp
 
-from .tokenization_utils import BpeEncoder, convert_by_vocab
+from .tokenization_chars import get_char_table, is_chinese_char
+from .tokenization_trie import build_vocab_trie
+from .tokenization_utils import BpeEncoder, convert_by_vocab, sentencepiece_encode
 
 
 @RegisterSet.tokenizer.register
@@ -46,7 +48,9 @@ class GptBpeTokenizer(Tokenizer):
         vocab_bpe_file = params.get("bpe_vocab_file", False)
         encoder_json_file = params.get("bpe_json_file", False)
 
-        self.gptbpe_tokenizer = BpeEncoder(encoder_json_file, vocab_bpe_file)
+        # 缓存的词数有上限，长时间运行的服务遇到大量只出现一次的url、话题标签时内存不会一直增长
+        self.gptbpe_tokenizer = BpeEncoder(encoder_json_file, vocab_bpe_file,
+                                           cache_capacity=params.get("bpe_cache_size", 100000))
 
     def tokenize(self, text):
         """
@@ -54,17 +58,43 @@ class GptBpeTokenizer(Tokenizer):
         """
         return [str(token) for token in self.gptbpe_tokenizer.encode(text)]
 
+    def encode_texts(self, texts):
+        """
+        encode_texts: 同一批里重复的词只做一次byte编码、bpe和查词表
+        """
+        encoder = self.gptbpe_tokenizer
+        memo = {}
+        output = []
+        for text in texts:
+            ids = []
+            for word in encoder.pat.findall(text):
+                word_ids = memo.get(word)
+                if word_ids is None:
+                    token = ''.join(encoder.byte_encoder[b] for b in word.encode('utf-8'))
+                    word_ids = self.convert_tokens_to_ids([str(encoder.encoder[bpe_token])
+                                                           for bpe_token in encoder.bpe(token).split(' ')])
+                    memo[word] = word_ids
+                ids.extend(word_ids)
+            output.append(ids)
+        return output
+
     def convert_tokens_to_ids(self, tokens):
         """
         convert_tokens_to_ids
         """
         return convert_by_vocab(self.vocabulary.vocab_dict, tokens)
 
+    def cache_stats(self):
+        """
+        :return: bpe缓存的大小、命中率等，见LRUCache.stats
+        """
+        return self.gptbpe_tokenizer.cache_stats()
+
     def convert_ids_to_tokens(self, ids):
         """
         convert_ids_to_tokens
         """
-        return convert_by_vocab(self.vocabulary.id_dict, ids)
+        return convert_by_vocab(self.vocabulary.id_table, ids)
 
 
 @RegisterSet.tokenizer.register
@@ -92,6 +122,40 @@ class FullTokenizer(Tokenizer):
 
         return split_tokens
 
+    def tokenize_batch(self, texts):
+        """同一批里重复的词只做一次wordpiece切分
+        :param texts:
+        :return:
+        """
+        memo = {}
+        output = []
+        for text in texts:
+            split_tokens = []
+            for token in self.basic_tokenizer.tokenize(text):
+                sub_tokens = memo.get(token)
+                if sub_tokens is None:
+                    sub_tokens = memo[token] = self.wordpiece_tokenizer.tokenize(token)
+                split_tokens.extend(sub_tokens)
+            output.append(split_tokens)
+        return output
+
+    def encode_texts(self, texts):
+        """同一批里重复的词只做一次wordpiece切分和查词表，不生成中间的token list
+        :param texts:
+        :return:
+        """
+        memo = {}
+        output = []
+        for text in texts:
+            ids = []
+            for token in self.basic_tokenizer.tokenize(text):
+                token_ids = memo.get(token)
+                if token_ids is None:
+                    token_ids = memo[token] = self.convert_tokens_to_ids(self.wordpiece_tokenizer.tokenize(token))
+                ids.extend(token_ids)
+            output.append(ids)
+        return output
+
     def convert_tokens_to_ids(self, tokens):
         """
         :param tokens:
@@ -116,10 +180,18 @@ class BasicTokenizer(Tokenizer):
         self.do_lower_case = True
         if params:
             self.do_lower_case = params.get("do_lower_case", True)
+        self.char_table = get_char_table(self.do_lower_case)
 
     def tokenize(self, text):
         """Tokenizes a piece of text."""
         text = convert_to_unicode(text)
+        tokens = self.char_table.tokenize(text)
+        if tokens is None:
+            tokens = self._tokenize_by_steps(text)
+        return tokens
+
+    def _tokenize_by_steps(self, text):
+        """逐步清洗、切分，与char_table一次遍历的结果相同，text里有char_table不能按字处理的字符时才用"""
         text = self._clean_text(text)
 
         # This was added on November 1st, 2018 for the multilingual and Chinese
@@ -201,25 +273,7 @@ class BasicTokenizer(Tokenizer):
 
     def _is_chinese_char(self, cp):
         """Checks whether CP is the codepoint of a CJK character."""
-        # This defines a "chinese character" as anything in the CJK Unicode block:
-        #     https://en.wikipedia.org/wiki/CJK_Unified_Ideographs_(Unicode_block)
-        #
-        # Note that the CJK Unicode block is NOT all Japanese and Korean characters,
-        # despite its name. The modern Korean Hangul alphabet is a different block,
-        # as is Japanese Hiragana and Katakana. Those alphabets are used to write
-        # space-separated words, so they are not treated specially and handled
-        # like the all of the other languages.
-        if ((cp >= 0x4E00 and cp <= 0x9FFF) or  #
-                (cp >= 0x3400 and cp <= 0x4DBF) or  #
-                (cp >= 0x20000 and cp <= 0x2A6DF) or  #
-                (cp >= 0x2A700 and cp <= 0x2B73F) or  #
-                (cp >= 0x2B740 and cp <= 0x2B81F) or  #
-                (cp >= 0x2B820 and cp <= 0x2CEAF) or
-                (cp >= 0xF900 and cp <= 0xFAFF) or  #
-                (cp >= 0x2F800 and cp <= 0x2FA1F)):  #
-            return True
-
-        return False
+        return is_chinese_char(cp)
 
     def _clean_text(self, text):
         """Performs invalid character removal and whitespace cleanup on text."""
@@ -244,6 +298,15 @@ class WordPieceTokenizer(Tokenizer):
         self.max_input_chars_per_word = 100
         if params:
             self.max_input_chars_per_word = params.get("max_input_chars_per_word", 100)
+        self.build_trie()
+
+    def build_trie(self):
+        """建词表的前缀树，第一片直接匹配，之后的片要带"##"前缀
+        :return:
+        """
+        self.trie = self.vocabulary.get_index("trie", build_vocab_trie)
+        self.first_node = self.trie.root
+        self.rest_node = self.trie.subtrie("##")
 
     def tokenize(self, text):
         """Tokenizes a piece of text into its word pieces.
@@ -267,32 +330,12 @@ class WordPieceTokenizer(Tokenizer):
 
         output_tokens = []
         for token in whitespace_tokenize(text):
-            chars = list(token)
-            if len(chars) > self.max_input_chars_per_word:
+            if len(token) > self.max_input_chars_per_word:
                 output_tokens.append(self.unk_token)
                 continue
 
-            is_bad = False
-            start = 0
-            sub_tokens = []
-            while start < len(chars):
-                end = len(chars)
-                cur_substr = None
-                while start < end:
-                    substr = "".join(chars[start:end])
-                    if start > 0:
-                        substr = "##" + substr
-                    if substr in self.vocabulary.vocab_dict:
-                        cur_substr = substr
-                        break
-                    end -= 1
-                if cur_substr is None:
-                    is_bad = True
-                    break
-                sub_tokens.append(cur_substr)
-                start = end
-
-            if is_bad:
+            sub_tokens = self.trie.split(token, self.first_node, self.rest_node)
+            if sub_tokens is None:
                 output_tokens.append(self.unk_token)
             else:
                 output_tokens.extend(sub_tokens)
@@ -317,43 +360,13 @@ class WordPieceTokenizer(Tokenizer):
 class SentencePieceTokenizer(WordPieceTokenizer):
     """tokenize"""
 
-    def tokenize(self, text):
-        """
-        :param text:
+    def build_trie(self):
+        """建词表的前缀树，第一片要带u"\u2581"前缀，之后的片直接匹配
         :return:
         """
-        text = convert_to_unicode(text)
-        output_tokens = []
-        for token in whitespace_tokenize(text):
-            chars = list(token)
-            if len(chars) > self.max_input_chars_per_word:
-                output_tokens.append(self.unk_token)
-                continue
-            is_bad = False
-            start = 0
-            sub_tokens = []
-            while start < len(chars):
-                end = len(chars)
-                cur_substr = None
-                while start < end:
-                    substr = "".join(chars[start:end])
-                    if start == 0:
-                        substr = u'\u2581' + substr
-                    if substr in self.vocabulary.vocab_dict:
-                        cur_substr = substr
-                        break
-                    end -= 1
-                if cur_substr is None:
-                    is_bad = True
-                    break
-                sub_tokens.append(cur_substr)
-                start = end
-
-            if is_bad:
-                output_tokens.append(self.unk_token)
-            else:
-                output_tokens.extend(sub_tokens)
-        return output_tokens
+        self.trie = self.vocabulary.get_index("trie", build_vocab_trie)
+        self.first_node = self.trie.subtrie(u'\u2581')
+        self.rest_node = self.trie.root
 
 
 @RegisterSet.tokenizer.register
@@ -412,16 +425,47 @@ class WordsegTokenizer(Tokenizer):
         text = convert_to_unicode(text)
 
         output_tokens = []
-        for token in text.split(self.split_token):
-            if token in self.vocab:
+        vocab_dict = self.vocabulary.vocab_dict
+        for token in text.split(self.split_char):
+            if token in vocab_dict:
                 output_tokens.append(token)
             else:
                 sp_tokens = self.tokenizer.EncodeAsPieces(token)
                 for sp_token in sp_tokens:
-                    if sp_token in self.vocab:
+                    if sp_token in vocab_dict:
                         output_tokens.append(sp_token)
         return output_tokens
 
+    def tokenize_batch(self, texts):
+        """一批文本里不在词表中的词去重之后一次交给sentencepiece切分
+
+        Returns:
+            A list of wordpiece tokens for each text.
+        """
+        vocab_dict = self.vocabulary.vocab_dict
+        split_texts = []
+        oov_words = {}
+        for text in texts:
+            text = text.lower() if self.do_lower_case else text
+            words = convert_to_unicode(text).split(self.split_char)
+            split_texts.append(words)
+            for word in words:
+                if word not in vocab_dict:
+                    oov_words[word] = None
+        oov_words = list(oov_words)
+        oov_pieces = dict(zip(oov_words, sentencepiece_encode(self.tokenizer, oov_words)))
+
+        output = []
+        for words in split_texts:
+            output_tokens = []
+            for word in words:
+                if word in vocab_dict:
+                    output_tokens.append(word)
+                else:
+                    output_tokens.extend(sp_token for sp_token in oov_pieces[word] if sp_token in vocab_dict)
+            output.append(output_tokens)
+        return output
+
     def convert_tokens_to_ids(self, tokens):
         """convert tokens to ids"""
         return self.vocabulary.convert_tokens_to_ids(tokens)
@@ -458,13 +502,31 @@ class SentencepieceTokenizerErnie(Tokenizer):
             if token == self.sp_unk_token:
                 token = self.unk_token
 
-            if token in self.vocab:
+            if token in self.vocabulary.vocab_dict:
                 output_tokens.append(token)
             else:
                 output_tokens.append(self.unk_token)
 
         return output_tokens
 
+    def preprocess(self, text):
+        """tokenize之前的小写和\1替换"""
+        text = text.lower() if self.do_lower_case else text
+        return convert_to_unicode(text.replace("\1", " "))
+
+    def encode_texts(self, texts):
+        """一次交给sentencepiece切整批文本，再按piece查词表，与tokenize + convert_tokens_to_ids的结果相同。
+        不能用EncodeAsIds：模型外的字符（如生僻字）的id是unk，但它的piece是字符本身，可能在词表里
+
+        Returns:
+            A list of ids for each text.
+        """
+        vocab_dict = self.vocabulary.vocab_dict
+        unk_id = self.vocabulary.covert_token_to_id(self.unk_token)
+        pieces = sentencepiece_encode(self.tokenizer, [self.preprocess(text) for text in texts], out_type=str)
+        return [[unk_id if piece == self.sp_unk_token else vocab_dict.get(piece, unk_id) for piece in text_pieces]
+                for text_pieces in pieces]
+
     def convert_tokens_to_ids(self, tokens):
         """convert tokens to ids"""
         return self.vocabulary.convert_tokens_to_ids(tokens)
@@ -518,6 +580,14 @@ class WSSPTokenizer(Tokenizer):
         ret = self.sp_model.EncodeAsPieces(sen)
         return ret
 
+    def tokenize_batch(self, sens):
+        """切词之后一次交给sentencepiece编码整批文本
+        :param sens:
+        :return:
+        """
+        joined = [' '.join(s.lower() for s in self.cut(sen) if s != ' ') for sen in sens]
+        return sentencepiece_encode(self.sp_model, joined)
+
     def convert_tokens_to_ids(self, tokens):
         """
         :param tokens:
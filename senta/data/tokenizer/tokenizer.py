@@ -3,7 +3,8 @@
 :py:class:`Tokenizer`
 """
 from senta.common.register import RegisterSet
-from senta.data.vocabulary import Vocabulary
+from senta.data.tokenizer.tokenization_utils import pack_ids
+from senta.data.vocabulary import get_vocabulary
 
 
 @RegisterSet.tokenizer.register
@@ -17,7 +18,7 @@ class Tokenizer(object):
         :param unk_token: unk 对应的token，默认是[UNK]
         :param params: 个别tokenizer自己用到的额外参数，dict类型
         """
-        self.vocabulary = Vocabulary(vocab_file, unk_token)
+        self.vocabulary = get_vocabulary(vocab_file, unk_token)
         self.split_char = split_char
         self.unk_token = unk_token
         self.params = params
@@ -44,6 +45,29 @@ class Tokenizer(object):
         """
         raise NotImplementedError
 
+    def tokenize_batch(self, texts):
+        """一次切分一组文本，子类可以覆盖成批量的实现
+        :param texts: 明文list
+        :return: 每条文本的tokens
+        """
+        return [self.tokenize(text) for text in texts]
+
+    def encode_texts(self, texts):
+        """一次把一组文本转成id，子类可以覆盖成批量的实现，结果与逐条tokenize + convert_tokens_to_ids相同
+        :param texts: 明文list
+        :return: 每条文本的id list，不含[CLS]/[SEP]
+        """
+        return [self.convert_tokens_to_ids(tokens) for tokens in self.tokenize_batch(texts)]
+
+    def encode_batch(self, texts, return_lengths=False, return_offsets=False):
+        """
+        :param texts: 明文list
+        :param return_lengths: 同时返回每条文本的id数
+        :param return_offsets: 同时返回每条文本在ids里的起点
+        :return: 所有文本的id拼成的一维数组，以及要求返回的lengths、offsets，见pack_ids
+        """
+        return pack_ids(self.encode_texts(texts), return_lengths, return_offsets)
+
     def covert_id_to_token(self, id):
         """
         :param id:
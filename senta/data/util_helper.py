@@ -2,12 +2,15 @@
 """
 :py:`util_helper`
 """
+import itertools
+
 import numpy as np
 import paddle
 
 from senta.common.rule import InstanceName, FieldLength
+from senta.data.batch_assembler import BatchAssembler
 from senta.data.field import Field
-from senta.utils.util_helper import truncation_words
+from senta.utils.util_helper import truncation_words, truncate_seq_pair
 
 
 def convert_text_to_id(text, field_config):
@@ -105,38 +108,34 @@ def pad_batch_data(insts,
     corresponding position data and attention bias.
     """
     return_list = []
-    max_len = max(len(inst) for inst in insts)
+    seq_lens = np.array([len(inst) for inst in insts], dtype="int64")
+    max_len = int(seq_lens.max())
+    # mask[i, j]表示第i条的第j个位置是不是真实token，下面都用它一次性填充，不再逐条拼python list
+    mask = np.arange(max_len) < seq_lens[:, None]
     # Any token included in dict can be used to pad, since the paddings' loss
     # will be masked out by weights and make no effect on parameter gradients.
 
     # id
-    inst_data = np.array(
-        [inst + list([pad_idx] * (max_len - len(inst))) for inst in insts])
-    return_list += [inst_data.astype(insts_data_type).reshape([-1, max_len, 1])]
+    inst_data = np.full([len(insts), max_len], pad_idx, dtype=insts_data_type)
+    inst_data[mask] = np.array(list(itertools.chain.from_iterable(insts))).astype(insts_data_type)
+    return_list += [inst_data.reshape([-1, max_len, 1])]
 
     # position data
     if return_pos:
-        inst_pos = np.array([
-            list(range(0, len(inst))) + [pad_idx] * (max_len - len(inst))
-            for inst in insts
-        ])
-
-        return_list += [inst_pos.astype("int64").reshape([-1, max_len, 1])]
+        inst_pos = np.full([len(insts), max_len], pad_idx, dtype="int64")
+        np.copyto(inst_pos, np.arange(max_len, dtype="int64")[None, :], where=mask)
+        return_list += [inst_pos.reshape([-1, max_len, 1])]
 
     if return_input_mask:
         # This is used to avoid attention on paddings.
-        input_mask_data = np.array([[1] * len(inst) + [0] *
-                                    (max_len - len(inst)) for inst in insts])
-        input_mask_data = np.expand_dims(input_mask_data, axis=-1)
-        return_list += [input_mask_data.astype("float32")]
+        input_mask_data = np.expand_dims(mask.astype("float32"), axis=-1)
+        return_list += [input_mask_data]
 
     if return_max_len:
         return_list += [max_len]
 
     if return_num_token:
-        num_token = 0
-        for inst in insts:
-            num_token += len(inst)
+        num_token = int(seq_lens.sum())
         return_list += [num_token]
 
     if return_seq_lens:
@@ -144,8 +143,7 @@ def pad_batch_data(insts,
             seq_lens_type = [-1, 1]
         else:
             seq_lens_type = [-1]
-        seq_lens = np.array([len(inst) for inst in insts])
-        return_list += [seq_lens.astype("int64").reshape(seq_lens_type)]
+        return_list += [seq_lens.reshape(seq_lens_type)]
 
     return return_list if len(return_list) > 1 else return_list[0]
 
@@ -209,49 +207,95 @@ def generate_pad_batch_data(insts,
     return return_list if len(return_list) > 1 else return_list[0]
 
 
-def convert_texts_to_ids(batch_text_a, tokenizer=None, max_seq_len=512, truncation_type=0, padding_id=0):
+def convert_texts_to_src_ids(batch_text_a, tokenizer=None, max_seq_len=512, truncation_type=0, token_cache=None):
+    """将一个batch的明文text转成带[CLS]/[SEP]的id序列，不做padding
+    :param batch_text_a: 明文文本list
+    :param tokenizer: 分词器
+    :param max_seq_len: 最大长度（包含[CLS]和[SEP]）
+    :param truncation_type: 截断策略
+    :param token_cache: TokenizationCache，不为None时重复的文本直接从缓存中取id
+    :return: src_ids, list of list
+    """
     src_ids = []
-    position_ids = []
-    task_ids = []
-    sentence_ids = []
-
-    for text in batch_text_a:
-        tokens_text = tokenizer.tokenize(text)
+    if token_cache is not None:
+        batch_ids = [token_cache.encode(text) for text in batch_text_a]
+    else:
+        batch_ids = tokenizer.encode_texts(batch_text_a)
+    cls_id = tokenizer.covert_token_to_id("[CLS]")
+    sep_id = tokenizer.covert_token_to_id("[SEP]")
+    for ids_text in batch_ids:
         # 加上截断策略
-        if len(tokens_text) > max_seq_len - 2:
-            tokens_text = truncation_words(tokens_text, max_seq_len - 2, truncation_type)
-        tokens = []
-        tokens.append("[CLS]")
-        for token in tokens_text:
-            tokens.append(token)
-        tokens.append("[SEP]")
-        src_id = tokenizer.convert_tokens_to_ids(tokens)
-
-        src_ids.append(src_id)
-        pos_id = list(range(len(src_id)))
-        task_id = [0] * len(src_id)
-        sentence_id = [0] * len(src_id)
-        position_ids.append(pos_id)
-        task_ids.append(task_id)
-        sentence_ids.append(sentence_id)
+        if len(ids_text) > max_seq_len - 2:
+            ids_text = truncation_words(ids_text, max_seq_len - 2, truncation_type)
+        src_ids.append([cls_id] + ids_text + [sep_id])
+    return src_ids
+
+
+def pad_src_ids(src_ids, padding_id=0, sentence_ids=None):
+    """把一个batch的id序列padding成ernie的6个输入：src_ids, sent_ids, pos_ids, mask, task_ids, seq_lens，
+    需要在多个batch之间复用内存时直接用BatchAssembler
+    :param src_ids: list of list，已经加好[CLS]/[SEP]
+    :param padding_id: padding用的id
+    :param sentence_ids: list of list，句子对输入时的text_type_ids，为None时全部是0
+    :return: return_list，顺序与structure_fields_dict一致
+    """
+    return BatchAssembler(padding_id, reuse_buffers=False).assemble(src_ids, sentence_ids)
 
-    return_list = []
-    padded_ids, input_mask, batch_seq_lens = pad_batch_data(src_ids,
-                                                            pad_idx=padding_id,
-                                                            return_input_mask=True,
-                                                            return_seq_lens=True)
-    sent_ids_batch = pad_batch_data(sentence_ids, pad_idx=padding_id)
-    pos_ids_batch = pad_batch_data(position_ids, pad_idx=padding_id)
-    task_ids_batch = pad_batch_data(task_ids, pad_idx=padding_id)
-
-    return_list.append(padded_ids)  # append src_ids
-    return_list.append(sent_ids_batch)  # append sent_ids
-    return_list.append(pos_ids_batch)  # append pos_ids
-    return_list.append(input_mask)  # append mask
-    return_list.append(task_ids_batch)  # append task_ids
-    return_list.append(batch_seq_lens)  # append seq_lens
-
-    return return_list
+
+def convert_texts_to_ids(batch_text_a, tokenizer=None, max_seq_len=512, truncation_type=0, padding_id=0):
+    """将一个batch的明文text转成padding好的ernie输入
+    :return: return_list，见pad_src_ids
+    """
+    src_ids = convert_texts_to_src_ids(batch_text_a, tokenizer, max_seq_len, truncation_type)
+    return pad_src_ids(src_ids, padding_id=padding_id)
+
+
+def build_pair_src_ids(ids_a, ids_b, cls_id, sep_id, max_seq_len=512):
+    """用两段已经转好id的文本拼出句子对输入：[CLS] a [SEP] b [SEP]
+    :param ids_a: 第一段文本的id，不含[CLS]/[SEP]，不会被修改
+    :param ids_b: 第二段文本的id，不含[CLS]/[SEP]，不会被修改
+    :param cls_id: [CLS]的id
+    :param sep_id: [SEP]的id
+    :param max_seq_len: 最大长度，超长时每次从较长的一段末尾截掉一个id
+    :return: src_id, sentence_id
+    """
+    ids_a = list(ids_a)
+    ids_b = list(ids_b)
+    truncate_seq_pair(ids_a, ids_b, max_seq_len - 3)
+    src_id = [cls_id] + ids_a + [sep_id] + ids_b + [sep_id]
+    sentence_id = [0] * (len(ids_a) + 2) + [1] * (len(ids_b) + 1)
+    return src_id, sentence_id
+
+
+def split_batch_by_length(seq_lens, bucket_bounds=None, batch_size=None):
+    """按长度把样本分桶，每个桶内再按batch_size切分，减少padding带来的无效计算
+    :param seq_lens: 每个样本的长度
+    :param bucket_bounds: 升序的桶上界，如[32, 64, 128, 512]，超过最大上界的样本单独放在最后一个桶；
+                          为None时所有样本在同一个桶内
+    :param batch_size: 每个batch的最大样本数，为None时不切分
+    :return: list of list，每个元素是一个batch里样本在输入中的下标，桶内按原始顺序排列
+    """
+    bounds = sorted(bucket_bounds) if bucket_bounds else []
+    buckets = [[] for _ in range(len(bounds) + 1)]
+    for index, seq_len in enumerate(seq_lens):
+        bucket_id = len(bounds)
+        for i, bound in enumerate(bounds):
+            if seq_len <= bound:
+                bucket_id = i
+                break
+        buckets[bucket_id].append(index)
+
+    batches = []
+    for bucket in buckets:
+        if not bucket:
+            continue
+        if not batch_size:
+            batches.append(bucket)
+            continue
+        for start in range(0, len(bucket), batch_size):
+            batches.append(bucket[start: start + batch_size])
+
+    return batches
 
 
 def structure_fields_dict(fields_id, start_index, need_emb=True):
@@ -2,13 +2,19 @@
 """
 :py:class:`Vocabulary`
 """
-import collections
+import copy
+import logging
+import os
+import threading
+import time
 
 from senta.utils.util_helper import convert_to_unicode
 
 
 class Vocabulary(object):
-    """Vocabulary"""
+    """Vocabulary: token -> id是普通的dict，id -> token是按id下标的list，两者共用同一批token字符串。
+    同一个词表文件在进程内应该通过get_vocabulary获取，只解析一次
+    """
 
     def __init__(self, vocab_path, unk_token):
         """
@@ -20,31 +26,56 @@ class Vocabulary(object):
 
         self.vocab_path = vocab_path
         self.unk_token = unk_token
-        self.vocab_dict, self.id_dict = self.load_vocab()
-        self.vocab_size = len(self.id_dict)
+        self.vocab_dict, self.id_table = self.load_vocab()
+        self.vocab_size = len(self.id_table) - self.id_table.count(None)
+        # 由词表派生的索引（如WordPieceTokenizer的前缀树），同一份词表的Vocabulary共用，见get_index
+        self.indexes = {}
+        self.indexes_lock = threading.Lock()
 
     def load_vocab(self):
         """
+        :return: (token -> id的dict, id -> token的list，没有出现的id是None)
+        """
+        vocab_dict = {}
+        id_table = []
+        with open(self.vocab_path, encoding='utf-8') as file_vocab:
+            for num, line in enumerate(file_vocab):
+                items = convert_to_unicode(line.strip()).split("\t")
+                if len(items) > 2:
+                    break
+                token = items[0]
+                if len(items) == 2:
+                    index = int(items[1])
+                else:
+                    index = num
+                token = token.strip()
+
+                vocab_dict[token] = index
+                if index >= len(id_table):
+                    id_table.extend([None] * (index + 1 - len(id_table)))
+                id_table[index] = token
+
+        return vocab_dict, id_table
+
+    def with_unk_token(self, unk_token):
+        """
+        :param unk_token:
+        :return: 共用词表数据、只有unk_token不同的Vocabulary
+        """
+        vocabulary = copy.copy(self)
+        vocabulary.unk_token = unk_token
+        return vocabulary
+
+    def get_index(self, name, build_fn):
+        """取由词表派生的索引，第一次用到时调用build_fn生成，同一份词表的所有Vocabulary和tokenizer共用
+        :param name: 索引名
+        :param build_fn: build_fn(vocabulary)返回索引
         :return:
         """
-        vocab_dict = collections.OrderedDict()
-        id_dict = collections.OrderedDict()
-        file_vocab = open(self.vocab_path, encoding='utf-8')
-        for num, line in enumerate(file_vocab):
-            items = convert_to_unicode(line.strip()).split("\t")
-            if len(items) > 2:
-                break
-            token = items[0]
-            if len(items) == 2:
-                index = items[1]
-            else:
-                index = num
-            token = token.strip()
-
-            vocab_dict[token] = int(index)
-            id_dict[index] = token
-
-        return vocab_dict, id_dict
+        with self.indexes_lock:
+            if name not in self.indexes:
+                self.indexes[name] = build_fn(self)
+            return self.indexes[name]
 
     def add_reserve_id(self):
         """添加预留的一些id
@@ -68,23 +99,26 @@ class Vocabulary(object):
         :param ids:
         :return:
         """
-        output = []
-        for item in ids:
-            output.append(self.id_dict.get(item, self.unk_token))
-        return output
+        return [self.covert_id_to_token(item) for item in ids]
 
     def get_vocab_size(self):
         """获取词表大小
         :return:
         """
-        return len(self.id_dict)
+        return self.vocab_size
 
     def covert_id_to_token(self, id):
         """
-        :param id:
+        :param id: int，或者是数字的字符串
         :return: token
         """
-        return self.id_dict.get(id, self.unk_token)
+        try:
+            index = int(id)
+        except (TypeError, ValueError):
+            return self.unk_token
+        if 0 <= index < len(self.id_table) and self.id_table[index] is not None:
+            return self.id_table[index]
+        return self.unk_token
 
     def covert_token_to_id(self, token):
         """
@@ -93,3 +127,33 @@ class Vocabulary(object):
         """
         UNK = self.vocab_dict[self.unk_token]
         return self.vocab_dict.get(token, UNK)
+
+
+_vocabularies = {}
+_vocabularies_lock = threading.Lock()
+
+
+def get_vocabulary(vocab_path, unk_token):
+    """进程内共享的Vocabulary：同一个文件（绝对路径和mtime都相同）只解析一次，train/dev/test/predict各个reader、
+    FullTokenizer里的BasicTokenizer和WordPieceTokenizer都拿到同一份词表；文件被改写之后重新加载
+    :param vocab_path: 词表地址
+    :param unk_token: unk默认的token，unk_token不同的Vocabulary也共用词表数据
+    :return: Vocabulary，调用方不能修改vocab_dict和id_table
+    """
+    if not vocab_path:
+        raise ValueError("vocab_path can't be None")
+    path = os.path.abspath(vocab_path)
+    key = (path, os.path.getmtime(path))
+    with _vocabularies_lock:
+        by_unk_token = _vocabularies.get(key)
+        if by_unk_token is None:
+            for stale_key in [k for k in _vocabularies if k[0] == path]:
+                del _vocabularies[stale_key]
+            begin_time = time.time()
+            vocabulary = Vocabulary(vocab_path, unk_token)
+            logging.info("vocabulary %s loaded: %d tokens in %.3fs" % (vocab_path, vocabulary.vocab_size,
+                                                                      time.time() - begin_time))
+            by_unk_token = _vocabularies[key] = {unk_token: vocabulary}
+        elif unk_token not in by_unk_token:
+            by_unk_token[unk_token] = next(iter(by_unk_token.values())).with_unk_token(unk_token)
+        return by_unk_token[unk_token]
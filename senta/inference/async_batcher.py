@@ -0,0 +1,150 @@
+# -*- coding: utf-8 -*
+"""
+:py:class:`AsyncBatcher`
+"""
+import asyncio
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+
+class AsyncBatcher(object):
+    """AsyncBatcher: 把并发到来的单条请求攒成batch再交给predict_fn，每个调用方只拿到自己那一条的结果。
+    一个batch在攒够max_batch_size条或者第一条请求等待超过max_wait_ms之后发出；predict_fn跑在线程池里，
+    不会阻塞event loop，最多同时有num_workers个batch在预测。
+    """
+
+    def __init__(self, predict_fn, max_batch_size=32, max_wait_ms=5, num_workers=1):
+        """
+        :param predict_fn: 输入一个list，返回等长的结果list，比如Senta.predict
+        :param max_batch_size: 一个batch最多的请求数
+        :param max_wait_ms: batch里第一条请求最多等待的毫秒数
+        :param num_workers: 同时在预测的batch数，一般等于predictor的个数
+        """
+        if max_batch_size <= 0 or num_workers <= 0:
+            raise ValueError("max_batch_size and num_workers must be positive")
+        self.predict_fn = predict_fn
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self.num_workers = num_workers
+
+        self.num_batches = 0
+        self.num_requests = 0
+        self.batch_size_hist = {}
+        self._queue = None
+        self._worker = None
+        self._slots = None
+        # 已经发出、还在预测的batch，close时等它们完成
+        self._dispatching = set()
+        self._closed = False
+        self._executor = ThreadPoolExecutor(max_workers=num_workers)
+
+    async def predict(self, item):
+        """
+        :param item: 一条输入，比如一条文本
+        :return: predict_fn对这条输入的结果
+        """
+        if self._closed:
+            raise RuntimeError("AsyncBatcher is closed")
+        if self._worker is None:
+            self.start()
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((item, future))
+        return await future
+
+    def start(self):
+        """在正在运行的event loop里启动攒batch的后台任务，第一次调用predict时会自动启动"""
+        loop = asyncio.get_running_loop()
+        self._queue = asyncio.Queue()
+        self._slots = asyncio.Semaphore(self.num_workers)
+        self._worker = loop.create_task(self._collect())
+
+    async def close(self):
+        """停止后台任务并关闭线程池：已经发出的batch预测完再返回，还在排队或者正在攒batch的请求会被取消，
+        之后再调用predict会抛出RuntimeError
+        """
+        self._closed = True
+        if self._worker is not None:
+            self._worker.cancel()
+            try:
+                await self._worker
+            except asyncio.CancelledError:
+                pass
+            self._worker = None
+            while not self._queue.empty():
+                _, future = self._queue.get_nowait()
+                future.cancel()
+        if self._dispatching:
+            await asyncio.gather(*self._dispatching, return_exceptions=True)
+        self._executor.shutdown(wait=True)
+
+    def queue_depth(self):
+        """
+        :return: 还在排队等待组batch的请求数
+        """
+        return self._queue.qsize() if self._queue is not None else 0
+
+    def stats(self):
+        """
+        :return: dict，包括排队数、batch数、请求数和batch大小的分布
+        """
+        return {"queue_depth": self.queue_depth(),
+                "num_batches": self.num_batches,
+                "num_requests": self.num_requests,
+                "avg_batch_size": float(self.num_requests) / self.num_batches if self.num_batches else 0.0,
+                "batch_size_hist": dict(sorted(self.batch_size_hist.items()))}
+
+    async def _collect(self):
+        """不断从队列里取请求组成batch，拿到空闲的worker之后发出去"""
+        loop = asyncio.get_running_loop()
+        batch = []
+        try:
+            while True:
+                batch = [await self._queue.get()]
+                deadline = loop.time() + self.max_wait
+                while len(batch) < self.max_batch_size:
+                    timeout = deadline - loop.time()
+                    if timeout <= 0:
+                        break
+                    try:
+                        batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                    except asyncio.TimeoutError:
+                        break
+
+                await self._slots.acquire()
+                # 等worker的这段时间里又来的请求也一起带上
+                while len(batch) < self.max_batch_size and not self._queue.empty():
+                    batch.append(self._queue.get_nowait())
+                task = loop.create_task(self._dispatch(batch))
+                self._dispatching.add(task)
+                task.add_done_callback(self._dispatching.discard)
+                batch = []
+        except asyncio.CancelledError:
+            # 已经从队列里取出、还没有发出的请求不在队列里了，close取消不到，在这里取消
+            for _, future in batch:
+                if not future.done():
+                    future.cancel()
+            raise
+
+    async def _dispatch(self, batch):
+        """在线程池里跑一个batch，把结果分发给各自的调用方"""
+        loop = asyncio.get_running_loop()
+        items = [item for item, _ in batch]
+        self.num_batches += 1
+        self.num_requests += len(batch)
+        self.batch_size_hist[len(batch)] = self.batch_size_hist.get(len(batch), 0) + 1
+        try:
+            results = list(await loop.run_in_executor(self._executor, self.predict_fn, items))
+            if len(results) != len(batch):
+                # 按位置对不上，哪条结果属于哪个调用方都不可信，整个batch都报错，不能让多出来的调用方一直等下去
+                raise ValueError("predict_fn returned %d results for a batch of %d" % (len(results), len(batch)))
+        except Exception as e:
+            logging.error("batch predict failed: %s" % e)
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+        else:
+            for (_, future), result in zip(batch, results):
+                if not future.done():
+                    future.set_result(result)
+        finally:
+            self._slots.release()
@@ -0,0 +1,104 @@
+# -*- coding: utf-8 -*
+"""
+:py:class:`InferenceCheckpoint`
+"""
+import json
+import logging
+import os
+
+
+class InferenceCheckpoint(object):
+    """InferenceCheckpoint: 离线预测的断点续跑。结果旁边有一个sidecar文件test_save.ckpt，记录已经完成的batch数、
+    下一个qid和结果写到的位置；每interval个batch先把结果fsync到磁盘，再用rename原子地更新sidecar，
+    所以sidecar记录的进度一定已经落盘。重启时如果配置的指纹相同，把结果截断到记录的位置后接着写，
+    从下一个batch继续预测，最多重算interval个batch；预测完成后删除sidecar。
+    fingerprint为None时不读写sidecar，只是普通地写结果。
+    """
+
+    def __init__(self, writer, fingerprint=None, interval=1):
+        """
+        :param writer: senta.inference.result_writer里的TsvResultWriter或NpyResultWriter
+        :param fingerprint: 模型、输入文件、batch_size等配置的指纹，不同时不续跑；None表示不记录进度
+        :param interval: 每多少个batch记录一次进度
+        """
+        self.writer = writer
+        self.ckpt_file = writer.path + ".ckpt"
+        self.fingerprint = fingerprint
+        self.interval = max(1, interval)
+        self.batches = 0
+        self.qid = 0
+        self.opened = False
+
+    def open(self):
+        """打开结果，有可以续跑的sidecar时恢复进度
+        :return: 需要跳过的batch数
+        """
+        state = self.load() if self.fingerprint is not None else None
+        self.opened = True
+        if state is None:
+            self.writer.open()
+            return 0
+
+        self.batches = state["batches"]
+        self.qid = state["qid"]
+        # 丢掉上次最后一个checkpoint之后写了一半的结果
+        self.writer.open(state["position"])
+        logging.info("resume inference from %s: %d batches, %d examples done"
+                     % (self.ckpt_file, self.batches, self.qid))
+        return self.batches
+
+    def load(self):
+        """
+        :return: sidecar里的进度，没有或者配置不同时返回None
+        """
+        if not os.path.exists(self.ckpt_file):
+            return None
+        try:
+            with open(self.ckpt_file, "r") as fr:
+                state = json.load(fr)
+        except ValueError:
+            logging.warning("broken checkpoint %s, start over" % self.ckpt_file)
+            return None
+        if state.get("fingerprint") != self.fingerprint:
+            logging.info("config changed since %s was written, start over" % self.ckpt_file)
+            return None
+        if not self.writer.valid(state["position"]):
+            logging.warning("%s is shorter than recorded in %s, start over" % (self.writer.path, self.ckpt_file))
+            return None
+        return state
+
+    def write(self, batch_result):
+        """写一个batch的结果
+        :param batch_result: run_batch的结果
+        :return:
+        """
+        self.qid += self.writer.write(batch_result, self.qid)
+        self.batches += 1
+        if self.fingerprint is not None and self.batches % self.interval == 0:
+            self.save()
+
+    def save(self):
+        """先落盘结果，再原子地更新sidecar"""
+        self.writer.sync()
+        state = {"fingerprint": self.fingerprint,
+                 "batches": self.batches,
+                 "qid": self.qid,
+                 "position": self.writer.position()}
+        tmp_file = self.ckpt_file + ".tmp"
+        with open(tmp_file, "w") as fw:
+            json.dump(state, fw)
+            fw.flush()
+            os.fsync(fw.fileno())
+        os.rename(tmp_file, self.ckpt_file)
+
+    def close(self, finished=True):
+        """
+        :param finished: 预测已经全部完成，删除sidecar；否则保留最后一次记录的进度供下次续跑
+        :return:
+        """
+        if not self.opened:
+            return
+        self.opened = False
+        self.writer.close()
+        if finished and os.path.exists(self.ckpt_file):
+            os.remove(self.ckpt_file)
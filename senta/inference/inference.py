@@ -7,16 +7,31 @@ from __future__ import absolute_import
 from __future__ import division
 from __future__ import print_function
 
+import hashlib
+import json
 import logging
 import os
+import threading
 import time
+from collections import namedtuple, OrderedDict
 
+from six.moves import queue
+
+from paddle import fluid
 from paddle.fluid.core_avx import AnalysisConfig, create_paddle_predictor
 
 from senta.common.rule import InstanceName
+from senta.inference.checkpoint import InferenceCheckpoint
+from senta.inference.metrics import LatencyProfiler, PaddingStats, StageTimer
+from senta.inference.result_writer import build_result_writer
+from senta.inference.tuning import configure_cpu, load_tuning_profile, select_profile
+from senta.inference.zero_copy_predictor import ZeroCopyPredictor
 from senta.utils import params
 from senta.utils.util_helper import array2tensor
 
+# LatencyProfiler里各阶段的顺序，tokenize和pad是prepare的一部分，由field_reader记录
+INFERENCE_STAGES = ["read", "prepare", "tokenize", "pad", "tensor", "predict", "parse", "write"]
+
 
 class Inference(object):
     """Inferece:模型预测
@@ -34,20 +49,46 @@ class Inference(object):
         self.model_class = model_class
         self.inference = None
         self.input_keys = []
+        self.label_map = None
+        self.zero_copy = param.get("zero_copy", False)
+        self.profiler = LatencyProfiler(INFERENCE_STAGES)
+        # 每sort_window个batch的样本按token长度排序之后再切batch，0表示按文件顺序
+        self.sort_window = param.get("sort_window", 0)
+        self.padding_stats = PaddingStats()
         self.init_data_params()
+        self.init_label_map()
         self.init_env()
+        self.init_token_cache()
+        self.data_set_reader.predict_reader.enable_profiler(self.profiler)
 
-    def load_inference_model(self, model_path, use_gpu):
+    def load_inference_model(self, model_path, use_gpu, zero_copy=False, profile=None):
         """
         :param meta_path:
+        :param zero_copy: 返回ZeroCopyPredictor，run的输入是numpy数组而不是PaddleTensor
+        :param profile: CPU选项，见senta.inference.tuning；None时读取model_path下tune.py生成的
+                        cpu_tuning_profile.json，inference参数"cpu_tuning": false时不读取。
+                        batch_size始终是predict_reader配置的，读取的profile换成为这个batch_size调出的选项
         :return:
         """
         config = AnalysisConfig(model_path + "/" + "model", model_path + "/" + "params")
+        use_analysis = False
         if use_gpu:
             config.enable_use_gpu(1024)
         else:
-            config.disable_gpu()
-            config.enable_mkldnn()
+            if profile is None and self.param.get("cpu_tuning", True):
+                batch_size = self.data_set_reader.predict_reader.config.batch_size
+                profile = select_profile(load_tuning_profile(model_path), batch_size)
+                if profile is not None:
+                    logging.info("apply cpu tuning profile of %s for batch_size %d" % (model_path, batch_size))
+            use_analysis = configure_cpu(config, profile)
+            # 配置里显式给出的线程数优先于profile
+            if self.param.get("cpu_threads"):
+                config.set_cpu_math_library_num_threads(self.param["cpu_threads"])
+        if zero_copy:
+            config.switch_use_feed_fetch_ops(False)
+            return ZeroCopyPredictor(create_paddle_predictor(config))
+        if use_analysis:
+            return create_paddle_predictor(config)
         inference = create_paddle_predictor(config.to_native_config())
         return inference
 
@@ -56,7 +97,21 @@ class Inference(object):
         :return:
         """
         self.inference = self.load_inference_model(self.param["inference_model_path"],
-                                                   self.param["PADDLE_USE_GPU"])
+                                                   self.param["PADDLE_USE_GPU"],
+                                                   self.zero_copy)
+
+    def init_token_cache(self):
+        """
+        inference参数里配置了token_cache_size时，给predict_reader打开明文到id的LRU缓存
+        :return:
+        """
+        token_cache_size = self.param.get("token_cache_size", 0)
+        if self.sort_window:
+            # 排序时先分词算长度，切batch时还要再分一次，至少缓存一个窗口让第二次命中
+            window_size = self.data_set_reader.predict_reader.config.batch_size * self.sort_window
+            token_cache_size = max(token_cache_size, window_size)
+        if token_cache_size:
+            self.data_set_reader.predict_reader.enable_token_cache(token_cache_size)
 
     def init_data_params(self):
         """
@@ -68,61 +123,428 @@ class Inference(object):
         param_dict = params.replace_none(param_dict)
         self.input_keys = param_dict.get("fields")
 
-    def do_inference(self):
+    def init_label_map(self):
         """
+        序列标注任务需要的id到label的映射，配置在inference参数的vocab_path里
         :return:
         """
-        logging.info("start do inference....")
-        test_save = self.param.get("test_save")
-        # "./output/inference/test_out.tsv")
-        if not os.path.exists(os.path.dirname(test_save)):
-            os.makedirs(os.path.dirname(test_save))
-
-        fw = open(test_save, 'w')
-        total_time = 0
-        reader = self.data_set_reader.predict_reader.data_generator()
-        qid = 0
-
-        inference_type = self.param.get("inference_type")
         label_map_file = self.param.get("vocab_path", None)
         if isinstance(label_map_file, str):
-            label_map = {}
+            self.label_map = {}
             with open(label_map_file, 'r') as fr:
                 for line in fr.readlines():
                     line = line.strip('\r\n')
                     items = line.split('\t')
                     idx, label = int(items[1]), items[0]
-                    label_map[idx] = label
-
-        for sample in reader():
-            sample_dict = self.data_set_reader.predict_reader.convert_fields_to_dict(sample, need_emb=False)
-            input_list = []
-            for item in self.input_keys:
-                kv = item.split("#")
-                name = kv[0]
-                key = kv[1]
-                item_instance = sample_dict[name]
-                input_item = item_instance[InstanceName.RECORD_ID][key]
-                input_list.append(input_item)
-
-            inputs = [array2tensor(ndarray) for ndarray in input_list]
-            begin_time = time.time()
+                    self.label_map[idx] = label
+
+    def run_batch(self, sample):
+        """
+        用predictor跑一个已经序列化好的batch
+        :param sample: predict_reader产出的一个batch
+        :return: model_class.parse_predict_result解析之后的结果
+        """
+        with self.profiler.timer("tensor"):
+            input_list = self.build_inputs(sample)
+            if self.zero_copy:
+                inputs = input_list
+            else:
+                inputs = [array2tensor(ndarray) for ndarray in input_list]
+        with self.profiler.timer("predict"):
             result = self.inference.run(inputs)
-            end_time = time.time()
-            total_time += end_time - begin_time
+        with self.profiler.timer("parse"):
             batch_result = self.model_class.parse_predict_result(result)
-            if inference_type == 'seq_lab':
-                for label in batch_result:
-                    label = [label_map[l] for l in label]
-                    line = str(qid) + '\t' + ' '.join(label) + '\n'
-                    fw.write(line)
-                    qid += 1
-            else:
-                for item_prob in batch_result:
-                    pred = item_prob.argmax()
-                    score = item_prob.tolist()
-                    line = str(qid) + '\t' + str(pred) + '\t' + str(score) + '\n'
-                    fw.write(line)
-                    qid += 1
-        fw.close()
+        self.profiler.count(len(batch_result))
+        return batch_result
+
+    def build_inputs(self, sample):
+        """
+        :param sample: predict_reader产出的一个batch
+        :return: 模型的输入，numpy数组的list，顺序与infer_data_params.json的fields即模型的feed顺序一致
+        """
+        sample_dict = self.data_set_reader.predict_reader.convert_fields_to_dict(sample, need_emb=False)
+        input_list = []
+        for item in self.input_keys:
+            kv = item.split("#")
+            name = kv[0]
+            key = kv[1]
+            item_instance = sample_dict[name]
+            input_item = item_instance[InstanceName.RECORD_ID][key]
+            input_list.append(input_item)
+        return input_list
+
+    def prepare_examples(self, instances):
+        """
+        不经过文件，直接把一组明文样本序列化成predict_reader格式的batch
+        :param instances: list of dict，key是predict_reader各个field的名字，如{"text_a": "...", "text_b": "..."}，
+                          给出的field与read_files一样经过predict_reader.normalize_text，
+                          没有给出的field（如qid、label）用"0"填充
+        :return: list，每个元素是run_batch的输入，顺序与instances一致
+        """
+        predict_reader = self.data_set_reader.predict_reader
+        field_names = [field.name for field in predict_reader.fields]
+        Example = namedtuple('Example', field_names)
+        examples = []
+        for index, instance in enumerate(instances):
+            values = []
+            for name in field_names:
+                if name == "qid":
+                    values.append(str(instance.get(name, index)))
+                elif name in instance:
+                    values.append(predict_reader.normalize_text(name, instance[name]))
+                else:
+                    values.append("0")
+            examples.append(Example(*values))
+
+        return list(predict_reader.prepare_batch_data(examples, len(examples)))
+
+    def predict_examples(self, instances):
+        """
+        不经过文件，直接预测一组明文样本
+        :param instances: 见prepare_examples
+        :return: list，与instances一一对应的预测结果
+        """
+        results = []
+        for sample in self.prepare_examples(instances):
+            results.extend(self.run_batch(sample))
+        return results
+
+    def format_batch_result(self, batch_result, qid):
+        """
+        :param batch_result: run_batch的结果
+        :param qid: 这个batch第一条样本的qid
+        :return: 写到test_save里的行
+        """
+        lines = []
+        if self.param.get("inference_type") == 'seq_lab':
+            for label in batch_result:
+                label = [self.label_map[l] for l in label]
+                lines.append(str(qid) + '\t' + ' '.join(label) + '\n')
+                qid += 1
+        else:
+            for item_prob in batch_result:
+                pred = item_prob.argmax()
+                score = item_prob.tolist()
+                lines.append(str(qid) + '\t' + str(pred) + '\t' + str(score) + '\n')
+                qid += 1
+        return lines
+
+    def do_inference(self):
+        """
+        :return:
+        """
+        if self.param.get("pipeline", False):
+            return self.do_pipelined_inference()
+
+        logging.info("start do inference....")
+        test_save = self.param.get("test_save")
+        # "./output/inference/test_out.tsv")
+        if not os.path.exists(os.path.dirname(test_save)):
+            os.makedirs(os.path.dirname(test_save))
+
+        checkpoint = self.build_checkpoint()
+        skip_batches = checkpoint.open()
+        total_time = 0
+        profiler = self.profiler
+        profiler.start()
+        # 按块读样本，续跑时已经完成的块不再分词；一块的结果作为一个batch记录进度和耗时
+        chunks = self.iter_example_chunks(skip_batches)
+        finished = False
+        try:
+            while True:
+                read_time = time.time()
+                chunk = next(chunks, None)
+                if chunk is None:
+                    break
+                profiler.begin_batch()
+                profiler.observe("read", time.time() - read_time)
+                with profiler.timer("prepare"):
+                    samples, order = self.prepare_chunk(chunk)
+                begin_time = time.time()
+                batch_result = self.predict_chunk(samples, order)
+                end_time = time.time()
+                total_time += end_time - begin_time
+                with profiler.timer("write"):
+                    checkpoint.write(batch_result)
+                profiler.end_batch()
+            finished = True
+        finally:
+            checkpoint.close(finished)
+        profiler.stop()
         logging.info("total_time:{}".format(total_time))
+        self.log_padding_stats()
+        self.report_profile()
+        self.log_token_cache_stats()
+
+    def build_checkpoint(self):
+        """
+        inference参数里"resume": true时，记录进度并从上次中断的地方续跑，"checkpoint_interval"是记录进度的batch间隔；
+        "output_format"是结果的格式，默认"tsv"，"npy"时test_save是按列存放.npy文件的目录，见result_writer
+        :return: InferenceCheckpoint
+        """
+        num_labels = None
+        if self.param.get("output_format", "tsv") == "npy" and self.param.get("inference_type") != 'seq_lab':
+            num_labels = self.result_width()
+        writer = build_result_writer(self.param.get("output_format", "tsv"), self.param.get("test_save"),
+                                     self.format_batch_result, self.param.get("inference_type"), num_labels)
+        if not self.param.get("resume", False):
+            return InferenceCheckpoint(writer)
+        return InferenceCheckpoint(writer, self.checkpoint_fingerprint(), self.param.get("checkpoint_interval", 1))
+
+    def result_width(self):
+        """分类模型每条结果的概率个数，写npy结果时一条结果都没有也要知道probs的列数
+        :return: inference_model_path/model里第一个fetch变量的第二维，读不到时用模型配置里的num_labels
+        """
+        model_file = os.path.join(self.param["inference_model_path"], "model")
+        try:
+            with open(model_file, "rb") as fr:
+                program = fluid.Program.parse_from_string(fr.read())
+            block = program.global_block()
+            for op in block.ops:
+                if op.type == "fetch" and op.attr("col") == 0:
+                    shape = block.var(op.input("X")[0]).shape
+                    if len(shape) == 2 and shape[1] > 0:
+                        return int(shape[1])
+        except Exception as e:
+            logging.warning("can't read the output shape from %s: %s" % (model_file, e))
+        return self.model_class.model_params.get("num_labels")
+
+    def checkpoint_fingerprint(self):
+        """
+        :return: 模型、输入文件和batch_size的指纹，变了之后不能续跑
+        """
+        predict_reader = self.data_set_reader.predict_reader
+        data_path = predict_reader.config.data_path
+        files = [(name, os.path.getsize(os.path.join(data_path, name))) for name in os.listdir(data_path)]
+        content = json.dumps({"inference_model_path": self.param.get("inference_model_path"),
+                              "inference_type": self.param.get("inference_type"),
+                              "output_format": self.param.get("output_format", "tsv"),
+                              "data_path": os.path.abspath(data_path),
+                              "files": files,
+                              "batch_size": predict_reader.config.batch_size,
+                              "sort_window": self.sort_window})
+        return hashlib.md5(content.encode("utf-8")).hexdigest()
+
+    def report_profile(self):
+        """
+        打印各阶段每个batch耗时的p50/p95/p99和tokens/s；inference参数里配置了"profile_report"时，
+        把完整的统计写成json文件，可以直接diff不同版本的结果；打开sort_window时还包括排序前后的padding比例
+        :return: self.profiler.report()
+        """
+        logging.info("latency profile: " + self.profiler.summary())
+        report = self.profiler.report()
+        if self.sort_window:
+            report["padding"] = self.padding_stats.to_dict()
+        profile_report = self.param.get("profile_report")
+        if profile_report:
+            with open(profile_report, "w") as fw:
+                json.dump(report, fw, indent=2)
+                fw.write("\n")
+        return report
+
+    def log_token_cache_stats(self):
+        """
+        :return:
+        """
+        token_cache_stats = self.data_set_reader.predict_reader.token_cache_stats()
+        if token_cache_stats:
+            logging.info("token_cache_stats:{}".format(token_cache_stats))
+
+    def iter_example_chunks(self, skip=0):
+        """按predict_reader.data_generator的文件顺序读样本，每batch_size条切成一块；
+        打开sort_window时每batch_size * sort_window条切成一块，块内排序
+        :param skip: 跳过前skip块，断点续跑时用
+        :return: generator of list of Example
+        """
+        predict_reader = self.data_set_reader.predict_reader
+        data_path = predict_reader.config.data_path
+        batch_size = predict_reader.config.batch_size * max(1, self.sort_window)
+        index = 0
+        for input_file in os.listdir(data_path):
+            examples = predict_reader.read_files(os.path.join(data_path, input_file))
+            for start in range(0, len(examples), batch_size):
+                if index >= skip:
+                    yield examples[start: start + batch_size]
+                index += 1
+
+    def prepare_chunk(self, chunk):
+        """分词、padding一块样本；打开sort_window时先按token长度排序再切batch，padding更少
+        :param chunk: iter_example_chunks产出的一块样本
+        :return: (samples, order)，samples是run_batch的输入，order[i]是排序后第i条在chunk里的下标，不排序时为None
+        """
+        predict_reader = self.data_set_reader.predict_reader
+        batch_size = predict_reader.config.batch_size
+        order = None
+        if self.sort_window:
+            lengths = predict_reader.example_lengths(chunk)
+            if lengths is not None:
+                # 稳定排序，长度相同的样本保持原来的相对顺序
+                order = sorted(range(len(chunk)), key=lengths.__getitem__)
+                self.padding_stats.add(lengths, order, batch_size)
+                chunk = [chunk[i] for i in order]
+        return list(predict_reader.prepare_batch_data(chunk, batch_size)), order
+
+    def predict_chunk(self, samples, order):
+        """
+        :param samples: prepare_chunk的结果
+        :param order: prepare_chunk的结果
+        :return: 这一块的预测结果，已经恢复成chunk里的原顺序
+        """
+        batch_result = []
+        for sample in samples:
+            batch_result.extend(self.run_batch(sample))
+        if order is None:
+            return batch_result
+        restored = [None] * len(order)
+        for index, result in zip(order, batch_result):
+            restored[index] = result
+        return restored
+
+    def log_padding_stats(self):
+        """打开sort_window时打印排序前后的padding比例"""
+        if self.sort_window and self.padding_stats.tokens:
+            stats = self.padding_stats.to_dict()
+            logging.info("padding ratio (padded tokens / real tokens): %.3f in file order, %.3f sorted by length "
+                         "with sort_window %d" % (stats["ratio_before"], stats["ratio_after"], self.sort_window))
+
+    def do_pipelined_inference(self):
+        """流水线预测：读文件、num_producers个线程分词padding、predictor连续预测、写文件线程按原顺序落盘，
+        各阶段之间用有界队列连接。inference参数：
+            "pipeline": true
+            "num_producers": 分词padding的线程数，默认1
+            "pipeline_queue_size": 每个队列最多缓存的batch数，默认16
+        结束时打印各阶段的利用率，接近100%的阶段就是瓶颈
+        :return:
+        """
+        logging.info("start do pipelined inference....")
+        test_save = self.param.get("test_save")
+        if not os.path.exists(os.path.dirname(test_save)):
+            os.makedirs(os.path.dirname(test_save))
+
+        checkpoint = self.build_checkpoint()
+        skip_batches = checkpoint.open()
+        num_producers = self.param.get("num_producers", 1)
+        queue_size = self.param.get("pipeline_queue_size", 16)
+
+        chunk_queue = queue.Queue(queue_size)
+        batch_queue = queue.Queue(queue_size)
+        result_queue = queue.Queue(queue_size)
+        stages = OrderedDict([("read", StageTimer("read")),
+                              ("prepare", StageTimer("prepare", num_producers)),
+                              ("predict", StageTimer("predict")),
+                              ("write", StageTimer("write"))])
+        errors = []
+        profiler = self.profiler
+        profiler.start()
+
+        def read():
+            """读文件，切块"""
+            index = 0
+            try:
+                chunks = self.iter_example_chunks(skip_batches)
+                while True:
+                    begin_time = time.time()
+                    chunk = next(chunks, None)
+                    if chunk is None:
+                        break
+                    stages["read"].add(time.time() - begin_time, len(chunk))
+                    profiler.observe("read", time.time() - begin_time)
+                    chunk_queue.put((index, chunk))
+                    index += 1
+            except Exception as e:
+                logging.error("pipeline read failed: %s" % e)
+                errors.append(e)
+            finally:
+                for _ in range(num_producers):
+                    chunk_queue.put(None)
+
+        def prepare():
+            """分词、padding"""
+            while True:
+                item = chunk_queue.get()
+                if item is None:
+                    batch_queue.put(None)
+                    break
+                index, chunk = item
+                if errors:
+                    continue
+                try:
+                    begin_time = time.time()
+                    profiler.begin_batch()
+                    prepared = self.prepare_chunk(chunk)
+                    profiler.observe("prepare", time.time() - begin_time)
+                    profiler.end_batch()
+                    stages["prepare"].add(time.time() - begin_time, len(chunk))
+                    batch_queue.put((index, prepared))
+                except Exception as e:
+                    logging.error("pipeline prepare failed: %s" % e)
+                    errors.append(e)
+
+        def write():
+            """把结果按块的原顺序写到test_save"""
+            pending = {}
+            next_index = 0
+            # 出错之后也要把队列取空，不能让predictor阻塞住
+            while True:
+                item = result_queue.get()
+                if item is None:
+                    break
+                if errors:
+                    continue
+                index, batch_result = item
+                pending[index] = batch_result
+                try:
+                    begin_time = time.time()
+                    while next_index in pending:
+                        with profiler.timer("write"):
+                            checkpoint.write(pending.pop(next_index))
+                        next_index += 1
+                    stages["write"].add(time.time() - begin_time)
+                except Exception as e:
+                    logging.error("pipeline write failed: %s" % e)
+                    errors.append(e)
+
+        threads = [threading.Thread(target=read, name="infer-read"),
+                   threading.Thread(target=write, name="infer-write")]
+        threads.extend(threading.Thread(target=prepare, name="infer-prepare-%d" % i) for i in range(num_producers))
+        begin_time = time.time()
+        for thread in threads:
+            thread.daemon = True
+            thread.start()
+
+        # predictor在当前线程里连续消费batch
+        finished = 0
+        while finished < num_producers:
+            item = batch_queue.get()
+            if item is None:
+                finished += 1
+                continue
+            index, (samples, order) = item
+            if errors:
+                continue
+            try:
+                predict_time = time.time()
+                profiler.begin_batch()
+                batch_result = self.predict_chunk(samples, order)
+                profiler.end_batch()
+                stages["predict"].add(time.time() - predict_time, len(batch_result))
+                result_queue.put((index, batch_result))
+            except Exception as e:
+                logging.error("pipeline predict failed: %s" % e)
+                errors.append(e)
+        result_queue.put(None)
+        for thread in threads:
+            thread.join()
+        wall_time = time.time() - begin_time
+        profiler.stop()
+
+        checkpoint.close(finished=not errors)
+        if errors:
+            raise errors[0]
+        logging.info("total_time:{}, predict_time:{}".format(wall_time, stages["predict"].busy))
+        logging.info("stage utilization: " + ", ".join(
+            "%s %.1f%% (%d threads, busy %.2fs)" % (name, 100 * stage.utilization(wall_time), stage.num_threads,
+                                                     stage.busy) for name, stage in stages.items()))
+        self.log_padding_stats()
+        self.report_profile()
+        self.log_token_cache_stats()
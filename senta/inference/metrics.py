@@ -0,0 +1,335 @@
+# -*- coding: utf-8 -*
+"""
+:py:class:`Histogram`
+"""
+import bisect
+import json
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+DEFAULT_LATENCY_BOUNDS_MS = [1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000]
+# 分词、padding这类阶段一个batch常常不到1ms，分桶要更细
+PROFILE_LATENCY_BOUNDS_MS = [0.05, 0.1, 0.2, 0.5, 1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000]
+
+
+class Histogram(object):
+    """Histogram: 固定分桶的直方图，线程安全，用于统计各阶段耗时、batch大小等
+    """
+
+    def __init__(self, bounds=None):
+        """
+        :param bounds: 升序的桶上界，最后还有一个不设上界的桶；默认是毫秒级的延迟分桶
+        """
+        self.bounds = list(bounds) if bounds else list(DEFAULT_LATENCY_BOUNDS_MS)
+        self.counts = [0] * (len(self.bounds) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        """
+        :param value: 一个观测值
+        :return:
+        """
+        with self._lock:
+            self.counts[bisect.bisect_left(self.bounds, value)] += 1
+            self.count += 1
+            self.total += value
+            self.max = max(self.max, value)
+
+    def percentile(self, q):
+        """按分桶估计分位数，返回分位数所在桶的上界
+        :param q: 0-100
+        :return: float
+        """
+        with self._lock:
+            if not self.count:
+                return 0.0
+            rank = q / 100.0 * self.count
+            seen = 0
+            for i, num in enumerate(self.counts):
+                seen += num
+                if seen >= rank and num:
+                    return float(self.bounds[i]) if i < len(self.bounds) else self.max
+            return self.max
+
+    def to_dict(self):
+        """
+        :return: dict，可以直接json序列化
+        """
+        buckets = {}
+        with self._lock:
+            for i, num in enumerate(self.counts):
+                key = "<=%s" % self.bounds[i] if i < len(self.bounds) else ">%s" % self.bounds[-1]
+                buckets[key] = num
+            count, total, max_value = self.count, self.total, self.max
+        return {"count": count,
+                "avg": total / count if count else 0.0,
+                "max": max_value,
+                "p50": self.percentile(50),
+                "p95": self.percentile(95),
+                "p99": self.percentile(99),
+                "buckets": buckets}
+
+
+class StageTimer(object):
+    """StageTimer: 统计流水线里一个阶段的忙碌时间，线程安全。
+    利用率 = 忙碌时间 / (墙钟时间 * 线程数)，接近100%的阶段就是瓶颈
+    """
+
+    def __init__(self, name, num_threads=1):
+        """
+        :param name: 阶段名
+        :param num_threads: 这个阶段的线程数
+        """
+        self.name = name
+        self.num_threads = num_threads
+        self.busy = 0.0
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def add(self, seconds, count=1):
+        """
+        :param seconds: 一次处理的耗时
+        :param count: 这次处理的条数
+        :return:
+        """
+        with self._lock:
+            self.busy += seconds
+            self.count += count
+
+    def utilization(self, wall_time):
+        """
+        :param wall_time: 整个流水线的墙钟时间
+        :return: 0-1
+        """
+        if wall_time <= 0:
+            return 0.0
+        return self.busy / (wall_time * self.num_threads)
+
+    def to_dict(self, wall_time):
+        """
+        :return: dict，可以直接json序列化
+        """
+        return {"busy": self.busy,
+                "count": self.count,
+                "threads": self.num_threads,
+                "utilization": self.utilization(wall_time)}
+
+
+class LatencyProfiler(object):
+    """LatencyProfiler: 按阶段统计每个batch的耗时分布(p50/p95/p99)，以及样本数、token数和吞吐，线程安全。
+    同一个batch在一个阶段里的多次观测（如多个field的分词）在begin_batch/end_batch之间先累加，end_batch时记成一次；
+    不在batch里的观测直接记一次。report()的结果可以json序列化，用来对比不同版本的性能
+    """
+
+    def __init__(self, stages=None, bounds=None):
+        """
+        :param stages: 阶段名，决定report里的顺序；没有列出的阶段在第一次观测时追加在后面
+        :param bounds: 毫秒分桶的上界，默认PROFILE_LATENCY_BOUNDS_MS
+        """
+        self.bounds = list(bounds) if bounds else list(PROFILE_LATENCY_BOUNDS_MS)
+        self.stages = OrderedDict((name, Histogram(self.bounds)) for name in stages or [])
+        self.batches = 0
+        self.examples = 0
+        self.tokens = 0
+        self.begin_time = None
+        self.end_time = None
+        self._local = threading.local()
+        self._lock = threading.Lock()
+
+    def start(self):
+        """开始计墙钟时间，吞吐按start到stop之间的时间算"""
+        self.begin_time = time.time()
+        self.end_time = None
+
+    def stop(self):
+        """停止计墙钟时间"""
+        self.end_time = time.time()
+
+    def wall_time(self):
+        """
+        :return: start以来的秒数，stop之后固定不变
+        """
+        if self.begin_time is None:
+            return 0.0
+        return (self.end_time or time.time()) - self.begin_time
+
+    def begin_batch(self):
+        """当前线程之后的观测累加到同一个batch里，直到end_batch"""
+        self._local.pending = OrderedDict()
+
+    def end_batch(self):
+        """把当前线程这个batch里各阶段的累计耗时各记一次"""
+        pending = getattr(self._local, "pending", None)
+        self._local.pending = None
+        if pending:
+            for stage, seconds in pending.items():
+                self._histogram(stage).observe(seconds * 1000)
+
+    def observe(self, stage, seconds):
+        """
+        :param stage: 阶段名
+        :param seconds: 这个阶段的耗时
+        :return:
+        """
+        pending = getattr(self._local, "pending", None)
+        if pending is not None:
+            pending[stage] = pending.get(stage, 0.0) + seconds
+        else:
+            self._histogram(stage).observe(seconds * 1000)
+
+    @contextmanager
+    def timer(self, stage):
+        """with profiler.timer("predict"): ..."""
+        begin_time = time.time()
+        try:
+            yield
+        finally:
+            self.observe(stage, time.time() - begin_time)
+
+    def count(self, num_examples, num_tokens=0):
+        """
+        :param num_examples: 预测完的样本数
+        :param num_tokens: 这些样本的token数（含[CLS]/[SEP]，不含padding）
+        :return:
+        """
+        with self._lock:
+            self.batches += 1
+            self.examples += num_examples
+            self.tokens += num_tokens
+
+    def add_tokens(self, num_tokens):
+        """分词时记token数，样本数之后由count记
+        :param num_tokens: token数（含[CLS]/[SEP]，不含padding）
+        :return:
+        """
+        with self._lock:
+            self.tokens += num_tokens
+
+    def _histogram(self, stage):
+        histogram = self.stages.get(stage)
+        if histogram is None:
+            with self._lock:
+                histogram = self.stages.setdefault(stage, Histogram(self.bounds))
+        return histogram
+
+    def report(self):
+        """
+        :return: OrderedDict，可以直接json序列化；各阶段的耗时单位是毫秒
+        """
+        wall_time = self.wall_time()
+        stages = OrderedDict()
+        for name, histogram in list(self.stages.items()):
+            stage = histogram.to_dict()
+            stage["total_ms"] = histogram.total
+            stages[name] = stage
+        return OrderedDict([("wall_time", wall_time),
+                            ("batches", self.batches),
+                            ("examples", self.examples),
+                            ("tokens", self.tokens),
+                            ("examples_per_second", self.examples / wall_time if wall_time > 0 else 0.0),
+                            ("tokens_per_second", self.tokens / wall_time if wall_time > 0 else 0.0),
+                            ("stages", stages)])
+
+    def summary(self):
+        """
+        :return: 一行可读的摘要，用于打日志
+        """
+        parts = ["%d examples, %.1f tokens/s" % (self.examples, self.tokens / max(self.wall_time(), 1e-9))]
+        for name, histogram in list(self.stages.items()):
+            if histogram.count:
+                parts.append("%s p50 %sms p95 %sms p99 %sms" % (name, histogram.percentile(50),
+                                                                histogram.percentile(95), histogram.percentile(99)))
+        return ", ".join(parts)
+
+    def dump(self, path):
+        """把report写成json文件
+        :param path: 输出文件
+        :return:
+        """
+        with open(path, "w") as fw:
+            json.dump(self.report(), fw, indent=2)
+            fw.write("\n")
+
+
+class NullProfiler(object):
+    """NullProfiler: 与LatencyProfiler接口相同但什么都不记，没有打开统计时使用，省掉各处的判断
+    """
+
+    def begin_batch(self):
+        """no-op"""
+        pass
+
+    def end_batch(self):
+        """no-op"""
+        pass
+
+    def observe(self, stage, seconds):
+        """no-op"""
+        pass
+
+    @contextmanager
+    def timer(self, stage):
+        """no-op"""
+        yield
+
+    def count(self, num_examples, num_tokens=0):
+        """no-op"""
+        pass
+
+    def add_tokens(self, num_tokens):
+        """no-op"""
+        pass
+
+
+def padded_tokens(lengths, batch_size):
+    """
+    :param lengths: 按切batch的顺序排列的样本长度
+    :param batch_size: 每个batch的样本数
+    :return: 每个batch都padding到batch内最长样本之后的总token数
+    """
+    total = 0
+    for start in range(0, len(lengths), batch_size):
+        batch = lengths[start: start + batch_size]
+        total += max(batch) * len(batch)
+    return total
+
+
+class PaddingStats(object):
+    """PaddingStats: 统计padding比例 = padding之后的token数 / 真实token数，1.0表示没有浪费；
+    同时记录按原顺序切batch和按长度排序之后切batch两种情况，线程安全
+    """
+
+    def __init__(self):
+        self.tokens = 0
+        self.padded_before = 0
+        self.padded_after = 0
+        self._lock = threading.Lock()
+
+    def add(self, lengths, order, batch_size):
+        """
+        :param lengths: 一个窗口里各样本按原顺序的长度
+        :param order: 排序之后的顺序，order[i]是排序后第i条的原下标
+        :param batch_size: 每个batch的样本数
+        :return:
+        """
+        before = padded_tokens(lengths, batch_size)
+        after = padded_tokens([lengths[i] for i in order], batch_size)
+        with self._lock:
+            self.tokens += sum(lengths)
+            self.padded_before += before
+            self.padded_after += after
+
+    def to_dict(self):
+        """
+        :return: dict，可以直接json序列化
+        """
+        with self._lock:
+            tokens, before, after = self.tokens, self.padded_before, self.padded_after
+        return {"tokens": tokens,
+                "ratio_before": before / float(tokens) if tokens else 0.0,
+                "ratio_after": after / float(tokens) if tokens else 0.0}
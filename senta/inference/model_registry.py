@@ -0,0 +1,116 @@
+# -*- coding: utf-8 -*
+"""
+:py:class:`ModelRegistry`
+"""
+import logging
+import threading
+from collections import OrderedDict
+
+
+class ModelRegistry(object):
+    """ModelRegistry: 常驻内存的模型表，key一般是(model_class, task)。模型个数或者总的内存估计超出上限时，
+    淘汰最久未使用的模型；被pin住的模型（比如init_model选中的当前模型）不会被淘汰。
+    """
+
+    def __init__(self, max_models=None, memory_budget=None):
+        """
+        :param max_models: 最多常驻的模型数，None表示不限
+        :param memory_budget: 常驻模型内存估计之和的上限(字节)，None表示不限
+        """
+        if max_models is not None and max_models <= 0:
+            raise ValueError("max_models must be positive, got %s" % max_models)
+        self.max_models = max_models
+        self.memory_budget = memory_budget
+        self.pinned = None
+        self.loads = 0
+        self.hits = 0
+        self.evictions = 0
+        self._models = OrderedDict()
+        self._sizes = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """
+        :param key:
+        :return: 常驻的模型，不存在时返回None；命中的模型被标记为最近使用
+        """
+        with self._lock:
+            model = self._models.pop(key, None)
+            if model is None:
+                return None
+            self._models[key] = model
+            self.hits += 1
+            return model
+
+    def put(self, key, model, size=0):
+        """加入一个新加载的模型，必要时淘汰最久未使用的模型
+        :param key:
+        :param model:
+        :param size: 模型占用内存的估计(字节)
+        :return:
+        """
+        with self._lock:
+            self._models.pop(key, None)
+            self._models[key] = model
+            self._sizes[key] = size
+            self.loads += 1
+            self._evict(keep=key)
+
+    def pin(self, key):
+        """
+        :param key: 不参与淘汰的模型，None表示取消
+        :return:
+        """
+        with self._lock:
+            self.pinned = key
+            self._evict(keep=key)
+
+    def memory_usage(self):
+        """
+        :return: 常驻模型内存估计之和(字节)
+        """
+        return sum(self._sizes.values())
+
+    def keys(self):
+        """
+        :return: 常驻模型的key，从最久未使用到最近使用
+        """
+        return list(self._models.keys())
+
+    def stats(self):
+        """
+        :return: dict，可以直接打日志或导出成监控指标
+        """
+        return {"models": [list(key) if isinstance(key, tuple) else key for key in self.keys()],
+                "memory_usage": self.memory_usage(),
+                "memory_budget": self.memory_budget,
+                "max_models": self.max_models,
+                "loads": self.loads,
+                "hits": self.hits,
+                "evictions": self.evictions}
+
+    def _evict(self, keep):
+        """持有self._lock时调用"""
+        for key in list(self._models.keys()):
+            if not self._over_budget():
+                break
+            if key == keep or key == self.pinned:
+                continue
+            del self._models[key]
+            del self._sizes[key]
+            self.evictions += 1
+            logging.info("evict resident model %s" % (key,))
+
+    def _over_budget(self):
+        """持有self._lock时调用"""
+        if self.max_models is not None and len(self._models) > self.max_models:
+            return True
+        if self.memory_budget is not None and sum(self._sizes.values()) > self.memory_budget:
+            return True
+        return False
+
+    def __len__(self):
+        return len(self._models)
+
+    def __contains__(self, key):
+        return key in self._models
@@ -0,0 +1,160 @@
+# -*- coding: utf-8 -*
+"""
+:py:class:`PredictionCache`
+"""
+import logging
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+
+class PredictionCache(object):
+    """PredictionCache: 预测结果缓存，key是(model_class, task, 归一化之后的文本)，value是模型输出的概率向量。
+    内存中按LRU淘汰，可以同时限制条数和字节数，支持过期时间；配置db_path后结果会写到sqlite文件里，
+    进程重启之后还能命中。
+    空白归一化默认关闭：序列标注模型的输出与字符位置一一对应，空白不同的文本不能共用结果，
+    所以即使打开，inference_type为seq_lab的模型也不做归一化。
+    """
+
+    def __init__(self, capacity=100000, max_bytes=None, ttl=None, db_path=None, normalize=False):
+        """
+        :param capacity: 内存中最多缓存的条数
+        :param max_bytes: 内存中缓存的概率向量最多占用的字节数，None表示不限制
+        :param ttl: 过期时间，单位秒，None表示不过期
+        :param db_path: sqlite文件路径，None表示只用内存
+        :param normalize: 是否把文本中连续的空白合并成一个空格再做key，只对非seq_lab的模型生效
+        """
+        if capacity <= 0:
+            raise ValueError("capacity must be positive, got %s" % capacity)
+        self.capacity = capacity
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.db_path = db_path
+        self.normalize = normalize
+
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.memory_bytes = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+        self._db = None
+        if db_path:
+            self._db = sqlite3.connect(db_path, check_same_thread=False)
+            self._db.execute("CREATE TABLE IF NOT EXISTS predictions "
+                             "(key TEXT PRIMARY KEY, dtype TEXT, probs BLOB, created REAL)")
+            self._db.commit()
+
+    def make_key(self, model_class, task, text, inference_type=None):
+        """
+        :param model_class: 预训练模型名，如ernie_1.0_skep_large_ch
+        :param task: 任务名，如sentiment_classify
+        :param text: 明文
+        :param inference_type: 模型的inference_type，seq_lab时不做空白归一化
+        :return: str
+        """
+        if self.normalize and inference_type != 'seq_lab':
+            text = " ".join(text.split())
+        return "\1".join([model_class, task, text])
+
+    def get(self, model_class, task, text, inference_type=None):
+        """
+        :param inference_type: 见make_key
+        :return: 缓存的概率向量，没有命中或已经过期时返回None
+        """
+        key = self.make_key(model_class, task, text, inference_type)
+        now = time.time()
+        with self._lock:
+            item = self._data.pop(key, None)
+            if item is not None:
+                probs, created = item
+                if self.ttl is None or now - created < self.ttl:
+                    self._data[key] = item
+                    self.hits += 1
+                    return probs
+                self.memory_bytes -= probs.nbytes
+
+            if self._db is not None:
+                row = self._db.execute("SELECT dtype, probs, created FROM predictions WHERE key = ?",
+                                       (key,)).fetchone()
+                if row is not None and (self.ttl is None or now - row[2] < self.ttl):
+                    probs = np.frombuffer(row[1], dtype=np.dtype(row[0]))
+                    self._insert(key, probs, row[2])
+                    self.hits += 1
+                    self.disk_hits += 1
+                    return probs
+
+            self.misses += 1
+            return None
+
+    def put(self, model_class, task, text, probs, inference_type=None):
+        """
+        :param probs: 一条样本的预测结果，会转成一维的numpy数组保存
+        :param inference_type: 见make_key
+        :return:
+        """
+        key = self.make_key(model_class, task, text, inference_type)
+        probs = np.array(probs).reshape(-1)
+        probs.setflags(write=False)
+        created = time.time()
+        with self._lock:
+            self._insert(key, probs, created)
+            if self._db is not None:
+                self._db.execute("INSERT OR REPLACE INTO predictions VALUES (?, ?, ?, ?)",
+                                 (key, probs.dtype.str, sqlite3.Binary(probs.tobytes()), created))
+                self._db.commit()
+
+    def _insert(self, key, probs, created):
+        """在持有锁的情况下写入内存，并按条数和字节数淘汰"""
+        old = self._data.pop(key, None)
+        if old is not None:
+            self.memory_bytes -= old[0].nbytes
+        self._data[key] = (probs, created)
+        self.memory_bytes += probs.nbytes
+        while self._data and (len(self._data) > self.capacity or
+                              (self.max_bytes is not None and self.memory_bytes > self.max_bytes)):
+            _, (evicted, _) = self._data.popitem(last=False)
+            self.memory_bytes -= evicted.nbytes
+            self.evictions += 1
+
+    def hit_rate(self):
+        """
+        :return: 命中率，还没有访问时为0
+        """
+        total = self.hits + self.misses
+        return float(self.hits) / total if total else 0.0
+
+    def stats(self):
+        """
+        :return: dict，可以直接打日志或导出成监控指标
+        """
+        return {"size": len(self._data),
+                "capacity": self.capacity,
+                "memory_bytes": self.memory_bytes,
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": self.hit_rate()}
+
+    def clear(self):
+        """清空内存和sqlite中的缓存"""
+        with self._lock:
+            self._data.clear()
+            self.memory_bytes = 0
+            if self._db is not None:
+                self._db.execute("DELETE FROM predictions")
+                self._db.commit()
+
+    def close(self):
+        """关闭sqlite连接"""
+        with self._lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
+        logging.info("prediction cache closed: %s" % self.stats())
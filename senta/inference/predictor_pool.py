@@ -0,0 +1,57 @@
+# -*- coding: utf-8 -*
+"""
+:py:class:`PredictorPool`
+"""
+import contextlib
+
+from six.moves import queue
+
+
+class PredictorPool(object):
+    """PredictorPool: 一个predictor不能被多个线程同时调用，这里用clone出来的多个predictor（共享权重）组成一个池子，
+    每次调用从池子里借一个，用完归还，从而在一个进程里并发预测。
+    """
+
+    def __init__(self, predictor, size=1):
+        """
+        :param predictor: create_paddle_predictor创建的predictor，其余的predictor由它clone而来
+        :param size: 池子里predictor的个数
+        """
+        if size <= 0:
+            raise ValueError("size must be positive, got %s" % size)
+        self.predictors = [predictor]
+        for _ in range(size - 1):
+            self.predictors.append(predictor.clone())
+
+        self._idle = queue.Queue()
+        for item in self.predictors:
+            self._idle.put(item)
+
+    @contextlib.contextmanager
+    def acquire(self, timeout=None):
+        """借出一个空闲的predictor，没有空闲的时候阻塞等待
+        :param timeout: 等待的秒数，None表示一直等，超时抛出queue.Empty
+        :return: predictor
+        """
+        predictor = self._idle.get(timeout=timeout)
+        try:
+            yield predictor
+        finally:
+            self._idle.put(predictor)
+
+    def run(self, inputs):
+        """用一个空闲的predictor跑一次预测
+        :param inputs: PaddleTensor的list
+        :return: predictor.run的结果
+        """
+        with self.acquire() as predictor:
+            return predictor.run(inputs)
+
+    def num_idle(self):
+        """
+        :return: 当前空闲的predictor个数
+        """
+        return self._idle.qsize()
+
+    def __len__(self):
+        return len(self.predictors)
@@ -0,0 +1,262 @@
+# -*- coding: utf-8 -*
+"""
+CPU INT8离线量化：对BaseTrainer.save_inference保存的FP32模型，用dev集的一部分样本校准，得到INT8模型，
+目录结构与FP32模型相同（model、params、infer_data_params.json），infer.py、serve.py和Senta可以直接加载；
+再在dev集里没有参与校准的样本上对比FP32和INT8的准确率与速度。需要paddle>=1.7的PostTrainingQuantization：1.7只有sample_generator，
+按样本喂校准数据，1.8起用batch_generator直接喂reader组好的batch；matmul要paddle>=1.8才能量化，
+更早的版本只量化mul
+"""
+import inspect
+import json
+import logging
+import os
+import shutil
+import tempfile
+
+import numpy as np
+import paddle
+from paddle import fluid
+
+from senta.inference.tuning import max_result_diff, read_examples, save_tuning_profile, time_candidate
+
+# 默认量化的op，ERNIE/RoBERTa的计算量几乎都在全连接和attention的矩阵乘里
+DEFAULT_QUANTIZABLE_OP_TYPE = ["mul", "matmul"]
+
+# INT8图里的op已经是mkldnn的kernel，用AnalysisPredictor加载时不再做ir优化，可以再用tune.py调优
+INT8_CPU_PROFILE = {"analysis_predictor": True, "use_mkldnn": True, "ir_optim": False}
+
+
+def calibration_generator(inference, examples, batch_size, per_sample=False):
+    """
+    :param inference: senta.inference.inference.Inference
+    :param examples: 校准用的样本
+    :param batch_size: 校准的batch_size
+    :param per_sample: 为True时按样本产出（paddle 1.7的sample_generator），同一个batch里的样本padding长度相同，
+                       PostTrainingQuantization按同样的batch_size重新拼起来就是原来的batch
+    :return: 生成器函数，每次产出一个batch（或一条样本）的模型输入，numpy数组的list，顺序与feed一致
+    """
+    predict_reader = inference.data_set_reader.predict_reader
+
+    def generator():
+        """batch_generator"""
+        for sample in predict_reader.prepare_batch_data(examples, batch_size):
+            inputs = inference.build_inputs(sample)
+            if not per_sample:
+                yield inputs
+                continue
+            for i in range(len(inputs[0])):
+                yield [array[i] for array in inputs]
+
+    return generator
+
+
+def supported_op_types(quantizable_op_type):
+    """去掉当前paddle的PostTrainingQuantization不支持的op（如1.7的matmul），否则构造时直接assert失败
+    :param quantizable_op_type: 要量化的op
+    :return: 支持的op的list
+    """
+    from paddle.fluid.contrib.slim.quantization import QuantizationTransformPass
+    supported = set(getattr(QuantizationTransformPass, "_supported_quantizable_op_type", []))
+    try:
+        from paddle.fluid.contrib.slim.quantization import AddQuantDequantPass
+        supported.update(getattr(AddQuantDequantPass, "_supported_quantizable_op_type", []))
+    except ImportError:
+        pass
+    if not supported:
+        return list(quantizable_op_type)
+    skipped = [op_type for op_type in quantizable_op_type if op_type not in supported]
+    if skipped:
+        logging.warning("paddle %s can't quantize %s, skip them" % (paddle.__version__, ",".join(skipped)))
+    op_types = [op_type for op_type in quantizable_op_type if op_type in supported]
+    if not op_types:
+        raise ValueError("none of %s can be quantized by paddle %s" % (",".join(quantizable_op_type),
+                                                                       paddle.__version__))
+    return op_types
+
+
+def convert_to_mkldnn_int8(program, scope, place, quantizable_op_type):
+    """把带fake quant/dequant op的量化模型转成mkldnn的INT8图，paddle没有Quant2Int8MkldnnPass时原样返回
+    :return: (program, 是否转换成功)
+    """
+    try:
+        from paddle.fluid.contrib.slim.quantization import Quant2Int8MkldnnPass
+        from paddle.fluid.framework import IrGraph
+    except ImportError:
+        logging.warning("this paddle has no Quant2Int8MkldnnPass, the model keeps fake quant ops and runs in fp32 "
+                        "kernels, upgrade paddle to get int8 kernels")
+        return program, False
+    graph = IrGraph(fluid.core.Graph(program.desc), for_test=True)
+    mkldnn_pass = Quant2Int8MkldnnPass(set(quantizable_op_type), _scope=scope, _place=place, _core=fluid.core)
+    graph = mkldnn_pass.apply(graph)
+    return graph.to_program(), True
+
+
+def quantize_model(model_path, output_path, inference, examples, batch_size, algo="KL",
+                   quantizable_op_type=None):
+    """离线量化model_path下的FP32模型，结果按model/params的文件名保存到output_path
+    :param model_path: save_inference_model的输出目录，即inference_step_*
+    :param output_path: INT8模型的目录
+    :param inference: 用来把examples转成模型输入的Inference
+    :param examples: 校准用的样本
+    :param batch_size: 校准的batch_size
+    :param algo: 计算激活scale的方法，"KL"、"abs_max"或"min_max"
+    :param quantizable_op_type: 要量化的op，默认DEFAULT_QUANTIZABLE_OP_TYPE，当前paddle不支持的会被跳过
+    :return: (是否转成了mkldnn的INT8图, 实际量化的op)
+    """
+    try:
+        from paddle.fluid.contrib.slim.quantization import PostTrainingQuantization
+    except ImportError:
+        raise ImportError("post-training quantization needs paddle>=1.7, got %s" % paddle.__version__)
+    quantizable_op_type = supported_op_types(quantizable_op_type or DEFAULT_QUANTIZABLE_OP_TYPE)
+
+    params = inspect.signature(PostTrainingQuantization.__init__).parameters
+    if "batch_generator" in params:
+        data_args = {"batch_generator": calibration_generator(inference, examples, batch_size),
+                     "batch_nums": (len(examples) + batch_size - 1) // batch_size}
+    elif "sample_generator" in params:
+        # 1.7按batch_size重新组batch，并且丢掉最后不满的一个batch
+        batch_size = min(batch_size, len(examples))
+        data_args = {"sample_generator": calibration_generator(inference, examples, batch_size, per_sample=True),
+                     "batch_size": batch_size,
+                     "batch_nums": len(examples) // batch_size}
+    else:
+        raise ImportError("PostTrainingQuantization of paddle %s takes neither batch_generator nor "
+                          "sample_generator, paddle>=1.8 is required" % paddle.__version__)
+
+    place = fluid.CPUPlace()
+    exe = fluid.Executor(place)
+    scope = fluid.global_scope()
+    ptq = PostTrainingQuantization(executor=exe,
+                                   model_dir=model_path,
+                                   model_filename="model",
+                                   params_filename="params",
+                                   algo=algo,
+                                   quantizable_op_type=quantizable_op_type,
+                                   **data_args)
+    ptq.quantize()
+
+    # 各版本save_quantized_model保存的文件名不同，存到临时目录再按model/params的文件名重新保存
+    tmp_dir = tempfile.mkdtemp(prefix="senta_quant_")
+    try:
+        ptq.save_quantized_model(tmp_dir)
+        program, feed_names, fetch_targets = fluid.io.load_inference_model(tmp_dir, exe)
+        program, converted = convert_to_mkldnn_int8(program, scope, place, quantizable_op_type)
+        if not os.path.exists(output_path):
+            os.makedirs(output_path)
+        fluid.io.save_inference_model(output_path, feed_names, fetch_targets, exe, main_program=program,
+                                      model_filename="model", params_filename="params")
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+    return converted, quantizable_op_type
+
+
+def accuracy(results, labels):
+    """
+    :return: 分类的准确率，没有label时返回None
+    """
+    if not labels or any(label is None for label in labels):
+        return None
+    preds = [int(np.argmax(result)) for result in results]
+    return float(np.mean([pred == int(label) for pred, label in zip(preds, labels)]))
+
+
+def agreement(results, reference, seq_lab=False):
+    """
+    :param seq_lab: 序列标注的结果，整条label序列相同才算一致
+    :return: 两组预测结果一致的比例，分类比较argmax
+    """
+    if seq_lab:
+        same = [list(a) == list(b) for a, b in zip(results, reference)]
+    else:
+        same = [int(np.argmax(a)) == int(np.argmax(b)) for a, b in zip(results, reference)]
+    return float(np.mean(same)) if same else 0.0
+
+
+def split_examples(inference, calib_samples, eval_samples, calib_data_path=None):
+    """校准和对比用的样本不重叠：没有calib_data_path时，取predict_reader输入的前calib_samples条校准，
+    紧接着的eval_samples条对比；有calib_data_path时从它读校准样本，predict_reader输入的前eval_samples条对比
+    :param inference: Inference，predict_reader的输入应该指向dev集
+    :param calib_samples: 校准的样本数
+    :param eval_samples: 对比的样本数
+    :param calib_data_path: 校准数据的目录，格式与predict_reader的输入相同，None表示与对比共用dev集
+    :return: (calib_examples, eval_examples, split)，split记录两部分样本的目录和[起, 止)下标，写进报告
+    """
+    predict_reader = inference.data_set_reader.predict_reader
+    eval_data_path = predict_reader.config.data_path
+    if calib_data_path:
+        predict_reader.config.data_path = calib_data_path
+        try:
+            calib_examples = read_examples(inference, calib_samples)
+        finally:
+            predict_reader.config.data_path = eval_data_path
+        eval_examples = read_examples(inference, eval_samples)
+        eval_start = 0
+    else:
+        examples = read_examples(inference, calib_samples + eval_samples)
+        calib_examples = examples[:calib_samples]
+        eval_examples = examples[calib_samples:]
+        eval_start = len(calib_examples)
+    if not calib_examples:
+        raise ValueError("no calibration data found in %s" % (calib_data_path or eval_data_path))
+    if not eval_examples:
+        raise ValueError("no evaluation data left in %s after the first %d calibration examples, "
+                         "use a larger dev set or a separate calib_data_path" % (eval_data_path, len(calib_examples)))
+    split = {"calib_data_path": calib_data_path or eval_data_path,
+             "calib_range": [0, len(calib_examples)],
+             "eval_data_path": eval_data_path,
+             "eval_range": [eval_start, eval_start + len(eval_examples)]}
+    return calib_examples, eval_examples, split
+
+
+def run_quantization(inference, output_path, calib_samples=256, calib_batch_size=16, eval_samples=1000,
+                     algo="KL", quantizable_op_type=None, repeat=1, calib_data_path=None):
+    """量化inference的模型，并在inference的predict_reader输入（应该指向dev集）上对比FP32和INT8，
+    校准和对比的样本见split_examples
+    :param inference: 加载了FP32模型的Inference
+    :param output_path: INT8模型的目录
+    :param calib_samples: 校准的样本数
+    :param calib_batch_size: 校准的batch_size
+    :param eval_samples: 对比准确率和速度的样本数
+    :param repeat: 计时的轮数
+    :param calib_data_path: 校准数据的目录，None表示用dev集里对比样本之前的部分
+    :return: dict，写在output_path/quantization_report.json
+    """
+    model_path = inference.param["inference_model_path"]
+    predict_reader = inference.data_set_reader.predict_reader
+    calib_examples, eval_examples, split = split_examples(inference, calib_samples, eval_samples, calib_data_path)
+    converted, quantized_op_type = quantize_model(model_path, output_path, inference, calib_examples,
+                                                  calib_batch_size, algo, quantizable_op_type)
+    # 输入的契约不变
+    shutil.copy(os.path.join(model_path, "infer_data_params.json"),
+                os.path.join(output_path, "infer_data_params.json"))
+    save_tuning_profile(output_path, dict(INT8_CPU_PROFILE))
+
+    labels = [getattr(example, "label", None) for example in eval_examples]
+    samples = list(predict_reader.prepare_batch_data(eval_examples, predict_reader.config.batch_size))
+    inference.inference = inference.load_inference_model(model_path, False, inference.zero_copy)
+    fp32_ms, fp32_results = time_candidate(inference, samples, repeat)
+    inference.inference = inference.load_inference_model(output_path, False, inference.zero_copy,
+                                                         profile=INT8_CPU_PROFILE)
+    int8_ms, int8_results = time_candidate(inference, samples, repeat)
+
+    seq_lab = inference.param.get("inference_type") == 'seq_lab'
+    # 序列标注的label是标签序列，只比较两个模型的一致性
+    fp32_accuracy = None if seq_lab else accuracy(fp32_results, labels)
+    int8_accuracy = None if seq_lab else accuracy(int8_results, labels)
+    report = {"algo": algo,
+              "quantizable_op_type": quantized_op_type,
+              "mkldnn_int8": converted,
+              "calib_samples": len(calib_examples),
+              "eval_samples": len(eval_examples),
+              "split": split,
+              "fp32_accuracy": fp32_accuracy,
+              "int8_accuracy": int8_accuracy,
+              "accuracy_delta": int8_accuracy - fp32_accuracy if fp32_accuracy is not None else None,
+              "agreement": agreement(int8_results, fp32_results, seq_lab),
+              "max_prob_diff": max_result_diff(int8_results, fp32_results),
+              "fp32_ms_per_example": fp32_ms,
+              "int8_ms_per_example": int8_ms,
+              "speedup": fp32_ms / int8_ms if int8_ms else 0.0}
+    with open(os.path.join(output_path, "quantization_report.json"), "w") as fw:
+        json.dump(report, fw, indent=2, sort_keys=True)
+    return report
@@ -0,0 +1,329 @@
+# -*- coding: utf-8 -*
+"""
+离线预测结果的写出格式，inference参数"output_format"：
+    "tsv": 默认，每条样本一行：qid \t pred \t [score, ...]，序列标注是qid \t label label ...
+    "npy": test_save是一个目录，每一列存成一个.npy文件，可以用np.load(..., mmap_mode="r")或load_results直接映射：
+           分类：qid.npy (N,) int64, pred.npy (N,) int64, probs.npy (N, num_labels) float32
+           序列标注：qid.npy (N,) int64, lengths.npy (N,) int64, labels.npy (sum(lengths),) int64，
+           第i条的label id是labels[offsets[i]: offsets[i] + lengths[i]]，offsets = cumsum(lengths) - lengths
+"""
+import logging
+import os
+
+import numpy as np
+from numpy.lib import format as npy_format
+
+# 预留的.npy文件头长度，写完之后原地改写shape，不用挪动数据
+NPY_HEADER_SIZE = 128
+NPY_MAGIC = b"\x93NUMPY\x01\x00"
+
+
+class TsvResultWriter(object):
+    """TsvResultWriter: 把每个batch的结果格式化成行写进test_save
+    """
+
+    def __init__(self, path, format_fn):
+        """
+        :param path: 结果文件
+        :param format_fn: format_fn(batch_result, qid)返回这个batch的行，即Inference.format_batch_result
+        """
+        self.path = path
+        self.format_fn = format_fn
+        self.fw = None
+
+    def open(self, position=None):
+        """
+        :param position: 续跑时上次记录的position()，之后写的内容丢掉；None表示从头写
+        :return:
+        """
+        if position is None:
+            self.fw = open(self.path, "w")
+            return
+        self.fw = open(self.path, "r+")
+        self.fw.seek(position["output_bytes"])
+        self.fw.truncate()
+
+    def valid(self, position):
+        """
+        :return: 结果文件里是否还有position记录的全部内容
+        """
+        return os.path.exists(self.path) and os.path.getsize(self.path) >= position["output_bytes"]
+
+    def write(self, batch_result, qid):
+        """
+        :param batch_result: run_batch的结果
+        :param qid: 这个batch第一条样本的qid
+        :return: 写了多少条样本
+        """
+        lines = self.format_fn(batch_result, qid)
+        self.fw.writelines(lines)
+        return len(lines)
+
+    def sync(self):
+        """把已经写的内容落盘"""
+        self.fw.flush()
+        os.fsync(self.fw.fileno())
+
+    def position(self):
+        """
+        :return: 可以json序列化的当前写到的位置，传给open可以回到这里
+        """
+        return {"output_bytes": self.fw.tell()}
+
+    def close(self):
+        """
+        :return:
+        """
+        if self.fw is not None:
+            self.fw.close()
+            self.fw = None
+
+
+class NpyColumn(object):
+    """NpyColumn: 边写边追加的.npy文件。文件头预留NPY_HEADER_SIZE字节，数据直接追加在后面，
+    close时把真实的行数写回文件头，写完的文件就是标准的.npy，可以mmap
+    """
+
+    def __init__(self, path, dtype, row_shape=None):
+        """
+        :param path: .npy文件
+        :param dtype: 元素类型
+        :param row_shape: 每一行的shape，如probs的(num_labels,)，一行都没有写时文件头也有正确的维数；
+                          None表示由第一次append决定
+        """
+        self.path = path
+        self.dtype = np.dtype(dtype)
+        self.initial_row_shape = tuple(row_shape) if row_shape is not None else None
+        self.row_shape = self.initial_row_shape
+        self.rows = 0
+        self.fw = None
+
+    def open(self, rows=None):
+        """
+        :param rows: 续跑时保留的行数，之后的数据丢掉；None或0表示从头写，第一次append时才创建文件
+        :return:
+        """
+        self.rows = 0
+        if not rows:
+            self.row_shape = self.initial_row_shape
+            if os.path.exists(self.path):
+                os.remove(self.path)
+            return
+        self.row_shape = self.read_shape()[1:]
+        self.fw = open(self.path, "r+b")
+        self.fw.seek(NPY_HEADER_SIZE + rows * self.row_bytes())
+        self.fw.truncate()
+        self.rows = rows
+
+    def read_shape(self):
+        """
+        :return: 文件头里的shape
+        """
+        with open(self.path, "rb") as f:
+            npy_format.read_magic(f)
+            shape, _, _ = npy_format.read_array_header_1_0(f)
+        return shape
+
+    def row_bytes(self):
+        """
+        :return: 一行占的字节数
+        """
+        return int(np.prod(self.row_shape, dtype="int64")) * self.dtype.itemsize
+
+    def valid(self, rows):
+        """
+        :return: 文件里是否还有前rows行的数据
+        """
+        if not os.path.exists(self.path):
+            return rows == 0
+        try:
+            self.row_shape = self.read_shape()[1:]
+        except ValueError:
+            return False
+        return os.path.getsize(self.path) >= NPY_HEADER_SIZE + rows * self.row_bytes()
+
+    def append(self, array):
+        """
+        :param array: 第一维是行的数组，其余维度每次必须相同
+        :return:
+        """
+        array = np.ascontiguousarray(array, dtype=self.dtype)
+        if self.fw is None and self.row_shape is None:
+            self.row_shape = array.shape[1:]
+        if array.shape[1:] != self.row_shape:
+            raise ValueError("%s expects rows of shape %s, got %s" % (self.path, self.row_shape, array.shape[1:]))
+        if self.fw is None:
+            self.fw = open(self.path, "wb")
+            self.fw.write(self.header())
+        self.fw.write(array.tobytes())
+        self.rows += array.shape[0]
+
+    def header(self):
+        """
+        :return: NPY_HEADER_SIZE字节的1.0版.npy文件头
+        """
+        shape = (self.rows,) + tuple(self.row_shape or ())
+        header = "{'descr': %r, 'fortran_order': False, 'shape': %r, }" \
+                 % (npy_format.dtype_to_descr(self.dtype), shape)
+        header_len = NPY_HEADER_SIZE - len(NPY_MAGIC) - 2
+        header = header.ljust(header_len - 1) + "\n"
+        return NPY_MAGIC + np.uint16(header_len).tobytes() + header.encode("latin1")
+
+    def sync(self):
+        """把已经写的数据落盘"""
+        if self.fw is not None:
+            self.fw.flush()
+            os.fsync(self.fw.fileno())
+
+    def close(self):
+        """把行数写回文件头"""
+        if self.fw is None:
+            # 一行都没有写过也留下一个合法的空文件
+            self.fw = open(self.path, "wb")
+            self.fw.write(self.header())
+        self.fw.seek(0)
+        self.fw.write(self.header())
+        self.fw.close()
+        self.fw = None
+
+
+class NpyResultWriter(object):
+    """NpyResultWriter: 按列把结果写成一组.npy文件，不再把每个概率格式化成字符串，下游可以直接mmap读取
+    """
+
+    def __init__(self, path, inference_type=None, num_labels=None):
+        """
+        :param path: 结果目录
+        :param inference_type: 'seq_lab'时写序列标注的列，其他都按分类写
+        :param num_labels: 分类的类别数，即probs每行的长度。一条结果都没有时probs.npy的shape也是(0, num_labels)；
+                           None时由第一个batch决定，没有结果时是(0,)
+        """
+        self.path = path
+        self.seq_lab = inference_type == 'seq_lab'
+        if self.seq_lab:
+            dtypes = [("qid", "int64", ()), ("lengths", "int64", ()), ("labels", "int64", ())]
+        else:
+            probs_shape = (num_labels,) if num_labels else None
+            dtypes = [("qid", "int64", ()), ("pred", "int64", ()), ("probs", "float32", probs_shape)]
+        self.columns = [(name, NpyColumn(os.path.join(path, name + ".npy"), dtype, row_shape))
+                        for name, dtype, row_shape in dtypes]
+
+    def open(self, position=None):
+        """
+        :param position: 续跑时上次记录的position()；None表示从头写
+        :return:
+        """
+        if not os.path.isdir(self.path):
+            os.makedirs(self.path)
+        for name, column in self.columns:
+            column.open(None if position is None else position["rows"][name])
+
+    def valid(self, position):
+        """
+        :return: 各列是否还有position记录的全部数据
+        """
+        return all(column.valid(position["rows"][name]) for name, column in self.columns)
+
+    def write(self, batch_result, qid):
+        """
+        :param batch_result: run_batch的结果
+        :param qid: 这个batch第一条样本的qid
+        :return: 写了多少条样本
+        """
+        num = len(batch_result)
+        if not num:
+            return 0
+        columns = {"qid": np.arange(qid, qid + num, dtype="int64")}
+        if self.seq_lab:
+            columns["lengths"] = np.array([len(label) for label in batch_result], dtype="int64")
+            columns["labels"] = np.concatenate([np.asarray(label, dtype="int64").reshape([-1])
+                                                for label in batch_result])
+        else:
+            probs = np.asarray(batch_result, dtype="float32")
+            columns["pred"] = probs.argmax(axis=1)
+            columns["probs"] = probs
+        self.write_columns(columns)
+        return num
+
+    def write_columns(self, columns):
+        """
+        :param columns: dict，列名 -> 追加到这一列的数组，各列的行数可以不同（如labels）
+        :return:
+        """
+        for name, column in self.columns:
+            column.append(columns[name])
+
+    def sync(self):
+        """把已经写的数据落盘"""
+        for _, column in self.columns:
+            column.sync()
+
+    def position(self):
+        """
+        :return: 各列的行数
+        """
+        return {"rows": dict((name, column.rows) for name, column in self.columns)}
+
+    def close(self):
+        """
+        :return:
+        """
+        for _, column in self.columns:
+            column.close()
+
+
+def build_result_writer(output_format, path, format_fn, inference_type=None, num_labels=None):
+    """
+    :param output_format: "tsv"或"npy"
+    :param path: test_save
+    :param format_fn: tsv格式用的Inference.format_batch_result
+    :param inference_type: inference参数里的inference_type
+    :param num_labels: npy格式分类结果probs每行的长度，见NpyResultWriter
+    :return: TsvResultWriter或NpyResultWriter
+    """
+    if output_format == "tsv":
+        return TsvResultWriter(path, format_fn)
+    if output_format == "npy":
+        return NpyResultWriter(path, inference_type, num_labels)
+    raise ValueError("unknown output_format %s, expected tsv or npy" % output_format)
+
+
+def load_results(path, mmap_mode="r"):
+    """读取output_format为npy的结果
+    :param path: 结果目录
+    :param mmap_mode: 传给np.load，None表示全部读进内存
+    :return: dict，列名 -> 数组
+    """
+    results = {}
+    for file_name in sorted(os.listdir(path)):
+        if file_name.endswith(".npy"):
+            results[file_name[:-len(".npy")]] = np.load(os.path.join(path, file_name), mmap_mode=mmap_mode)
+    return results
+
+
+def merge_npy_results(part_paths, path, inference_type=None, chunk_rows=1 << 16):
+    """按顺序合并多个npy结果目录，qid重新从0编号；probs的列宽取自各片的probs.npy，全都没有结果时也是二维的
+    :param part_paths: 各片的结果目录
+    :param path: 合并后的结果目录
+    :param chunk_rows: 每次拷贝的行数，合并时不需要把整片读进内存
+    :return: 合并的样本数
+    """
+    parts = [load_results(part_path) for part_path in part_paths]
+    num_labels = None
+    for part in parts:
+        if "probs" in part and part["probs"].ndim == 2:
+            num_labels = part["probs"].shape[1]
+            break
+    writer = NpyResultWriter(path, inference_type, num_labels)
+    writer.open()
+    num_examples = 0
+    for part_path, part in zip(part_paths, parts):
+        num = len(part["qid"])
+        for name, column in writer.columns:
+            array = np.arange(num_examples, num_examples + num, dtype="int64") if name == "qid" else part[name]
+            for start in range(0, len(array), chunk_rows):
+                column.append(array[start: start + chunk_rows])
+        num_examples += num
+        logging.debug("merged %s: %d results" % (part_path, num))
+    writer.close()
+    return num_examples
@@ -0,0 +1,230 @@
+# -*- coding: utf-8 -*
+"""
+:py:class:`InferenceService` 和一个基于标准库的本地HTTP预测服务
+
+POST /predict  {"texts": ["..."], "aspects": ["..."]}  或  {"instances": [{"text_a": "...", "text_b": "..."}]}
+GET  /metrics  排队数、batch大小分布、各阶段耗时
+GET  /health
+"""
+import asyncio
+import json
+import logging
+import threading
+import time
+
+from six.moves import BaseHTTPServer, socketserver
+
+from senta.data.util_helper import split_batch_by_length
+from senta.inference.async_batcher import AsyncBatcher
+from senta.inference.metrics import Histogram
+
+BATCH_SIZE_BOUNDS = [1, 2, 4, 8, 16, 32, 64, 128, 256]
+
+
+class InferenceService(object):
+    """InferenceService: 把并发的单条请求交给AsyncBatcher攒batch，batch内再按文本长度分桶，然后调用Inference预测
+    """
+
+    def __init__(self, inference, max_batch_size=32, max_wait_ms=5, bucket_bounds=None):
+        """
+        :param inference: senta.inference.inference.Inference
+        :param max_batch_size: 一个batch最多的样本数
+        :param max_wait_ms: batch里第一条样本最多等待的毫秒数
+        :param bucket_bounds: 按字符数分桶的上界，None表示不分桶
+        """
+        self.inference = inference
+        self.bucket_bounds = bucket_bounds
+        self.inference_type = inference.param.get("inference_type")
+        self.batcher = AsyncBatcher(self.predict_batch, max_batch_size=max_batch_size,
+                                    max_wait_ms=max_wait_ms, num_workers=1)
+        self.batch_size = Histogram(BATCH_SIZE_BOUNDS)
+        self.stage_latency = {"queue": Histogram(),
+                              "prepare": Histogram(),
+                              "predict": Histogram(),
+                              "postprocess": Histogram(),
+                              "request": Histogram()}
+        self.num_requests = 0
+        self.num_errors = 0
+        # http线程并发地计数，+=不是原子的
+        self._lock = threading.Lock()
+
+        self.loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._run_loop, name="inference-service-loop")
+        self._thread.daemon = True
+        self._thread.start()
+
+    def _run_loop(self):
+        """后台线程里跑event loop"""
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_forever()
+
+    def predict(self, instances):
+        """线程安全，可以被多个http线程同时调用
+        :param instances: list of dict，见Inference.prepare_examples
+        :return: list，与instances一一对应的结果
+        """
+        begin_time = time.time()
+        futures = [asyncio.run_coroutine_threadsafe(self.batcher.predict((instance, begin_time)), self.loop)
+                   for instance in instances]
+        results = [future.result() for future in futures]
+        self.stage_latency["request"].observe((time.time() - begin_time) * 1000)
+        return results
+
+    def predict_batch(self, items):
+        """AsyncBatcher的predict_fn，在worker线程里执行
+        :param items: list of (instance, 入队时间)
+        :return: list，与items一一对应的结果
+        """
+        start_time = time.time()
+        for _, enqueue_time in items:
+            self.stage_latency["queue"].observe((start_time - enqueue_time) * 1000)
+        self.batch_size.observe(len(items))
+
+        instances = [instance for instance, _ in items]
+        lengths = [sum(len(value) for key, value in instance.items() if key.startswith("text_"))
+                   for instance in instances]
+        results = [None] * len(instances)
+        for batch_index in split_batch_by_length(lengths, self.bucket_bounds, None):
+            begin_time = time.time()
+            samples = self.inference.prepare_examples([instances[i] for i in batch_index])
+            prepare_time = time.time()
+            batch_result = []
+            for sample in samples:
+                batch_result.extend(self.inference.run_batch(sample))
+            predict_time = time.time()
+            for i, item_result in zip(batch_index, batch_result):
+                results[i] = self.format_result(item_result)
+            end_time = time.time()
+
+            self.stage_latency["prepare"].observe((prepare_time - begin_time) * 1000)
+            self.stage_latency["predict"].observe((predict_time - prepare_time) * 1000)
+            self.stage_latency["postprocess"].observe((end_time - predict_time) * 1000)
+        return results
+
+    def format_result(self, item_result):
+        """
+        :param item_result: parse_predict_result产出的一条结果
+        :return: 可以json序列化的dict
+        """
+        if self.inference_type == 'seq_lab':
+            return {"labels": [self.inference.label_map[l] for l in item_result]}
+        return {"label": int(item_result.argmax()), "probs": item_result.tolist()}
+
+    def count_request(self):
+        """/predict收到一个请求"""
+        with self._lock:
+            self.num_requests += 1
+
+    def count_error(self):
+        """/predict的一个请求失败"""
+        with self._lock:
+            self.num_errors += 1
+
+    def metrics(self):
+        """
+        :return: dict，/metrics接口的内容
+        """
+        batcher_stats = self.batcher.stats()
+        with self._lock:
+            num_requests, num_errors = self.num_requests, self.num_errors
+        return {"num_requests": num_requests,
+                "num_errors": num_errors,
+                "queue_depth": batcher_stats["queue_depth"],
+                "num_batches": batcher_stats["num_batches"],
+                "batch_size": self.batch_size.to_dict(),
+                "latency_ms": dict((stage, hist.to_dict()) for stage, hist in self.stage_latency.items())}
+
+
+def parse_instances(body):
+    """把/predict的请求体转成instances
+    :param body: dict
+    :return: list of dict
+    """
+    if "instances" in body:
+        return body["instances"]
+    texts = body.get("texts")
+    if texts is None:
+        raise ValueError("request must contain 'texts' or 'instances'")
+    aspects = body.get("aspects")
+    if aspects is None:
+        return [{"text_a": text} for text in texts]
+    if len(aspects) != len(texts):
+        raise ValueError("texts and aspects must have the same length")
+    return [{"text_a": text, "text_b": aspect} for text, aspect in zip(texts, aspects)]
+
+
+def build_handler(service):
+    """
+    :param service: InferenceService
+    :return: 绑定了service的BaseHTTPRequestHandler子类
+    """
+
+    class InferenceHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+        """InferenceHandler"""
+
+        def do_GET(self):
+            """GET /metrics, /health"""
+            if self.path == "/metrics":
+                self._reply(200, service.metrics())
+            elif self.path == "/health":
+                self._reply(200, {"status": "ok"})
+            else:
+                self._reply(404, {"error": "not found: %s" % self.path})
+
+        def do_POST(self):
+            """POST /predict"""
+            if self.path != "/predict":
+                self._reply(404, {"error": "not found: %s" % self.path})
+                return
+            service.count_request()
+            try:
+                length = int(self.headers.get("Content-Length", 0))
+                body = json.loads(self.rfile.read(length).decode("utf-8"))
+                instances = parse_instances(body)
+            except Exception as e:
+                service.count_error()
+                self._reply(400, {"error": str(e)})
+                return
+            try:
+                results = service.predict(instances)
+            except Exception as e:
+                service.count_error()
+                logging.error("predict failed: %s" % e)
+                self._reply(500, {"error": str(e)})
+                return
+            self._reply(200, {"results": results})
+
+        def _reply(self, code, content):
+            """返回json"""
+            data = json.dumps(content, ensure_ascii=False).encode("utf-8")
+            self.send_response(code)
+            self.send_header("Content-Type", "application/json; charset=utf-8")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def log_message(self, format, *args):
+            """访问日志走logging"""
+            logging.debug("%s - %s" % (self.address_string(), format % args))
+
+    return InferenceHandler
+
+
+class ThreadingHTTPServer(socketserver.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    """每个连接一个线程的HTTPServer"""
+    daemon_threads = True
+
+
+def run_server(service, host="0.0.0.0", port=8866):
+    """启动http服务，阻塞直到进程退出
+    :param service: InferenceService
+    :param host:
+    :param port:
+    :return:
+    """
+    server = ThreadingHTTPServer((host, port), build_handler(service))
+    logging.info("inference server listening on %s:%d" % (host, port))
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
@@ -0,0 +1,183 @@
+# -*- coding: utf-8 -*
+"""
+多进程离线预测：把predict_reader的输入按字节切成num_workers片，每个进程各自加载一个predictor预测一片，
+最后按原始顺序合并成test_save，qid与单进程预测完全一致。inference参数：
+    "num_workers": 进程数，大于1时打开
+    "cpu_threads": 每个进程里predictor的计算线程数
+    "resume": 保留上次失败留下的分片目录，每个进程从自己的checkpoint续跑
+"""
+import copy
+import logging
+import multiprocessing
+import os
+import shutil
+import time
+
+from senta.common import register
+from senta.common.register import RegisterSet
+from senta.data.data_set import DataSet
+from senta.inference.inference import Inference
+from senta.inference.result_writer import merge_npy_results
+from senta.utils import log
+
+
+def plan_shards(data_path, num_shards, has_header):
+    """按字节数把data_path下的文件均分成num_shards片，切分点对齐到行尾，文件顺序与data_generator一致
+    :param data_path: predict_reader的数据目录
+    :param num_shards: 片数
+    :param has_header: 每个文件的第一行是否是表头，表头不参与切分
+    :return: (shards, header)，shards[i]是第i片的(文件, 起始字节, 结束字节)列表，header是表头行，没有表头时为None
+    """
+    files = []
+    header = None
+    for name in os.listdir(data_path):
+        file_path = os.path.join(data_path, name)
+        start = 0
+        if has_header:
+            with open(file_path, "rb") as f:
+                file_header = f.readline()
+                start = f.tell()
+            if header is not None and file_header != header:
+                raise ValueError("all files in %s must share one header, %s differs" % (data_path, name))
+            header = file_header
+        files.append((file_path, start, os.path.getsize(file_path)))
+
+    total = sum(end - start for _, start, end in files)
+    shards = [[] for _ in range(num_shards)]
+    shard_id = 0
+    consumed = 0
+    for file_path, start, end in files:
+        with open(file_path, "rb") as f:
+            while start < end:
+                boundary = total * (shard_id + 1) // num_shards
+                if shard_id == num_shards - 1 or consumed + (end - start) <= boundary:
+                    shards[shard_id].append((file_path, start, end))
+                    consumed += end - start
+                    break
+                if boundary > consumed:
+                    # 从切分点读到行尾，这一行归当前片
+                    f.seek(start + boundary - consumed)
+                    f.readline()
+                    split = min(f.tell(), end)
+                    shards[shard_id].append((file_path, start, split))
+                    consumed += split - start
+                    start = split
+                shard_id += 1
+    return shards, header
+
+
+def write_shard_input(ranges, header, output_file):
+    """把一片的各个字节区间拼成一个文件，有表头时写在最前面"""
+    with open(output_file, "wb") as fw:
+        if header is not None:
+            fw.write(header)
+        for file_path, start, end in ranges:
+            with open(file_path, "rb") as f:
+                f.seek(start)
+                remaining = end - start
+                chunk = b""
+                while remaining > 0:
+                    chunk = f.read(min(remaining, 1 << 20))
+                    if not chunk:
+                        break
+                    fw.write(chunk)
+                    remaining -= len(chunk)
+                if chunk and not chunk.endswith(b"\n"):
+                    # 文件最后一行没有换行符，补上，免得和下一个区间连成一行
+                    fw.write(b"\n")
+
+
+def merge_shard_outputs(part_files, test_save):
+    """按片的顺序合并各进程的结果，把每片从0开始的qid改成全局的qid
+    :return: 合并的行数
+    """
+    qid = 0
+    with open(test_save, "w") as fw:
+        for part_file in part_files:
+            with open(part_file, "r") as fr:
+                for line in fr:
+                    fw.write(str(qid) + line[line.index("\t"):])
+                    qid += 1
+    return qid
+
+
+def run_worker(params_dict, shard_id, log_dir):
+    """子进程入口：用自己那一片的数据和结果文件构造Inference并预测"""
+    log.init_log(os.path.join(log_dir, "infer-shard-%d" % shard_id), level=logging.INFO)
+    register.import_modules()
+    dataset_reader = DataSet(params_dict.get("dataset_reader"))
+    dataset_reader.build()
+    model_params_dict = params_dict.get("model")
+    model = RegisterSet.models.__getitem__(model_params_dict.get("type"))(model_params_dict)
+    inference = Inference(param=params_dict.get("inference"), data_set_reader=dataset_reader, model_class=model)
+    begin_time = time.time()
+    inference.do_inference()
+    logging.info("shard %d done in %.2fs" % (shard_id, time.time() - begin_time))
+
+
+def run_sharded_inference(params_dict, num_workers, log_dir="./log"):
+    """
+    :param params_dict: 完整的预测配置，与infer.py读入的相同
+    :param num_workers: 进程数
+    :param log_dir: 每个进程的日志写到log_dir/infer-shard-i.log
+    :return:
+    """
+    inference_params = params_dict.get("inference")
+    reader_params = params_dict.get("dataset_reader").get("predict_reader")
+    test_save = inference_params.get("test_save")
+    output_format = inference_params.get("output_format", "tsv")
+    if os.path.dirname(test_save) and not os.path.exists(os.path.dirname(test_save)):
+        os.makedirs(os.path.dirname(test_save))
+    shard_dir = test_save + ".shards"
+    if os.path.exists(shard_dir) and not inference_params.get("resume", False):
+        shutil.rmtree(shard_dir)
+
+    reader_class = RegisterSet.data_set_reader.__getitem__(reader_params.get("type"))
+    shards, header = plan_shards(reader_params.get("config").get("data_path"), num_workers, reader_class.has_header)
+
+    begin_time = time.time()
+    # paddle不能在fork出来的子进程里安全地初始化，用spawn
+    context = multiprocessing.get_context("spawn")
+    processes = []
+    part_files = []
+    for shard_id, ranges in enumerate(shards):
+        if not ranges:
+            continue
+        input_dir = os.path.join(shard_dir, "input-%d" % shard_id)
+        if not os.path.exists(input_dir):
+            os.makedirs(input_dir)
+        # 数据和进程数不变时切分结果不变，重写出的分片输入与上次相同，checkpoint的指纹仍然有效
+        write_shard_input(ranges, header, os.path.join(input_dir, "part"))
+        part_file = os.path.join(shard_dir, "output-%d" % shard_id)
+        if output_format == "tsv":
+            part_file += ".tsv"
+        part_files.append(part_file)
+
+        worker_params = copy.deepcopy(params_dict)
+        worker_params["dataset_reader"]["predict_reader"]["config"]["data_path"] = input_dir
+        worker_params["inference"]["test_save"] = part_file
+        if inference_params.get("profile_report"):
+            # 每个进程各写一份耗时统计
+            worker_params["inference"]["profile_report"] = "%s.shard-%d" % (inference_params["profile_report"],
+                                                                             shard_id)
+        process = context.Process(target=run_worker, args=(worker_params, shard_id, log_dir),
+                                  name="infer-shard-%d" % shard_id)
+        process.start()
+        processes.append(process)
+
+    failed = []
+    for process in processes:
+        process.join()
+        if process.exitcode != 0:
+            failed.append(process.name)
+    if failed:
+        raise RuntimeError("inference workers failed: %s, partial results are kept in %s"
+                           % (", ".join(failed), shard_dir))
+
+    if output_format == "npy":
+        num_lines = merge_npy_results(part_files, test_save, inference_params.get("inference_type"))
+    else:
+        num_lines = merge_shard_outputs(part_files, test_save)
+    shutil.rmtree(shard_dir)
+    logging.info("sharded inference: %d workers, %d results, total_time:%.2fs"
+                 % (len(processes), num_lines, time.time() - begin_time))
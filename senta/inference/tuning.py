@@ -0,0 +1,231 @@
+# -*- coding: utf-8 -*
+"""
+CPU预测参数的自动调优。tune.py在一份真实输入的样本上，对保存好的inference_step_*目录按网格测试：
+    cpu_threads: 数学库线程数
+    analysis_predictor: 用AnalysisPredictor（ir优化、mkldnn等选项才生效）还是默认的NativePredictor
+    ir_optim / memory_optim / use_mkldnn / mkldnn_cache_capacity: AnalysisPredictor的选项
+    batch_size
+把每条样本耗时最少、且预测结果与默认配置一致的组合写到infer_data_params.json旁边的cpu_tuning_profile.json，
+Inference和Senta加载CPU模型时自动读取。选项和batch_size是一起选的：Senta.predict不指定batch_size时用profile的
+batch_size和对应的选项；Inference的batch_size由配置里的predict_reader决定，所以profile里还按batch_size记录了
+各自最快的选项（by_batch_size），Inference用配置的batch_size对应的那一组，见select_profile
+"""
+import itertools
+import json
+import logging
+import multiprocessing
+import os
+import time
+
+import numpy as np
+
+TUNING_PROFILE_NAME = "cpu_tuning_profile.json"
+
+# 与没有调优时完全相同的配置：NativePredictor，打开mkldnn，其他都是默认值
+DEFAULT_CPU_PROFILE = {"analysis_predictor": False, "use_mkldnn": True}
+
+# 可以调的选项，写进profile的只有这些key和batch_size
+CPU_OPTION_KEYS = ["cpu_threads", "analysis_predictor", "ir_optim", "memory_optim", "use_mkldnn",
+                   "mkldnn_cache_capacity"]
+
+
+def load_tuning_profile(model_path):
+    """
+    :param model_path: inference_model_path
+    :return: cpu_tuning_profile.json的内容，没有时返回None
+    """
+    profile_path = os.path.join(model_path, TUNING_PROFILE_NAME)
+    if not os.path.exists(profile_path):
+        return None
+    try:
+        with open(profile_path, "r") as fr:
+            return json.load(fr)
+    except ValueError:
+        logging.warning("broken tuning profile %s is ignored" % profile_path)
+        return None
+
+
+def save_tuning_profile(model_path, profile):
+    """先写临时文件再rename，加载方不会读到写了一半的profile
+    :param model_path: inference_model_path
+    :param profile: tune的结果
+    :return: profile的路径
+    """
+    profile_path = os.path.join(model_path, TUNING_PROFILE_NAME)
+    tmp_file = profile_path + ".tmp"
+    with open(tmp_file, "w") as fw:
+        json.dump(profile, fw, indent=2, sort_keys=True)
+    os.rename(tmp_file, profile_path)
+    return profile_path
+
+
+def select_profile(profile, batch_size):
+    """
+    :param profile: load_tuning_profile的结果
+    :param batch_size: 实际预测用的batch_size
+    :return: 选项换成profile["by_batch_size"]里这个batch_size最快的组合的profile；没有调过这个batch_size时
+             原样返回，即按profile["batch_size"]选出的选项
+    """
+    if profile is None:
+        return None
+    options = profile.get("by_batch_size", {}).get(str(batch_size))
+    if options is None:
+        if profile.get("batch_size") not in (None, batch_size):
+            logging.warning("batch_size %s was not tuned, use the options tuned for batch_size %s"
+                            % (batch_size, profile["batch_size"]))
+        return profile
+    selected = dict((key, value) for key, value in profile.items() if key not in CPU_OPTION_KEYS)
+    selected.update(options)
+    selected["batch_size"] = batch_size
+    return selected
+
+
+def configure_cpu(config, profile=None):
+    """按profile设置AnalysisConfig的CPU选项
+    :param config: AnalysisConfig
+    :param profile: load_tuning_profile的结果或一个网格点，None表示DEFAULT_CPU_PROFILE
+    :return: 是否应该用AnalysisPredictor，即create_paddle_predictor(config)而不是config.to_native_config()
+    """
+    if profile is None:
+        profile = DEFAULT_CPU_PROFILE
+    config.disable_gpu()
+    if profile.get("use_mkldnn", True):
+        config.enable_mkldnn()
+        if profile.get("mkldnn_cache_capacity") and hasattr(config, "set_mkldnn_cache_capacity"):
+            # paddle 1.7之前没有这个选项
+            config.set_mkldnn_cache_capacity(profile["mkldnn_cache_capacity"])
+    if profile.get("cpu_threads"):
+        config.set_cpu_math_library_num_threads(profile["cpu_threads"])
+    if "ir_optim" in profile:
+        config.switch_ir_optim(profile["ir_optim"])
+    if profile.get("memory_optim"):
+        config.enable_memory_optim()
+    return profile.get("analysis_predictor", False)
+
+
+def build_grid(cpu_threads, use_mkldnn=(True, False), ir_optim=(True, False), memory_optim=(False, True),
+               mkldnn_cache_capacity=(0,)):
+    """
+    :param cpu_threads: 要测试的线程数
+    :return: 网格点的list，NativePredictor不支持的选项不展开，避免重复测试
+    """
+    grid = []
+    for threads in cpu_threads:
+        grid.append({"cpu_threads": threads, "analysis_predictor": False, "use_mkldnn": True})
+        for mkldnn, ir, memory in itertools.product(use_mkldnn, ir_optim, memory_optim):
+            capacities = mkldnn_cache_capacity if mkldnn else (0,)
+            for capacity in capacities:
+                grid.append({"cpu_threads": threads, "analysis_predictor": True, "use_mkldnn": mkldnn,
+                             "ir_optim": ir, "memory_optim": memory, "mkldnn_cache_capacity": capacity})
+    return grid
+
+
+def read_examples(inference, num_samples):
+    """
+    :return: predict_reader输入里的前num_samples条样本
+    """
+    examples = []
+    for chunk in inference.iter_example_chunks():
+        examples.extend(chunk)
+        if len(examples) >= num_samples:
+            break
+    return examples[:num_samples]
+
+
+def time_candidate(inference, samples, repeat):
+    """
+    :param inference: 已经换好predictor的Inference
+    :param samples: 序列化好的batch
+    :param repeat: 计时的轮数，取最快的一轮
+    :return: (每条样本的毫秒数, 预测结果)
+    """
+    # 预热一轮，mkldnn的kernel和内存在第一次运行时创建
+    results = []
+    for sample in samples:
+        results.extend(inference.run_batch(sample))
+    num_examples = len(results)
+    best = None
+    for _ in range(repeat):
+        begin_time = time.time()
+        for sample in samples:
+            inference.run_batch(sample)
+        cost = time.time() - begin_time
+        best = cost if best is None else min(best, cost)
+    return best * 1000.0 / max(num_examples, 1), results
+
+
+def max_result_diff(results, reference):
+    """
+    :return: 两组预测结果的最大绝对误差
+    """
+    diff = 0.0
+    for result, expected in zip(results, reference):
+        diff = max(diff, float(np.max(np.abs(np.asarray(result, dtype="float64") -
+                                              np.asarray(expected, dtype="float64")))))
+    return diff
+
+
+def tune(inference, grid, batch_sizes, num_samples=256, repeat=3, tolerance=1e-3):
+    """在inference的predict_reader输入上测试grid里每个组合和每个batch_size
+    :param inference: senta.inference.inference.Inference
+    :param grid: build_grid的结果
+    :param batch_sizes: 要测试的batch_size，predict_reader配置的batch_size总会参与测试
+    :param num_samples: 参与测试的样本数
+    :param repeat: 每个组合计时的轮数
+    :param tolerance: 预测结果与默认配置的最大绝对误差超过它的组合不参与选择
+    :return: profile，最快组合的选项、batch_size、耗时，每个batch_size各自最快的选项（by_batch_size），
+             以及所有组合的测试结果
+    """
+    model_path = inference.param["inference_model_path"]
+    predict_reader = inference.data_set_reader.predict_reader
+    examples = read_examples(inference, num_samples)
+    if not examples:
+        raise ValueError("no input found in %s" % predict_reader.config.data_path)
+    batch_sizes = sorted(set(batch_sizes) | set([predict_reader.config.batch_size]))
+    samples_by_batch_size = dict((batch_size, list(predict_reader.prepare_batch_data(examples, batch_size)))
+                                 for batch_size in batch_sizes)
+
+    inference.inference = inference.load_inference_model(model_path, False, inference.zero_copy,
+                                                         profile=DEFAULT_CPU_PROFILE)
+    baseline_batch_size = predict_reader.config.batch_size
+    baseline_samples = list(predict_reader.prepare_batch_data(examples, baseline_batch_size))
+    baseline_ms, reference = time_candidate(inference, baseline_samples, repeat)
+    logging.info("baseline: batch_size %d, %.3f ms/example" % (baseline_batch_size, baseline_ms))
+
+    trials = []
+    best = None
+    best_by_batch_size = {}
+    for candidate in grid:
+        inference.inference = inference.load_inference_model(model_path, False, inference.zero_copy,
+                                                             profile=candidate)
+        for batch_size in batch_sizes:
+            ms_per_example, results = time_candidate(inference, samples_by_batch_size[batch_size], repeat)
+            diff = max_result_diff(results, reference)
+            trial = dict(candidate, batch_size=batch_size, ms_per_example=ms_per_example, max_diff=diff)
+            trials.append(trial)
+            logging.info("%s: %.3f ms/example, max diff %.2g" % (json.dumps(candidate, sort_keys=True),
+                                                                  ms_per_example, diff))
+            if diff > tolerance:
+                continue
+            if best is None or ms_per_example < best["ms_per_example"]:
+                best = trial
+            if batch_size not in best_by_batch_size or \
+                    ms_per_example < best_by_batch_size[batch_size]["ms_per_example"]:
+                best_by_batch_size[batch_size] = trial
+
+    if best is None:
+        raise ValueError("every candidate differs from the default config by more than %g" % tolerance)
+    profile = dict((key, best[key]) for key in CPU_OPTION_KEYS if key in best)
+    # json的key只能是字符串
+    by_batch_size = dict((str(batch_size), dict((key, trial[key]) for key in CPU_OPTION_KEYS + ["ms_per_example"]
+                                                if key in trial))
+                         for batch_size, trial in best_by_batch_size.items())
+    profile.update({"batch_size": best["batch_size"],
+                    "by_batch_size": by_batch_size,
+                    "ms_per_example": best["ms_per_example"],
+                    "baseline_ms_per_example": baseline_ms,
+                    "speedup": baseline_ms / best["ms_per_example"] if best["ms_per_example"] else 0.0,
+                    "num_samples": len(examples),
+                    "cpu_count": multiprocessing.cpu_count(),
+                    "trials": trials})
+    return profile
@@ -0,0 +1,55 @@
+# -*- coding: utf-8 -*
+"""
+:py:class:`ZeroCopyPredictor`
+"""
+from collections import namedtuple
+
+import numpy as np
+
+# 与PaddleTensor的用法保持一致：data是numpy数组，lod是list of list
+ZeroCopyOutput = namedtuple("ZeroCopyOutput", ["name", "data", "lod"])
+
+
+class ZeroCopyPredictor(object):
+    """ZeroCopyPredictor: 用zero_copy_run代替predictor.run(PaddleTensor list)。输入输出的tensor句柄只在创建时绑定一次，
+    每个batch把numpy数组直接拷进predictor预先分配好的输入tensor，输出直接读成numpy数组，省掉PaddleTensor的构造和
+    float_data()转成python list的开销。predictor必须由关掉了feed/fetch op的AnalysisConfig创建：
+        config.switch_use_feed_fetch_ops(False)
+        predictor = ZeroCopyPredictor(create_paddle_predictor(config))
+    """
+
+    def __init__(self, predictor):
+        """
+        :param predictor: create_paddle_predictor(AnalysisConfig)创建的predictor
+        """
+        self.predictor = predictor
+        self.input_names = predictor.get_input_names()
+        self.output_names = predictor.get_output_names()
+        self.input_tensors = [predictor.get_input_tensor(name) for name in self.input_names]
+        self.output_tensors = [predictor.get_output_tensor(name) for name in self.output_names]
+
+    def run(self, inputs):
+        """
+        :param inputs: numpy数组的list，顺序与模型的feed顺序一致，和predictor.run的输入相同
+        :return: ZeroCopyOutput的list，顺序与模型的fetch顺序一致
+        """
+        if len(inputs) != len(self.input_tensors):
+            raise ValueError("model has %d inputs, got %d" % (len(self.input_tensors), len(inputs)))
+        for tensor, ndarray in zip(self.input_tensors, inputs):
+            # copy_from_cpu要求内存连续，已经连续的数组不会再拷贝一次
+            ndarray = np.ascontiguousarray(ndarray)
+            tensor.reshape(ndarray.shape)
+            tensor.copy_from_cpu(ndarray)
+
+        self.predictor.zero_copy_run()
+
+        outputs = []
+        for name, tensor in zip(self.output_names, self.output_tensors):
+            outputs.append(ZeroCopyOutput(name, tensor.copy_to_cpu(), tensor.lod()))
+        return outputs
+
+    def clone(self):
+        """
+        :return: 共享权重的另一个ZeroCopyPredictor，有自己的输入输出tensor，供PredictorPool使用
+        """
+        return ZeroCopyPredictor(self.predictor.clone())
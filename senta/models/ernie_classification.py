@@ -181,8 +181,12 @@ class ErnieClassification(Model):
         """
 
         output = predict_result[0]
-        output_data = output.data.float_data()
-        batch_result = np.array(output_data).reshape((-1, 2))
+        if isinstance(output.data, np.ndarray):
+            # ZeroCopyPredictor的输出已经是numpy数组
+            batch_result = output.data.reshape((-1, 2))
+        else:
+            output_data = output.data.float_data()
+            batch_result = np.array(output_data).reshape((-1, 2))
         # for item_prob in batch_result:
         #    logging.info('\t'.join(map(str, item_prob.tolist())))
         return batch_result
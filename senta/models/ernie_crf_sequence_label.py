@@ -229,7 +229,11 @@ class ErnieCrfSeqLabel(Model):
         """
         output = predict_result[0]
         seq_lens = np.array(output.lod).reshape(-1)
-        output_data = output.data.int64_data()
+        if isinstance(output.data, np.ndarray):
+            # ZeroCopyPredictor的输出已经是numpy数组
+            output_data = output.data.reshape(-1).tolist()
+        else:
+            output_data = output.data.int64_data()
         start_index = 0
         batch_result = []
         for end_index in seq_lens[1:]:
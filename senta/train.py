@@ -3,11 +3,17 @@
 本文件定义了Senta类，实现其情感分类，训练模型的接口。
 """
 
+import hashlib
+import itertools
+import json
 import logging
 import os
 import shutil
 import tarfile
+import threading
 import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 
 import numpy as np
 import requests
@@ -17,8 +23,17 @@ from paddle.fluid.core import create_paddle_predictor
 from senta.common import register
 from senta.common.register import RegisterSet
 from senta.common.rule import InstanceName
+from senta.data.batch_assembler import BatchAssembler
 from senta.data.data_set import DataSet
-from senta.data.util_helper import convert_texts_to_ids, structure_fields_dict
+from senta.data.tokenizer.tokenization_cache import TokenizationCache
+from senta.inference.async_batcher import AsyncBatcher
+from senta.inference.metrics import LatencyProfiler, NullProfiler
+from senta.inference.model_registry import ModelRegistry
+from senta.inference.predictor_pool import PredictorPool
+from senta.inference.tuning import TUNING_PROFILE_NAME, configure_cpu, load_tuning_profile
+from senta.inference.zero_copy_predictor import ZeroCopyPredictor
+from senta.data.util_helper import build_pair_src_ids, convert_texts_to_src_ids, split_batch_by_length, \
+    structure_fields_dict
 from senta.utils import params
 from senta.utils.params import from_file, replace_none
 from senta.utils.util_helper import array2tensor, check_cuda, text_type
@@ -26,6 +41,9 @@ from senta.utils.util_helper import array2tensor, check_cuda, text_type
 logging.getLogger().setLevel(logging.INFO)
 _get_abs_path = lambda path: os.path.normpath(os.path.join(os.getcwd(), os.path.dirname(__file__), path))
 
+# stages of Senta.predict recorded by enable_profiling, in report order
+PREDICT_STAGES = ["tokenize", "pad", "tensor", "predict", "parse", "postprocess"]
+
 
 def get_http_url(url, file_name):
     """
@@ -52,6 +70,149 @@ def untar(fname, dirs):
         return False
 
 
+def get_dir_size(path):
+    """
+    get_dir_size
+    """
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            total += os.path.getsize(os.path.join(root, name))
+    return total
+
+
+def file_md5(file_name, chunk_size=1 << 20):
+    """
+    file_md5
+    """
+    md5 = hashlib.md5()
+    with open(file_name, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            md5.update(chunk)
+    return md5.hexdigest()
+
+
+def read_md5_file(md5_file):
+    """
+    read_md5_file
+    """
+    with open(md5_file, 'r') as fr:
+        return fr.readline().strip('\r\n').split('  ')[0]
+
+
+def build_manifest(model_files_prefix, archive_md5=None, archive_url=None):
+    """
+    build_manifest, sizes and md5 of every installed file under model_files_prefix
+    :param archive_md5: md5 of the model_files.tar.gz the files were extracted from
+    :param archive_url: model_file_http_url of the archive, tells which models are installed
+    """
+    files = {}
+    for root, _, names in os.walk(model_files_prefix):
+        for name in names:
+            if name == TUNING_PROFILE_NAME:
+                # written by tune.py after installation, not part of the archive
+                continue
+            path = os.path.join(root, name)
+            files[os.path.relpath(path, model_files_prefix)] = {"size": os.path.getsize(path),
+                                                                "md5": file_md5(path)}
+    return {"archive_md5": archive_md5, "archive_url": archive_url, "files": files}
+
+
+def read_manifest(manifest_file):
+    """
+    read_manifest
+    :return: the manifest written by download_data, None if there is none
+    """
+    if not os.path.exists(manifest_file):
+        return None
+    with open(manifest_file, 'r') as fr:
+        return json.load(fr)
+
+
+def write_manifest(manifest_file, manifest):
+    """
+    write_manifest
+    """
+    tmp_file = manifest_file + ".tmp"
+    with open(tmp_file, 'w') as fw:
+        json.dump(manifest, fw, indent=1, sort_keys=True)
+    os.rename(tmp_file, manifest_file)
+
+
+def install_archive(model_files, archive_md5, archive_url, model_files_prefix, manifest_file):
+    """
+    install_archive, extract model_files.tar.gz after checking it against the published md5 and record
+    the extracted files in the manifest. the archive md5 is the only trusted reference, so this is the
+    only place a manifest is written
+    """
+    if file_md5(model_files) != archive_md5:
+        raise IOError("md5 of %s does not match %s, the download is corrupted" % (model_files, archive_md5))
+    if not untar(model_files, _get_abs_path("./")):
+        raise IOError("failed to extract %s" % model_files)
+    write_manifest(manifest_file, build_manifest(model_files_prefix, archive_md5, archive_url))
+
+
+def verify_manifest(model_files_prefix, manifest, check_md5=False):
+    """
+    verify_manifest
+    :param check_md5: also recompute the md5 of every file, otherwise only sizes are compared
+    :return: list of files that are missing or differ from the manifest
+    """
+    broken = []
+    for name, info in manifest.get("files").items():
+        path = os.path.join(model_files_prefix, name)
+        if not os.path.exists(path) or os.path.getsize(path) != info.get("size"):
+            broken.append(name)
+        elif check_md5 and file_md5(path) != info.get("md5"):
+            broken.append(name)
+    return broken
+
+
+def check_local_data(check_md5=False):
+    """
+    check_local_data, offline replacement of download_data: verify the installed model_files against
+    the manifest written by the last verified download, without touching the network
+    :param check_md5: also recompute the md5 of every file, otherwise only sizes are compared
+    """
+    md5_files = _get_abs_path("model_files.tar.gz.md5")
+    model_files_prefix = _get_abs_path("model_files")
+    manifest_file = _get_abs_path("model_files.manifest.json")
+    manifest = read_manifest(manifest_file)
+    if not os.path.isdir(model_files_prefix) or manifest is None:
+        raise IOError("model files in %s were not installed by a verified download, run init_model once "
+                      "with offline=False" % model_files_prefix)
+
+    if os.path.exists(md5_files) and read_md5_file(md5_files) != manifest.get("archive_md5"):
+        raise IOError("%s was written for another model_files.tar.gz, run init_model with offline=False"
+                      % manifest_file)
+    broken = verify_manifest(model_files_prefix, manifest, check_md5)
+    if broken:
+        raise IOError("installed model files do not match %s: %s, run init_model with offline=False "
+                      "to download them again" % (manifest_file, ", ".join(sorted(broken)[:10])))
+    return 0
+
+
+def check_local_model(model_name, model_dict):
+    """
+    check_local_model, offline check that model_files holds the archive of model_dict and its inference
+    model. every archive is installed into the same model_files, so another model's archive passing
+    check_local_data does not mean this one is there
+    :param model_name: shown in the error, e.g. "ernie_1.0_skep_large_ch/sentiment_classify"
+    """
+    manifest = read_manifest(_get_abs_path("model_files.manifest.json"))
+    data_url = model_dict.get("model_file_http_url")
+    installed_url = manifest.get("archive_url") if manifest is not None else None
+    if installed_url != data_url:
+        raise IOError("model %s is not installed: model_files holds %s instead of %s, run init_model for it "
+                      "once with offline=False" % (model_name, installed_url, data_url))
+    model_path = _get_abs_path(model_dict.get("inference_model_path"))
+    for name in ["model", "params", "infer_data_params.json"]:
+        if not os.path.exists(os.path.join(model_path, name)):
+            raise IOError("model %s is not installed: %s is missing, run init_model for it once with "
+                          "offline=False" % (model_name, os.path.join(model_path, name)))
+    return 0
+
+
 def download_data(data_url, md5_url):
     """
     download_data
@@ -60,24 +221,35 @@ def download_data(data_url, md5_url):
     md5_files = _get_abs_path("model_files.tar.gz.md5")
     md5_files_new = _get_abs_path("model_files.tar.gz.md5.new")
     model_files_prefix = _get_abs_path("model_files")
+    manifest_file = _get_abs_path("model_files.manifest.json")
 
     get_http_url(md5_url, md5_files_new)
+    md5_new = read_md5_file(md5_files_new)
     if os.path.exists(model_files) and os.path.exists(md5_files):
-        with open(md5_files, 'r') as fr:
-            md5 = fr.readline().strip('\r\n').split('  ')[0]
-        with open(md5_files_new, 'r') as fr:
-            md5_new = fr.readline().strip('\r\n').split('  ')[0]
+        md5 = read_md5_file(md5_files)
         if md5 == md5_new:
-            return 0
+            manifest = read_manifest(manifest_file)
+            if manifest is not None and manifest.get("archive_md5") == md5 and os.path.isdir(model_files_prefix):
+                if manifest.get("archive_url") != data_url:
+                    # same archive, recorded before the manifest kept its url
+                    manifest["archive_url"] = data_url
+                    write_manifest(manifest_file, manifest)
+                return 0
+            if file_md5(model_files) == md5:
+                # installed before manifests existed, or the extraction was interrupted
+                install_archive(model_files, md5, data_url, model_files_prefix, manifest_file)
+                return 1
 
     if os.path.exists(model_files):
         os.remove(model_files)
+    if os.path.exists(manifest_file):
+        os.remove(manifest_file)
     if os.path.exists(model_files_prefix):
         shutil.move(model_files_prefix, model_files_prefix + '.' + str(int(time.time())))
 
     shutil.move(md5_files_new, md5_files)
     get_http_url(data_url, model_files)
-    untar(model_files, _get_abs_path("./"))
+    install_archive(model_files, md5_new, data_url, model_files_prefix, manifest_file)
     return 1
 
 
@@ -142,13 +314,83 @@ def build_trainer(params_dict, dataset_reader, model, num_train_examples=0):
     return trainer
 
 
+class ResidentModel(object):
+    """everything one loaded (model_class, task) needs to predict: predictor pool, tokenizer and label map"""
+
+    def __init__(self, model_name, task):
+        self.model_name = model_name
+        self.task = task
+        self.model_class = None
+        self.input_keys = None
+        self.inference = None
+        self.predictor_pool = None
+        self.tokenizer = None
+        self.token_cache = None
+        self.max_seq_len = 512
+        self.truncation_type = 0
+        self.padding_id = 0
+        self.batch_assembler = None
+        self.default_batch_size = None
+        self.inference_type = None
+        self.zero_copy = False
+        self.remove_space = False
+        self.label_map = {}
+        self.size = 0
+        self.startup_time = OrderedDict()
+
+
 class Senta(object):
     """docstring for Senta"""
 
-    def __init__(self):
+    def __init__(self, max_resident_models=None, memory_budget_mb=None):
+        """
+        :param max_resident_models: max number of (model_class, task) kept loaded, None means no limit
+        :param memory_budget_mb: max total size of the loaded models' weights, None means no limit.
+                                 the least recently used model is evicted when a limit is exceeded
+        """
         super(Senta, self).__init__()
+        self.prediction_cache = None
+        self.profiler = NullProfiler()
+        memory_budget = memory_budget_mb * 1024 * 1024 if memory_budget_mb is not None else None
+        self.models = ModelRegistry(max_resident_models, memory_budget)
+        self.current = None
+        self.tokenizers = {}
+        self.token_caches = {}
+        self._load_args = {"use_cuda": False, "token_cache_size": 0, "num_predictors": 1, "offline": False,
+                           "zero_copy": False, "verify_md5": False}
+        # 0: not checked, 1: sizes checked, 2: md5 checked
+        self._local_data_checked = 0
+        self._load_lock = threading.Lock()
         self.__get_params()
 
+    @property
+    def tokenizer(self):
+        """
+        the tokenizer of the current model, kept for code written against the single-model Senta
+        """
+        return self.get_model().tokenizer
+
+    @property
+    def inference(self):
+        """
+        the predictor of the current model, the first one of its pool when num_predictors > 1
+        """
+        return self.get_model().inference
+
+    @property
+    def model_class(self):
+        """
+        the model_class instance of the current model, see init_model
+        """
+        return self.get_model().model_class
+
+    @property
+    def max_seq_len(self):
+        """
+        the max sequence length of the current model
+        """
+        return self.get_model().max_seq_len
+
     def __get_params(self):
         """
         __get_params
@@ -158,21 +400,65 @@ class Senta(object):
         param_dict = from_file(param_path)
         self._params = replace_none(param_dict)
 
-    def __load_inference_model(self, model_path, use_gpu):
+    def __load_inference_model(self, model_path, use_gpu, zero_copy=False, profile=None):
         """
         :param meta_path:
+        :param zero_copy: return a ZeroCopyPredictor, which runs on numpy arrays instead of PaddleTensors
+        :param profile: cpu options from the cpu_tuning_profile.json written by tune.py, None for the defaults
         :return:
         """
         check_cuda(use_gpu)
         config = AnalysisConfig(model_path + "/" + "model", model_path + "/" + "params")
+        use_analysis = False
         if use_gpu:
             config.enable_use_gpu(1024)
         else:
-            config.disable_gpu()
-            config.enable_mkldnn()
+            use_analysis = configure_cpu(config, profile)
+        if zero_copy:
+            config.switch_use_feed_fetch_ops(False)
+            return ZeroCopyPredictor(create_paddle_predictor(config))
+        if use_analysis:
+            return create_paddle_predictor(config)
         inference = create_paddle_predictor(config.to_native_config())
         return inference
 
+    def set_prediction_cache(self, prediction_cache):
+        """
+        set_prediction_cache
+        :param prediction_cache: a senta.inference.prediction_cache.PredictionCache shared by all models and
+                                 tasks, None disables caching; its whitespace normalization is never applied
+                                 to seq_lab models
+        """
+        self.prediction_cache = prediction_cache
+
+    def enable_profiling(self, enable=True, bounds=None):
+        """
+        record the per-call latency of every predict stage (tokenize, pad, tensor, predict, parse,
+        postprocess) and the tokens/s from now on, see get_profile_report
+        :param enable: False stops recording
+        :param bounds: ascending millisecond bucket bounds of the latency histograms, None for the default
+        :return: the senta.inference.metrics.LatencyProfiler, or None when disabled
+        """
+        if not enable:
+            self.profiler = NullProfiler()
+            return None
+        self.profiler = LatencyProfiler(PREDICT_STAGES, bounds)
+        self.profiler.start()
+        return self.profiler
+
+    def get_profile_report(self, path=None):
+        """
+        get_profile_report
+        :param path: also write the report to this json file, so that reports of two releases can be diffed
+        :return: dict with p50/p95/p99 per stage, counted once per predict call, and tokens/s since
+                 enable_profiling
+        """
+        if not isinstance(self.profiler, LatencyProfiler):
+            raise ValueError("profiling is not enabled, call enable_profiling first")
+        if path:
+            self.profiler.dump(path)
+        return self.profiler.report()
+
     def get_support_model(self):
         """
         get_support_model
@@ -187,61 +473,142 @@ class Senta(object):
         tasks = list(self._params.get("task_name").keys())
         return tasks
 
-    def init_model(self, model_class="ernie_1.0_skep_large_ch", task="sentiment_classify", use_cuda=False):
+    def get_resident_models(self):
+        """
+        get_resident_models
+        :return: dict with the loaded (model_class, task) keys from least to most recently used,
+                 their estimated memory and the load/hit/eviction counters
+        """
+        return self.models.stats()
+
+    def init_model(self, model_class="ernie_1.0_skep_large_ch", task="sentiment_classify", use_cuda=False,
+                   token_cache_size=0, num_predictors=1, offline=None,
+                   zero_copy=False, verify_md5=None):
+        """
+        init_model, load (model_class, task) if it is not resident yet and make it the current model.
+        models loaded before stay resident and can still be used through predict(..., model_class, task).
+        :param token_cache_size: > 0 enables an LRU cache from text to token ids holding at most this many
+                                 texts, see self.get_model().token_cache.stats() for its hit rate. models
+                                 sharing a vocab share the cache
+        :param num_predictors: number of predictors cloned from the loaded one. they share weights, and
+                               predict can be called from up to this many threads at the same time
+        :param offline: True skips the network and only verifies the installed model_files against the
+                        manifest of sizes and checksums (model_files.manifest.json) written by the last
+                        md5-verified download. fails if there is no such manifest. None reads the
+                        SENTA_OFFLINE environment variable.
+                        see self.get_model().startup_time for the time spent in each startup phase
+        :param zero_copy: feed numpy arrays straight into the predictor's preallocated input tensors through
+                          zero_copy_run instead of building PaddleTensors, which matters for small batches
+        :param verify_md5: with offline, also recompute the md5 of every installed file instead of only
+                           comparing sizes, which reads all the model files once. None reads the
+                           SENTA_VERIFY_MD5 environment variable
         """
-        init_model
+        if offline is None:
+            offline = os.getenv("SENTA_OFFLINE", "0").lower() in ("1", "true", "yes")
+        if verify_md5 is None:
+            verify_md5 = os.getenv("SENTA_VERIFY_MD5", "0").lower() in ("1", "true", "yes")
+        self._load_args = {"use_cuda": use_cuda, "token_cache_size": token_cache_size,
+                           "num_predictors": num_predictors, "offline": offline, "zero_copy": zero_copy,
+                           "verify_md5": verify_md5}
+        self.current = self.get_model(model_class, task)
+        self.models.pin((model_class, task))
+
+    def get_model(self, model_class=None, task=None):
+        """
+        get_model
+        :param model_class: None means the model_class of the current model
+        :param task: None means the task of the current model
+        :return: the resident ResidentModel of (model_class, task), loaded with the arguments of the last
+                 init_model call if it is not resident
+        """
+        if self.current is not None:
+            if model_class is None:
+                model_class = self.current.model_name
+            if task is None:
+                task = self.current.task
+            if (model_class, task) == (self.current.model_name, self.current.task):
+                return self.current
+        if model_class is None or task is None:
+            raise ValueError("no model is initialized, call init_model first")
+
+        key = (model_class, task)
+        model = self.models.get(key)
+        if model is not None:
+            return model
+        with self._load_lock:
+            model = self.models.get(key)
+            if model is None:
+                model = self.__load_model(model_class, task, **self._load_args)
+                self.models.put(key, model, model.size)
+        return model
+
+    def __load_model(self, model_class, task, use_cuda=False, token_cache_size=0, num_predictors=1, offline=False,
+                     zero_copy=False, verify_md5=False):
+        """
+        download if needed and load one (model_class, task)
+        :return: ResidentModel
         """
         ptm = self._params.get("model_name").get(model_class)
         ptm_id = ptm.get('type')
         task_id = self._params.get("task_name").get(task)
         model_dict = self._params.get("model_class").get(ptm_id + task_id)
+        model = ResidentModel(model_class, task)
+        begin_time = time.time()
 
         # step 1: get_init_model, if download
-        data_url = model_dict.get("model_file_http_url")
-        md5_url = model_dict.get("model_md5_http_url")
-        is_download_data = download_data(data_url, md5_url)
+        if offline:
+            # every model lives in the same model_files, verify it once per process and check level
+            check_level = 2 if verify_md5 else 1
+            if self._local_data_checked < check_level:
+                check_local_data(verify_md5)
+                self._local_data_checked = check_level
+            check_local_model("%s/%s" % (model_class, task), model_dict)
+        else:
+            data_url = model_dict.get("model_file_http_url")
+            md5_url = model_dict.get("model_md5_http_url")
+            is_download_data = download_data(data_url, md5_url)
+        model.startup_time["download_check"] = time.time() - begin_time
 
         # step 2 get model_class
+        phase_time = time.time()
         register.import_modules()
         model_name = model_dict.get("type")
-        self.model_class = RegisterSet.models.__getitem__(model_name)(model_dict)
+        model.model_class = RegisterSet.models.__getitem__(model_name)(model_dict)
 
         # step 3 init data params
         model_path = _get_abs_path(model_dict.get("inference_model_path"))
         data_params_path = model_path + "/infer_data_params.json"
         param_dict = from_file(data_params_path)
         param_dict = replace_none(param_dict)
-        self.input_keys = param_dict.get("fields")
+        model.input_keys = param_dict.get("fields")
+        model.startup_time["import_modules"] = time.time() - phase_time
 
         # step 4 init env
-        self.inference = self.__load_inference_model(model_path, use_cuda)
-
-        # step 5: tokenizer
+        phase_time = time.time()
+        model.zero_copy = zero_copy
+        profile = None if use_cuda else load_tuning_profile(model_path)
+        if profile is not None:
+            logging.info("apply cpu tuning profile of %s" % model_path)
+            model.default_batch_size = profile.get("batch_size")
+        model.inference = self.__load_inference_model(model_path, use_cuda, zero_copy, profile)
+        model.predictor_pool = PredictorPool(model.inference, num_predictors)
+        # cloned predictors share weights, so the weights on disk are a good estimate of the memory held
+        model.size = get_dir_size(model_path)
+        model.startup_time["create_predictor"] = time.time() - phase_time
+
+        # step 5: tokenizer, shared by every model with the same vocab
+        phase_time = time.time()
         tokenizer_info = model_dict.get("predict_reader").get('tokenizer')
         tokenizer_name = tokenizer_info.get('type')
-        tokenizer_vocab_path = _get_abs_path(tokenizer_info.get('vocab_path'))
-        tokenizer_params = None
-        if tokenizer_info.__contains__("params"):
-            tokenizer_params = tokenizer_info.get("params")
-            bpe_v_file = tokenizer_params["bpe_vocab_file"]
-            bpe_j_file = tokenizer_params["bpe_json_file"]
-            tokenizer_params["bpe_vocab_file"] = _get_abs_path(bpe_v_file)
-            tokenizer_params["bpe_json_file"] = _get_abs_path(bpe_j_file)
+        model.tokenizer, model.token_cache = self.__get_tokenizer(tokenizer_info, token_cache_size)
+        model.padding_id = 1 if tokenizer_name == "GptBpeTokenizer" else 0
+        model.batch_assembler = BatchAssembler(model.padding_id)
 
-        tokenizer_class = RegisterSet.tokenizer.__getitem__(tokenizer_name)
-        self.tokenizer = tokenizer_class(vocab_file=tokenizer_vocab_path,
-                                         split_char=" ",
-                                         unk_token="[UNK]",
-                                         params=tokenizer_params)
-        self.max_seq_len = 512
-        self.truncation_type = 0
-        self.padding_id = 1 if tokenizer_name == "GptBpeTokenizer" else 0
-
-        self.inference_type = model_dict.get("inference_type", None)
+        model.inference_type = model_dict.get("inference_type", None)
+        model.remove_space = model_dict.get("predict_reader").get("type") == "TwoSentClassifyReaderCh"
 
         # step6: label_map
         label_map_file = model_dict.get("label_map_path", None)
-        self.label_map = {}
         if isinstance(label_map_file, str):
             label_map_file = _get_abs_path(label_map_file)
             with open(label_map_file, 'r') as fr:
@@ -249,44 +616,315 @@ class Senta(object):
                     line = line.strip('\r\n')
                     items = line.split('\t')
                     idx, label = int(items[1]), items[0]
-                    self.label_map[idx] = label
+                    model.label_map[idx] = label
+        model.startup_time["load_tokenizer"] = time.time() - phase_time
+        model.startup_time["total"] = time.time() - begin_time
 
-    def predict(self, texts_, aspects=None):
+        logging.info("load model %s %s, size %.1fMB, %d resident" % (model_class, task, model.size / 1024.0 / 1024,
+                                                                  len(self.models) + 1))
+        logging.info("startup time of %s %s: %s" % (model_class, task, ", ".join(
+            "%s %.3fs" % (phase, cost) for phase, cost in model.startup_time.items())))
+        return model
+
+    def __get_tokenizer(self, tokenizer_info, token_cache_size):
+        """
+        :return: (tokenizer, token_cache), built once per (type, vocab, params) and shared by all models
+        """
+        tokenizer_name = tokenizer_info.get('type')
+        tokenizer_vocab_path = _get_abs_path(tokenizer_info.get('vocab_path'))
+        tokenizer_params = None
+        if tokenizer_info.__contains__("params"):
+            tokenizer_params = dict(tokenizer_info.get("params"))
+            bpe_v_file = tokenizer_params["bpe_vocab_file"]
+            bpe_j_file = tokenizer_params["bpe_json_file"]
+            tokenizer_params["bpe_vocab_file"] = _get_abs_path(bpe_v_file)
+            tokenizer_params["bpe_json_file"] = _get_abs_path(bpe_j_file)
+
+        key = (tokenizer_name, tokenizer_vocab_path, json.dumps(tokenizer_params, sort_keys=True))
+        tokenizer = self.tokenizers.get(key)
+        if tokenizer is None:
+            tokenizer_class = RegisterSet.tokenizer.__getitem__(tokenizer_name)
+            tokenizer = tokenizer_class(vocab_file=tokenizer_vocab_path,
+                                        split_char=" ",
+                                        unk_token="[UNK]",
+                                        params=tokenizer_params)
+            self.tokenizers[key] = tokenizer
+
+        token_cache = self.token_caches.get(key)
+        if token_cache is None and token_cache_size > 0:
+            token_cache = TokenizationCache(tokenizer, token_cache_size)
+            self.token_caches[key] = token_cache
+        return tokenizer, token_cache
+
+    def predict(self, texts_, aspects=None, bucket_bounds=None, batch_size=None, model_class=None, task=None):
         """
         the sentiment classifier's function
         :param texts: a unicode string or a list of unicode strings.
-        :return: sentiment prediction results.
+        :param aspects: a unicode string or a list of unicode strings for aspect_sentiment_classify,
+                        aspects[i] is the aspect of texts[i]. ignored by the other tasks.
+        :param bucket_bounds: ascending token-length bounds such as [32, 64, 128, 512]. texts are grouped
+                              by token length and every bucket runs as its own padded batch. None means
+                              all texts share one bucket.
+        :param batch_size: max number of texts in one batch, None means the batch_size of the model's cpu
+                           tuning profile if tune.py has written one, otherwise no limit.
+        :param model_class: run on this resident model instead of the current one, see get_model
+        :param task: run this task instead of the current one, see get_model
+        :return: sentiment prediction results, in the same order as texts.
         """
+        model = self.get_model(model_class, task)
         if isinstance(texts_, text_type):
             texts_ = [texts_]
 
         if isinstance(aspects, text_type):
             aspects = [aspects]
 
-        return_list = convert_texts_to_ids(texts_, self.tokenizer, self.max_seq_len, \
-                                           self.truncation_type, self.padding_id)
-        record_dict = structure_fields_dict(return_list, 0, need_emb=False)
-        input_list = []
-        for item in self.input_keys:
-            kv = item.split("#")
-            name = kv[0]
-            key = kv[1]
-            input_item = record_dict[InstanceName.RECORD_ID][key]
-            input_list.append(input_item)
-        inputs = [array2tensor(ndarray) for ndarray in input_list]
-        result = self.inference.run(inputs)
-        batch_result = self.model_class.parse_predict_result(result)
-        results = []
-        if self.inference_type == 'seq_lab':
-            for text, probs in zip(texts_, batch_result):
-                label = [self.label_map[l] for l in probs]
-                results.append((text, label))
+        self.profiler.begin_batch()
+        if aspects is not None and model.task == "aspect_sentiment_classify":
+            if len(aspects) != len(texts_):
+                raise ValueError("texts and aspects must have the same length, got %d and %d"
+                                 % (len(texts_), len(aspects)))
+            batch_result = self.__predict_cached(model, list(zip(texts_, aspects)), self.__predict_pairs,
+                                                 bucket_bounds, batch_size)
         else:
+            batch_result = self.__predict_cached(model, texts_, self.__predict_texts, bucket_bounds, batch_size)
+
+        with self.profiler.timer("postprocess"):
+            results = []
             for text, probs in zip(texts_, batch_result):
-                label = self.label_map[np.argmax(probs)]
-                results.append((text, label))
+                results.append((text, self.__parse_label(model, probs)))
+        self.profiler.end_batch()
+        self.profiler.count(len(texts_))
+        return results
+
+    def predict_aspects(self, texts_, aspects, bucket_bounds=None, batch_size=None, model_class=None):
+        """
+        score every text against every aspect for aspect_sentiment_classify.
+        each text and each distinct aspect is tokenized only once.
+        :param texts_: a unicode string or a list of unicode strings.
+        :param aspects: a list of unicode strings shared by all texts.
+        :param bucket_bounds: same as predict
+        :param batch_size: same as predict, counted in (text, aspect) pairs
+        :param model_class: same as predict
+        :return: list of (text, aspect, label), ordered by text and then by aspect
+        """
+        task = "aspect_sentiment_classify" if model_class is not None else None
+        model = self.get_model(model_class, task)
+        if model.task != "aspect_sentiment_classify":
+            raise ValueError("predict_aspects only supports aspect_sentiment_classify, got %s of %s"
+                             % (model.task, model.model_name))
+        if isinstance(texts_, text_type):
+            texts_ = [texts_]
+
+        if isinstance(aspects, text_type):
+            aspects = [aspects]
+
+        pairs = [(text, aspect) for text in texts_ for aspect in aspects]
+        self.profiler.begin_batch()
+        batch_result = self.__predict_cached(model, pairs, self.__predict_pairs, bucket_bounds, batch_size)
+        with self.profiler.timer("postprocess"):
+            results = []
+            for (text, aspect), probs in zip(pairs, batch_result):
+                results.append((text, aspect, self.__parse_label(model, probs)))
+        self.profiler.end_batch()
+        self.profiler.count(len(pairs))
+        return results
+
+    def predict_iter(self, texts, batch_size=32, bucket_bounds=None, window_batches=1, model_class=None, task=None):
+        """
+        lazily predict texts from any iterable, e.g. a file object or a generator
+        :param texts: iterable of unicode strings, consumed window by window
+        :param batch_size: max number of texts in one batch
+        :param bucket_bounds: same as predict, buckets are formed inside each window
+        :param window_batches: number of batches read ahead per window, larger windows give
+                               length bucketing more texts to group while keeping memory bounded
+        :param model_class: same as predict
+        :param task: same as predict
+        :return: generator of (text, label), in the same order as texts
+        """
+        if batch_size <= 0 or window_batches <= 0:
+            raise ValueError("batch_size and window_batches must be positive")
+
+        iterator = iter(texts)
+        window_size = batch_size * window_batches
+        while True:
+            window = list(itertools.islice(iterator, window_size))
+            if not window:
+                break
+            for result in self.predict(window, bucket_bounds=bucket_bounds, batch_size=batch_size,
+                                       model_class=model_class, task=task):
+                yield result
+
+    def predict_parallel(self, texts_, batch_size=32, bucket_bounds=None, model_class=None, task=None):
+        """
+        split texts into batches and run them concurrently on the predictor pool
+        :param texts_: a list of unicode strings.
+        :param batch_size: number of texts handed to one predictor call
+        :param bucket_bounds: same as predict, buckets are formed inside each batch
+        :param model_class: same as predict
+        :param task: same as predict
+        :return: sentiment prediction results, in the same order as texts.
+        """
+        model = self.get_model(model_class, task)
+        if isinstance(texts_, text_type):
+            texts_ = [texts_]
+
+        chunks = [texts_[start: start + batch_size] for start in range(0, len(texts_), batch_size)]
+        results = []
+        with ThreadPoolExecutor(max_workers=len(model.predictor_pool)) as executor:
+            for chunk_result in executor.map(lambda chunk: self.predict(chunk, bucket_bounds=bucket_bounds,
+                                                                        model_class=model.model_name,
+                                                                        task=model.task),
+                                             chunks):
+                results.extend(chunk_result)
         return results
 
+    def async_batcher(self, max_batch_size=32, max_wait_ms=5, bucket_bounds=None, model_class=None, task=None):
+        """
+        build an asyncio front-end that coalesces concurrent single-text requests into batches:
+            batcher = senta.async_batcher()
+            text, label = await batcher.predict(text)
+        :param max_batch_size: max number of texts in one batch
+        :param max_wait_ms: max time the first text of a batch waits for others
+        :param bucket_bounds: same as predict
+        :param model_class: same as predict, fixed for the lifetime of the batcher
+        :param task: same as predict, fixed for the lifetime of the batcher
+        :return: senta.inference.async_batcher.AsyncBatcher, one batch in flight per pooled predictor
+        """
+        model = self.get_model(model_class, task)
+        return AsyncBatcher(lambda texts: self.predict(texts, bucket_bounds=bucket_bounds,
+                                                       model_class=model.model_name, task=model.task),
+                            max_batch_size=max_batch_size,
+                            max_wait_ms=max_wait_ms,
+                            num_workers=len(model.predictor_pool))
+
+    def __parse_label(self, model, probs):
+        """
+        map one parsed prediction to its label(s)
+        """
+        if model.inference_type == 'seq_lab':
+            return [model.label_map[l] for l in probs]
+        return model.label_map[np.argmax(probs)]
+
+    def __encode_text(self, model, text):
+        """
+        text -> token ids without [CLS]/[SEP]
+        """
+        if model.remove_space:
+            # keep consistent with TwoSentClassifyReaderCh.read_files
+            text = text.replace(' ', '')
+        if model.token_cache is not None:
+            return model.token_cache.encode(text)
+        return model.tokenizer.convert_tokens_to_ids(model.tokenizer.tokenize(text))
+
+    def __predict_cached(self, model, items, predict_fn, bucket_bounds, batch_size):
+        """
+        look items up in self.prediction_cache and only run predict_fn on the misses
+        :param items: list of texts or (text, aspect) pairs
+        :param predict_fn: __predict_texts or __predict_pairs
+        :return: batch_result of every item, in the same order as items
+        """
+        if self.prediction_cache is None:
+            return predict_fn(model, items, bucket_bounds, batch_size)
+
+        # \2 is not whitespace, so the cache's whitespace normalization can not merge text and aspect
+        keys = [item if isinstance(item, text_type) else "\2".join(item) for item in items]
+        batch_result = [None] * len(items)
+        miss_index = {}
+        for i, key in enumerate(keys):
+            probs = self.prediction_cache.get(model.model_name, model.task, key, model.inference_type)
+            if probs is not None:
+                batch_result[i] = probs
+            else:
+                miss_index.setdefault(key, []).append(i)
+
+        if miss_index:
+            miss_items = [items[indexes[0]] for indexes in miss_index.values()]
+            miss_result = predict_fn(model, miss_items, bucket_bounds, batch_size)
+            for (key, indexes), probs in zip(miss_index.items(), miss_result):
+                self.prediction_cache.put(model.model_name, model.task, key, probs, model.inference_type)
+                for i in indexes:
+                    batch_result[i] = probs
+        return batch_result
+
+    def __predict_texts(self, model, texts_, bucket_bounds, batch_size):
+        """
+        :return: batch_result of every text, in the same order as texts_
+        """
+        with self.profiler.timer("tokenize"):
+            src_ids = convert_texts_to_src_ids(texts_, model.tokenizer, model.max_seq_len, model.truncation_type,
+                                               model.token_cache)
+        return self.__predict_src_ids(model, src_ids, None, bucket_bounds, batch_size)
+
+    def __predict_pairs(self, model, pairs, bucket_bounds, batch_size):
+        """
+        :param pairs: list of (text, aspect), duplicated texts and aspects are tokenized once
+        :return: batch_result of every pair, in the same order as pairs
+        """
+        tokenize_time = time.time()
+        token_ids = {}
+        for pair in pairs:
+            for text in pair:
+                if text not in token_ids:
+                    token_ids[text] = self.__encode_text(model, text)
+
+        cls_id = model.tokenizer.covert_token_to_id("[CLS]")
+        sep_id = model.tokenizer.covert_token_to_id("[SEP]")
+        src_ids = []
+        sentence_ids = []
+        for text, aspect in pairs:
+            src_id, sentence_id = build_pair_src_ids(token_ids[text], token_ids[aspect], cls_id, sep_id,
+                                                     model.max_seq_len)
+            src_ids.append(src_id)
+            sentence_ids.append(sentence_id)
+        self.profiler.observe("tokenize", time.time() - tokenize_time)
+        return self.__predict_src_ids(model, src_ids, sentence_ids, bucket_bounds, batch_size)
+
+    def __predict_src_ids(self, model, src_ids, sentence_ids, bucket_bounds, batch_size):
+        """
+        :return: batch_result of every src_id, in the same order as src_ids
+        """
+        if batch_size is None:
+            batch_size = model.default_batch_size
+        seq_lens = [len(src_id) for src_id in src_ids]
+        self.profiler.add_tokens(sum(seq_lens))
+        batch_result = [None] * len(src_ids)
+        for batch_index in split_batch_by_length(seq_lens, bucket_bounds, batch_size):
+            batch_sentence_ids = None
+            if sentence_ids is not None:
+                batch_sentence_ids = [sentence_ids[i] for i in batch_index]
+            bucket_result = self.__run_src_ids(model, [src_ids[i] for i in batch_index], batch_sentence_ids)
+            for i, probs in zip(batch_index, bucket_result):
+                batch_result[i] = probs
+        return batch_result
+
+    def __run_src_ids(self, model, src_ids, sentence_ids=None):
+        """
+        pad one batch of src_ids, run the predictor and parse its output
+        :param src_ids: list of id lists, [CLS]/[SEP] already added
+        :param sentence_ids: list of text_type_id lists for sentence pairs, None for single sentences
+        :return: batch_result from model_class.parse_predict_result
+        """
+        # the assembler's buffers are reused by the next batch of this thread, the predictor copies them first
+        with self.profiler.timer("pad"):
+            return_list = model.batch_assembler.assemble(src_ids, sentence_ids)
+        with self.profiler.timer("tensor"):
+            record_dict = structure_fields_dict(return_list, 0, need_emb=False)
+            input_list = []
+            for item in model.input_keys:
+                kv = item.split("#")
+                name = kv[0]
+                key = kv[1]
+                input_item = record_dict[InstanceName.RECORD_ID][key]
+                input_list.append(input_item)
+            if model.zero_copy:
+                inputs = input_list
+            else:
+                inputs = [array2tensor(ndarray) for ndarray in input_list]
+        with self.profiler.timer("predict"):
+            result = model.predictor_pool.run(inputs)
+        with self.profiler.timer("parse"):
+            return model.model_class.parse_predict_result(result)
+
     def train(self, json_path):
         """
         the function use to retrain model
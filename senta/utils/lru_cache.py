@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*
+"""
+:py:class:`LRUCache`
+"""
+import threading
+from collections import OrderedDict
+
+
+class LRUCache(object):
+    """LRUCache: 线程安全、容量有上限的LRU缓存，带命中/未命中计数
+    """
+
+    def __init__(self, capacity):
+        """
+        :param capacity: 最多缓存的条目数，超出后淘汰最久未使用的条目
+        """
+        if capacity <= 0:
+            raise ValueError("capacity must be positive, got %s" % capacity)
+        self.capacity = capacity
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        """
+        :param key:
+        :param default: key不存在时的返回值
+        :return: 缓存的value，并把key标记为最近使用
+        """
+        with self._lock:
+            try:
+                value = self._data.pop(key)
+            except KeyError:
+                self.misses += 1
+                return default
+            self._data[key] = value
+            self.hits += 1
+            return value
+
+    def put(self, key, value):
+        """
+        :param key:
+        :param value:
+        :return:
+        """
+        with self._lock:
+            self._data.pop(key, None)
+            self._data[key] = value
+            while len(self._data) > self.capacity:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        """清空缓存，计数不变"""
+        with self._lock:
+            self._data.clear()
+
+    def hit_rate(self):
+        """
+        :return: 命中率，还没有访问时为0
+        """
+        total = self.hits + self.misses
+        return float(self.hits) / total if total else 0.0
+
+    def stats(self):
+        """
+        :return: dict，可以直接打日志或导出成监控指标
+        """
+        return {"size": len(self._data),
+                "capacity": self.capacity,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": self.hit_rate()}
+
+    def __len__(self):
+        return len(self._data)
+
+    def __contains__(self, key):
+        return key in self._data
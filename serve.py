@@ -0,0 +1,52 @@
+# -*- coding: utf-8 -*
+"""
+本地HTTP预测服务，配置文件与infer.py相同
+
+usage:
+    python serve.py --param_path ./config/ernie_1.0_skep_large_ch.Chnsenticorp.infer.json --port 8866
+    curl -d '{"texts": ["很好吃"]}' http://127.0.0.1:8866/predict
+    curl http://127.0.0.1:8866/metrics
+"""
+import argparse
+import logging
+import os
+
+from infer import build_inference, dataset_reader_from_params, model_from_params
+from senta.common import register
+from senta.inference.server import InferenceService, run_server
+from senta.utils import log
+from senta.utils import params
+from senta.utils.args import ArgumentGroup
+
+
+def build_arguments():
+    """build_arguments"""
+    parser = argparse.ArgumentParser(__doc__)
+    model_g = ArgumentGroup(parser, "model", "model configuration and paths.")
+    model_g.add_arg("param_path", str, None, "path to parameter file describing the model to be served")
+    model_g.add_arg("log_dir", str, "log", "log dir")
+    server_g = ArgumentGroup(parser, "server", "http server options.")
+    server_g.add_arg("host", str, "0.0.0.0", "address to bind.")
+    server_g.add_arg("port", int, 8866, "port to listen on.")
+    server_g.add_arg("max_batch_size", int, 32, "max instances per batch.")
+    server_g.add_arg("max_wait_ms", float, 5, "max wait of the first instance in a batch.")
+    server_g.add_arg("bucket_bounds", str, "", "comma separated char length bounds, empty means no bucketing.")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = build_arguments()
+    log.init_log(os.path.join(args.log_dir, "serve"), level=logging.INFO)
+    param_dict = params.from_file(args.param_path)
+    _params = params.replace_none(param_dict)
+
+    register.import_modules()
+
+    dataset_reader = dataset_reader_from_params(_params.get("dataset_reader"))
+    model = model_from_params(_params.get("model"))
+    inference = build_inference(_params.get("inference"), dataset_reader, model)
+
+    bucket_bounds = [int(b) for b in args.bucket_bounds.split(",")] if args.bucket_bounds else None
+    service = InferenceService(inference, max_batch_size=args.max_batch_size,
+                               max_wait_ms=args.max_wait_ms, bucket_bounds=bucket_bounds)
+    run_server(service, host=args.host, port=args.port)
@@ -0,0 +1,94 @@
+# -*- coding: utf-8 -*
+"""
+senta.inference.async_batcher.AsyncBatcher的攒batch、报错和关闭
+"""
+import asyncio
+import threading
+import unittest
+
+from senta.inference.async_batcher import AsyncBatcher
+
+
+def run(coro):
+    """在新的event loop里跑完coro，整体最多5秒，调用方一直等不到结果时测试失败而不是卡住"""
+    return asyncio.run(asyncio.wait_for(coro, 5))
+
+
+class AsyncBatcherTest(unittest.TestCase):
+    """AsyncBatcher"""
+
+    def test_results(self):
+        """每个调用方拿到自己那一条的结果，并发的请求攒成batch"""
+        async def main():
+            batcher = AsyncBatcher(lambda items: [item * 2 for item in items], max_batch_size=4, max_wait_ms=50)
+            results = await asyncio.gather(*[batcher.predict(i) for i in range(10)])
+            stats = batcher.stats()
+            await batcher.close()
+            return results, stats
+
+        results, stats = run(main())
+        self.assertEqual(results, [i * 2 for i in range(10)])
+        self.assertEqual(stats["num_requests"], 10)
+        self.assertLess(stats["num_batches"], 10)
+
+    def test_predict_error(self):
+        """predict_fn抛异常时整个batch的调用方都拿到这个异常"""
+        def predict_fn(items):
+            raise ValueError("boom")
+
+        async def main():
+            batcher = AsyncBatcher(predict_fn, max_batch_size=4, max_wait_ms=20)
+            results = await asyncio.gather(*[batcher.predict(i) for i in range(4)], return_exceptions=True)
+            await batcher.close()
+            return results
+
+        for result in run(main()):
+            self.assertIsInstance(result, ValueError)
+
+    def test_result_count_mismatch(self):
+        """predict_fn少返回了结果时所有调用方都报错，不会有人一直等下去"""
+        async def main():
+            batcher = AsyncBatcher(lambda items: items[:-1], max_batch_size=4, max_wait_ms=20)
+            results = await asyncio.gather(*[batcher.predict(i) for i in range(4)], return_exceptions=True)
+            await batcher.close()
+            return results
+
+        results = run(main())
+        self.assertEqual(len(results), 4)
+        for result in results:
+            self.assertIsInstance(result, ValueError)
+
+    def test_close_with_pending_requests(self):
+        """close时已经发出的batch正常返回，等worker的batch和排队的请求被取消"""
+        release = threading.Event()
+
+        def predict_fn(items):
+            release.wait(5)
+            return items
+
+        async def main():
+            batcher = AsyncBatcher(predict_fn, max_batch_size=2, max_wait_ms=1, num_workers=1)
+            running = [asyncio.ensure_future(batcher.predict(i)) for i in range(2)]
+            await asyncio.sleep(0.05)
+            # 唯一的worker在跑第一个batch，这两条取出来之后等在_slots上
+            waiting = [asyncio.ensure_future(batcher.predict(i)) for i in range(2, 4)]
+            await asyncio.sleep(0.05)
+            queued = [asyncio.ensure_future(batcher.predict(i)) for i in range(4, 6)]
+            await asyncio.sleep(0)
+            close = asyncio.ensure_future(batcher.close())
+            await asyncio.sleep(0.05)
+            release.set()
+            await close
+            results = await asyncio.gather(*(running + waiting + queued), return_exceptions=True)
+            with self.assertRaises(RuntimeError):
+                await batcher.predict(6)
+            return results
+
+        results = run(main())
+        self.assertEqual(results[:2], [0, 1])
+        for result in results[2:]:
+            self.assertIsInstance(result, asyncio.CancelledError)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*
+"""
+tokenizer的批量接口encode_texts/tokenize_batch与逐条tokenize + convert_tokens_to_ids的结果相同，
+包括sentencepiece模型外、词表外的字符
+"""
+import os
+import shutil
+import tempfile
+import unittest
+
+import sentencepiece as sp
+
+from senta.data.tokenizer.tokenization_wp import FullTokenizer, SentencepieceTokenizerErnie
+
+CORPUS = [u"酒店很好", u"好酒好店", u"这家酒店的服务很好", u"房间干净，早餐不错", u"位置好，交通方便",
+          u"hotel is good", u"the room is clean"]
+
+TEXTS = [u"酒店龘好", u"龘", u"很好的酒店", u"Hotel IS 龘 good!", u"", u"\1酒店\1好", u"彧彧酒店"]
+
+
+def write_lines(path, lines):
+    """每行一个写进文件"""
+    with open(path, "w", encoding="utf-8") as fw:
+        for line in lines:
+            fw.write(line + "\n")
+
+
+class BatchTokenizationTest(unittest.TestCase):
+    """encode_texts与逐条编码"""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.tmp_dir = tempfile.mkdtemp()
+        corpus_file = os.path.join(cls.tmp_dir, "corpus.txt")
+        write_lines(corpus_file, CORPUS * 20)
+        model_prefix = os.path.join(cls.tmp_dir, "sp")
+        sp.SentencePieceTrainer.Train("--input=%s --model_prefix=%s --vocab_size=60 --character_coverage=1.0 "
+                                      "--model_type=unigram --hard_vocab_limit=false"
+                                      % (corpus_file, model_prefix))
+        cls.sp_model = model_prefix + ".model"
+        # 龘不在sentencepiece模型里，但在词表里；彧两边都没有
+        cls.sp_vocab = os.path.join(cls.tmp_dir, "sp_vocab.txt")
+        write_lines(cls.sp_vocab, [u"[UNK]", u"[PAD]", u"▁", u"酒", u"店", u"龘", u"好", u"▁hotel"])
+        cls.wp_vocab = os.path.join(cls.tmp_dir, "wp_vocab.txt")
+        write_lines(cls.wp_vocab, [u"[PAD]", u"[UNK]", u"酒", u"店", u"龘", u"好", u"hotel", u"is", u"good",
+                                   u"!", u"##s", u"很", u"的"])
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.tmp_dir)
+
+    def assert_batch_same(self, tokenizer, texts):
+        """批量接口与逐条的结果相同"""
+        expected_tokens = [tokenizer.tokenize(text) for text in texts]
+        expected_ids = [tokenizer.convert_tokens_to_ids(tokens) for tokens in expected_tokens]
+        self.assertEqual(tokenizer.tokenize_batch(texts), expected_tokens)
+        self.assertEqual(tokenizer.encode_texts(texts), expected_ids)
+        return expected_ids
+
+    def test_sentencepiece_unknown_chars(self):
+        """sentencepiece模型外的字符：piece是字符本身，在词表里时用它的id，而不是unk"""
+        tokenizer = SentencepieceTokenizerErnie(self.sp_vocab, params={"sentence_piece_model": self.sp_model})
+        unk_id = tokenizer.vocabulary.covert_token_to_id(u"[UNK]")
+        longdragon_id = tokenizer.vocabulary.covert_token_to_id(u"龘")
+        processor = sp.SentencePieceProcessor()
+        processor.Load(self.sp_model)
+        self.assertEqual(processor.PieceToId(u"龘"), processor.unk_id())
+
+        ids = self.assert_batch_same(tokenizer, TEXTS)
+        self.assertIn(longdragon_id, ids[0])
+        self.assertIn(unk_id, ids[-1])
+        self.assertEqual(self.assert_batch_same(tokenizer, TEXTS[:1]), ids[:1])
+
+    def test_wordpiece_unknown_chars(self):
+        """词表外的字符是[UNK]"""
+        tokenizer = FullTokenizer(self.wp_vocab)
+        ids = self.assert_batch_same(tokenizer, TEXTS + TEXTS)
+        self.assertIn(tokenizer.vocabulary.covert_token_to_id(u"[UNK]"), ids[-1])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,117 @@
+# -*- coding: utf-8 -*
+"""
+senta.data.tokenizer.tokenization_utils.BpeEncoder用堆合并的结果与逐次min扫描的合并结果相同
+"""
+import json
+import os
+import random
+import shutil
+import tempfile
+import unittest
+
+from senta.data.tokenizer.tokenization_utils import BpeEncoder, get_pairs
+
+# 按rank从小到大，包括会在合并之后产生新pair的链、重叠的重复字符，以及只能在之后的轮次里合并的pair
+MERGES = [("a", "a"), ("a", "b"), ("b", "c"), ("aa", "a"), ("ab", "c"), ("c", "a"), ("aa", "aa"),
+          ("abc", "abc"), ("bc", "a"), ("b", "b"), ("ca", "b"), ("aaa", "b"), ("c", "c"), ("aaaa", "a"),
+          ("bca", "bc"), ("cc", "abc"), ("b", "a")]
+
+
+def min_scan_bpe(bpe_ranks, token):
+    """改用堆之前的合并循环：每次合并之后用min重新扫描所有相邻pair"""
+    word = tuple(token)
+    pairs = get_pairs(word)
+    if not pairs:
+        return token
+
+    while True:
+        bigram = min(pairs, key=lambda pair: bpe_ranks.get(pair, float('inf')))
+        if bigram not in bpe_ranks:
+            break
+        first, second = bigram
+        new_word = []
+        i = 0
+        while i < len(word):
+            try:
+                j = word.index(first, i)
+                new_word.extend(word[i:j])
+                i = j
+            except ValueError:
+                new_word.extend(word[i:])
+                break
+
+            if word[i] == first and i < len(word) - 1 and word[i + 1] == second:
+                new_word.append(first + second)
+                i += 2
+            else:
+                new_word.append(word[i])
+                i += 1
+        word = tuple(new_word)
+        if len(word) == 1:
+            break
+        pairs = get_pairs(word)
+    return ' '.join(word)
+
+
+class BpeMergeTest(unittest.TestCase):
+    """BpeEncoder.merge和bpe"""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.tmp_dir = tempfile.mkdtemp()
+        encoder_json_file = os.path.join(cls.tmp_dir, "encoder.json")
+        vocab_bpe_file = os.path.join(cls.tmp_dir, "vocab.bpe")
+        with open(encoder_json_file, "w") as fw:
+            json.dump({}, fw)
+        with open(vocab_bpe_file, "w") as fw:
+            fw.write("#version: 0.2\n")
+            for first, second in MERGES:
+                fw.write("%s %s\n" % (first, second))
+        cls.encoder_json_file = encoder_json_file
+        cls.vocab_bpe_file = vocab_bpe_file
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.tmp_dir)
+
+    def build_encoder(self, cache_capacity=100000):
+        """
+        :return: 用玩具merges表构造的BpeEncoder
+        """
+        return BpeEncoder(self.encoder_json_file, self.vocab_bpe_file, cache_capacity=cache_capacity)
+
+    def test_ranks(self):
+        """merges文件的第一行是版本号"""
+        encoder = self.build_encoder()
+        self.assertEqual(encoder.bpe_ranks, dict((pair, rank) for rank, pair in enumerate(MERGES)))
+
+    def test_known_words(self):
+        """手工挑选的重叠、连锁合并"""
+        encoder = self.build_encoder()
+        for token in ["ab", "aaa", "aaaa", "aaaaa", "aaaaaaa", "abcabc", "bcab", "cabcab", "bcabc", "ccabc",
+                      "abababab", "cacaca", "baab", "aaaab", "xyz", "axb"]:
+            self.assertEqual(' '.join(encoder.merge(token)), min_scan_bpe(encoder.bpe_ranks, token), token)
+
+    def test_random_words(self):
+        """固定种子的随机词"""
+        encoder = self.build_encoder()
+        rng = random.Random(0)
+        for _ in range(3000):
+            token = "".join(rng.choice("aabbcx") for _ in range(rng.randint(2, 16)))
+            self.assertEqual(' '.join(encoder.merge(token)), min_scan_bpe(encoder.bpe_ranks, token), token)
+
+    def test_cache(self):
+        """有上限的缓存：结果不变，大小不超过容量，单个字符不进缓存"""
+        encoder = self.build_encoder(cache_capacity=8)
+        rng = random.Random(1)
+        tokens = ["".join(rng.choice("abc") for _ in range(rng.randint(2, 10))) for _ in range(200)]
+        for token in tokens + tokens:
+            self.assertEqual(encoder.bpe(token), min_scan_bpe(encoder.bpe_ranks, token))
+        self.assertEqual(encoder.bpe("a"), "a")
+        stats = encoder.cache_stats()
+        self.assertLessEqual(stats["size"], 8)
+        self.assertEqual(stats["hits"] + stats["misses"], 2 * len(tokens))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,144 @@
+# -*- coding: utf-8 -*
+"""
+senta.inference.checkpoint的sidecar记录和断点续跑
+"""
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+from senta.inference.checkpoint import InferenceCheckpoint
+from senta.inference.result_writer import NpyResultWriter, TsvResultWriter, load_results
+
+
+def format_batch_result(batch_result, qid):
+    """与Inference.format_batch_result相同的分类结果格式"""
+    return ["%d\t%d\t%s\n" % (qid + i, int(np.argmax(probs)), " ".join("%.4f" % p for p in probs))
+            for i, probs in enumerate(batch_result)]
+
+
+class InferenceCheckpointTest(unittest.TestCase):
+    """InferenceCheckpoint"""
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        rng = np.random.RandomState(0)
+        self.batches = [rng.rand(3, 2).astype("float32") for _ in range(5)]
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def tsv_checkpoint(self, fingerprint="fp", interval=1):
+        """结果写成tsv的checkpoint"""
+        writer = TsvResultWriter(os.path.join(self.tmp_dir, "result.tsv"), format_batch_result)
+        return InferenceCheckpoint(writer, fingerprint, interval)
+
+    def run_batches(self, checkpoint, stop=None):
+        """从open返回的batch接着写，stop之前模拟中断，不删除sidecar"""
+        skip = checkpoint.open()
+        finished = False
+        try:
+            for index, batch in enumerate(self.batches):
+                if index < skip:
+                    continue
+                if index == stop:
+                    break
+                checkpoint.write(batch)
+            else:
+                finished = True
+        finally:
+            checkpoint.close(finished)
+        return skip
+
+    def expected_tsv(self):
+        """一次跑完的结果"""
+        lines = []
+        qid = 0
+        for batch in self.batches:
+            lines.extend(format_batch_result(batch, qid))
+            qid += len(batch)
+        return "".join(lines)
+
+    def read_result(self):
+        """
+        :return: tsv结果
+        """
+        with open(os.path.join(self.tmp_dir, "result.tsv")) as fr:
+            return fr.read()
+
+    def test_uninterrupted(self):
+        """跑完之后删除sidecar"""
+        checkpoint = self.tsv_checkpoint()
+        self.assertEqual(self.run_batches(checkpoint), 0)
+        self.assertEqual(self.read_result(), self.expected_tsv())
+        self.assertFalse(os.path.exists(checkpoint.ckpt_file))
+
+    def test_resume(self):
+        """中断之后从记录的batch接着跑，结果与一次跑完相同"""
+        checkpoint = self.tsv_checkpoint()
+        self.run_batches(checkpoint, stop=3)
+        with open(checkpoint.ckpt_file) as fr:
+            state = json.load(fr)
+        self.assertEqual(state["batches"], 3)
+        self.assertEqual(state["qid"], 9)
+
+        self.assertEqual(self.run_batches(self.tsv_checkpoint()), 3)
+        self.assertEqual(self.read_result(), self.expected_tsv())
+        self.assertFalse(os.path.exists(checkpoint.ckpt_file))
+
+    def test_resume_drops_unsaved_batches(self):
+        """interval之间写了但没记录的batch重算，截断之后不会重复"""
+        checkpoint = self.tsv_checkpoint(interval=2)
+        self.run_batches(checkpoint, stop=3)
+        # 第3个batch已经写进结果，但sidecar只记录到第2个
+        self.assertEqual(self.run_batches(self.tsv_checkpoint(interval=2)), 2)
+        self.assertEqual(self.read_result(), self.expected_tsv())
+
+    def test_fingerprint_changed(self):
+        """配置变了从头跑"""
+        self.run_batches(self.tsv_checkpoint(), stop=3)
+        self.assertEqual(self.run_batches(self.tsv_checkpoint(fingerprint="other")), 0)
+        self.assertEqual(self.read_result(), self.expected_tsv())
+
+    def test_broken_sidecar(self):
+        """sidecar不是合法的json时从头跑"""
+        checkpoint = self.tsv_checkpoint()
+        self.run_batches(checkpoint, stop=3)
+        with open(checkpoint.ckpt_file, "w") as fw:
+            fw.write("{")
+        self.assertEqual(self.run_batches(self.tsv_checkpoint()), 0)
+        self.assertEqual(self.read_result(), self.expected_tsv())
+
+    def test_truncated_result(self):
+        """结果文件比sidecar记录的短时从头跑"""
+        checkpoint = self.tsv_checkpoint()
+        self.run_batches(checkpoint, stop=3)
+        with open(os.path.join(self.tmp_dir, "result.tsv"), "r+") as fw:
+            fw.truncate(10)
+        self.assertEqual(self.run_batches(self.tsv_checkpoint()), 0)
+        self.assertEqual(self.read_result(), self.expected_tsv())
+
+    def test_without_fingerprint(self):
+        """fingerprint为None时不写sidecar"""
+        checkpoint = self.tsv_checkpoint(fingerprint=None)
+        self.run_batches(checkpoint, stop=3)
+        self.assertFalse(os.path.exists(checkpoint.ckpt_file))
+        self.assertEqual(self.run_batches(self.tsv_checkpoint(fingerprint=None)), 0)
+        self.assertEqual(self.read_result(), self.expected_tsv())
+
+    def test_resume_npy(self):
+        """npy结果按各列的行数续跑"""
+        path = os.path.join(self.tmp_dir, "result")
+        self.run_batches(InferenceCheckpoint(NpyResultWriter(path, num_labels=2), "fp", 2), stop=3)
+        skip = self.run_batches(InferenceCheckpoint(NpyResultWriter(path, num_labels=2), "fp", 2))
+        self.assertEqual(skip, 2)
+        results = load_results(path)
+        np.testing.assert_array_equal(results["qid"], np.arange(15))
+        np.testing.assert_array_equal(results["probs"], np.concatenate(self.batches))
+
+
+if __name__ == "__main__":
+    unittest.main()
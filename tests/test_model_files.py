@@ -0,0 +1,132 @@
+# -*- coding: utf-8 -*
+"""
+senta.train的模型文件下载、清单和离线校验
+"""
+import hashlib
+import io
+import json
+import os
+import shutil
+import tarfile
+import tempfile
+import unittest
+from unittest import mock
+
+from senta import train
+
+DATA_URL = "https://example.com/1a/model_files.tar.gz"
+MD5_URL = DATA_URL + ".md5"
+MODEL_DICT = {"model_file_http_url": DATA_URL, "model_md5_http_url": MD5_URL,
+              "inference_model_path": "./model_files/task/save_inference_model/inference_step_1"}
+MODEL_FILES = {"dict/vocab.txt": b"[PAD]\n[UNK]\n",
+               "task/save_inference_model/inference_step_1/model": b"model",
+               "task/save_inference_model/inference_step_1/params": b"p" * 100,
+               "task/save_inference_model/inference_step_1/infer_data_params.json": b"{}"}
+
+
+def build_archive(files):
+    """
+    :return: (model_files.tar.gz的内容, md5)
+    """
+    buf = io.BytesIO()
+    with tarfile.open(fileobj=buf, mode="w:gz") as tar:
+        for name, content in sorted(files.items()):
+            info = tarfile.TarInfo("model_files/" + name)
+            info.size = len(content)
+            tar.addfile(info, io.BytesIO(content))
+    content = buf.getvalue()
+    return content, hashlib.md5(content).hexdigest()
+
+
+class ModelFilesTest(unittest.TestCase):
+    """download_data、check_local_data和check_local_model"""
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.archive, self.archive_md5 = build_archive(MODEL_FILES)
+        self.downloads = []
+        patches = [mock.patch.object(train, "_get_abs_path",
+                                     lambda path: os.path.normpath(os.path.join(self.tmp_dir, path))),
+                   mock.patch.object(train, "get_http_url", self.fake_get_http_url)]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def fake_get_http_url(self, url, file_name):
+        """md5文件写self.archive_md5，压缩包写self.archive"""
+        self.downloads.append(url)
+        if url.endswith(".md5"):
+            with open(file_name, "w") as fw:
+                fw.write("%s  model_files.tar.gz\n" % self.archive_md5)
+        else:
+            with open(file_name, "wb") as fw:
+                fw.write(self.archive)
+
+    def path(self, name):
+        """
+        :return: 安装目录下的文件
+        """
+        return os.path.join(self.tmp_dir, name)
+
+    def test_offline_without_download(self):
+        """没有经过校验的下载时离线启动报错，不会把磁盘上的文件当作正确的"""
+        self.assertRaises(IOError, train.check_local_data)
+        os.makedirs(self.path("model_files/dict"))
+        self.assertRaises(IOError, train.check_local_data)
+        self.assertFalse(os.path.exists(self.path("model_files.manifest.json")))
+
+    def test_download_writes_manifest(self):
+        """下载并校验之后写清单，再次启动不重新下载"""
+        self.assertEqual(train.download_data(DATA_URL, MD5_URL), 1)
+        with open(self.path("model_files.manifest.json")) as fr:
+            manifest = json.load(fr)
+        self.assertEqual(manifest["archive_md5"], self.archive_md5)
+        self.assertEqual(manifest["archive_url"], DATA_URL)
+        self.assertEqual(sorted(manifest["files"]), sorted(MODEL_FILES))
+        self.assertEqual(train.check_local_data(), 0)
+        self.assertEqual(train.check_local_data(check_md5=True), 0)
+        self.assertEqual(train.check_local_model("1a", MODEL_DICT), 0)
+
+        self.assertEqual(train.download_data(DATA_URL, MD5_URL), 0)
+        self.assertEqual(self.downloads, [MD5_URL, DATA_URL, MD5_URL])
+
+    def test_corrupted_download(self):
+        """压缩包的md5不对时不解压、不写清单"""
+        self.archive = b"broken"
+        self.assertRaises(IOError, train.download_data, DATA_URL, MD5_URL)
+        self.assertFalse(os.path.exists(self.path("model_files.manifest.json")))
+        self.assertRaises(IOError, train.check_local_data)
+
+    def test_modified_file(self):
+        """大小相同、内容不同的文件只有check_md5时能发现"""
+        train.download_data(DATA_URL, MD5_URL)
+        with open(self.path("model_files/task/save_inference_model/inference_step_1/params"), "wb") as fw:
+            fw.write(b"q" * 100)
+        self.assertEqual(train.check_local_data(), 0)
+        self.assertRaises(IOError, train.check_local_data, True)
+        os.remove(self.path("model_files/dict/vocab.txt"))
+        self.assertRaises(IOError, train.check_local_data)
+
+    def test_reinstall_from_archive(self):
+        """有校验通过的压缩包但没有清单时重新解压，不重新下载"""
+        train.download_data(DATA_URL, MD5_URL)
+        os.remove(self.path("model_files.manifest.json"))
+        del self.downloads[:]
+        self.assertEqual(train.download_data(DATA_URL, MD5_URL), 1)
+        self.assertEqual(self.downloads, [MD5_URL])
+        self.assertEqual(train.check_local_data(check_md5=True), 0)
+
+    def test_other_model_not_installed(self):
+        """model_files里是别的模型的压缩包时，离线加载这个模型报错"""
+        train.download_data(DATA_URL, MD5_URL)
+        other = dict(MODEL_DICT, model_file_http_url="https://example.com/2a/model_files.tar.gz")
+        self.assertRaises(IOError, train.check_local_model, "2a", other)
+        missing = dict(MODEL_DICT, inference_model_path="./model_files/other/save_inference_model/step_1")
+        self.assertRaises(IOError, train.check_local_model, "1a", missing)
+
+
+if __name__ == "__main__":
+    unittest.main()
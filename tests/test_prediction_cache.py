@@ -0,0 +1,37 @@
+# -*- coding: utf-8 -*
+"""
+senta.inference.prediction_cache.PredictionCache的key和空白归一化
+"""
+import unittest
+
+from senta.inference.prediction_cache import PredictionCache
+
+
+class PredictionCacheTest(unittest.TestCase):
+    """make_key、get和put"""
+
+    def test_no_normalize_by_default(self):
+        """默认不归一化，空白不同的文本不共用结果"""
+        cache = PredictionCache()
+        cache.put("ernie", "sentiment_classify", u"很 好", [0.1, 0.9])
+        self.assertIsNone(cache.get("ernie", "sentiment_classify", u"很  好"))
+        self.assertEqual(cache.get("ernie", "sentiment_classify", u"很 好").tolist(), [0.1, 0.9])
+
+    def test_normalize(self):
+        """打开之后分类模型合并连续空白"""
+        cache = PredictionCache(normalize=True)
+        cache.put("ernie", "sentiment_classify", u"很 好", [0.1, 0.9])
+        self.assertEqual(cache.get("ernie", "sentiment_classify", u" 很 \t好 ").tolist(), [0.1, 0.9])
+
+    def test_seq_lab_never_normalized(self):
+        """序列标注的输出与字符位置对应，打开归一化也按原文做key"""
+        cache = PredictionCache(normalize=True)
+        self.assertNotEqual(cache.make_key("ernie", "aspect_extract", u"很 好", "seq_lab"),
+                            cache.make_key("ernie", "aspect_extract", u"很  好", "seq_lab"))
+        cache.put("ernie", "aspect_extract", u"很 好", [1, 0, 2], "seq_lab")
+        self.assertIsNone(cache.get("ernie", "aspect_extract", u"很  好", "seq_lab"))
+        self.assertEqual(cache.get("ernie", "aspect_extract", u"很 好", "seq_lab").tolist(), [1, 0, 2])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,69 @@
+# -*- coding: utf-8 -*
+"""
+senta.inference.inference.Inference.prepare_examples与read_files对同一条明文做相同的预处理
+"""
+import os
+import shutil
+import tempfile
+import unittest
+from collections import namedtuple
+
+from senta.data.data_set_reader.ernie_onesentclassification_dataset_reader_ch import OneSentClassifyReaderCh
+from senta.data.data_set_reader.ernie_twosentclassification_dataset_reader_ch import TwoSentClassifyReaderCh
+from senta.inference.inference import Inference
+
+Field = namedtuple('Field', ['name'])
+DataSetReader = namedtuple('DataSetReader', ['predict_reader'])
+
+
+def build_inference(reader_class, field_names):
+    """
+    只用到predict_reader的fields、normalize_text和prepare_batch_data，不需要加载模型
+    :return: (Inference, predict_reader)
+    """
+    reader = reader_class.__new__(reader_class)
+    reader.fields = [Field(name) for name in field_names]
+    reader.prepare_batch_data = lambda examples, batch_size: [examples]
+    inference = Inference.__new__(Inference)
+    inference.data_set_reader = DataSetReader(reader)
+    return inference, reader
+
+
+class PrepareExamplesTest(unittest.TestCase):
+    """prepare_examples"""
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def read_file(self, reader, content):
+        """
+        :return: read_files读出的样本
+        """
+        input_file = os.path.join(self.tmp_dir, "input")
+        with open(input_file, "w") as fw:
+            fw.write(content)
+        return reader.read_files(input_file)
+
+    def test_two_sent_ch(self):
+        """中文句对去掉空格，直接预测时也一样"""
+        inference, reader = build_inference(TwoSentClassifyReaderCh, ["text_a", "text_b", "label", "qid"])
+        expected = self.read_file(reader, u"text_a\ttext_b\tlabel\tqid\n酒 店 很好\t服务 不错\t0\t0\n")
+        [examples] = inference.prepare_examples([{"text_a": u"酒 店 很好", "text_b": u"服务 不错"}])
+        self.assertEqual(examples[0].text_a, u"酒店很好")
+        self.assertEqual(examples[0].text_b, u"服务不错")
+        self.assertEqual(tuple(examples[0]), tuple(expected[0]))
+
+    def test_one_sent_ch(self):
+        """单句不做处理，缺省的label和qid用"0"和序号填充"""
+        inference, reader = build_inference(OneSentClassifyReaderCh, ["text_a", "label", "qid"])
+        expected = self.read_file(reader, u"label\ttext_a\n0\t酒 店 很好\n")
+        [examples] = inference.prepare_examples([{"text_a": u"酒 店 很好"}])
+        self.assertEqual(examples[0].text_a, expected[0].text_a)
+        self.assertEqual((examples[0].label, examples[0].qid), ("0", "0"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,74 @@
+# -*- coding: utf-8 -*
+"""
+senta.inference.quantization.split_examples：校准和对比FP32/INT8用的样本不重叠
+"""
+import os
+import shutil
+import tempfile
+import unittest
+from collections import namedtuple
+
+from senta.data.data_set_reader.ernie_onesentclassification_dataset_reader_ch import OneSentClassifyReaderCh
+from senta.data.reader_config import ReaderConfig
+from senta.inference.inference import Inference
+from senta.inference.quantization import split_examples
+
+DataSetReader = namedtuple('DataSetReader', ['predict_reader'])
+
+
+class SplitExamplesTest(unittest.TestCase):
+    """split_examples"""
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.dev_path = self.write_data("dev", ["dev %d" % i for i in range(10)])
+        reader = OneSentClassifyReaderCh.__new__(OneSentClassifyReaderCh)
+        reader.config = ReaderConfig()
+        reader.config.data_path = self.dev_path
+        reader.config.batch_size = 3
+        self.inference = Inference.__new__(Inference)
+        self.inference.data_set_reader = DataSetReader(reader)
+        self.inference.sort_window = 0
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def write_data(self, name, rows):
+        """
+        :return: 只有一个带表头文件的目录
+        """
+        data_path = os.path.join(self.tmp_dir, name)
+        os.makedirs(data_path)
+        with open(os.path.join(data_path, "part-0"), "w") as fw:
+            fw.write("label\ttext_a\n")
+            for i, text in enumerate(rows):
+                fw.write("%d\t%s\n" % (i % 2, text))
+        return data_path
+
+    def test_same_dev_set(self):
+        """对比样本从校准样本之后开始"""
+        calib, evals, split = split_examples(self.inference, 4, 5)
+        self.assertEqual([e.text_a for e in calib], ["dev %d" % i for i in range(4)])
+        self.assertEqual([e.text_a for e in evals], ["dev %d" % i for i in range(4, 9)])
+        self.assertEqual(split["calib_range"], [0, 4])
+        self.assertEqual(split["eval_range"], [4, 9])
+        self.assertEqual(split["calib_data_path"], split["eval_data_path"])
+
+        calib, evals, split = split_examples(self.inference, 4, 100)
+        self.assertEqual(len(evals), 6)
+        self.assertEqual(split["eval_range"], [4, 10])
+        self.assertRaises(ValueError, split_examples, self.inference, 10, 5)
+
+    def test_calib_data_path(self):
+        """单独的校准集不占用dev集"""
+        calib_path = self.write_data("calib", ["calib %d" % i for i in range(5)])
+        calib, evals, split = split_examples(self.inference, 4, 5, calib_path)
+        self.assertEqual([e.text_a for e in calib], ["calib %d" % i for i in range(4)])
+        self.assertEqual([e.text_a for e in evals], ["dev %d" % i for i in range(5)])
+        self.assertEqual(split, {"calib_data_path": calib_path, "calib_range": [0, 4],
+                                 "eval_data_path": self.dev_path, "eval_range": [0, 5]})
+        self.assertEqual(self.inference.data_set_reader.predict_reader.config.data_path, self.dev_path)
+
+
+if __name__ == "__main__":
+    unittest.main()
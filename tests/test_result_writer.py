@@ -0,0 +1,189 @@
+# -*- coding: utf-8 -*
+"""
+senta.inference.result_writer的.npy列写出、续跑截断和合并
+"""
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+from senta.inference.result_writer import NPY_HEADER_SIZE, NpyColumn, NpyResultWriter, load_results, \
+    merge_npy_results
+
+
+class NpyColumnTest(unittest.TestCase):
+    """NpyColumn"""
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmp_dir, "probs.npy")
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_round_trip(self):
+        """分几次append之后是一个标准的.npy，可以mmap"""
+        data = np.random.RandomState(0).rand(7, 3).astype("float32")
+        column = NpyColumn(self.path, "float32")
+        column.open()
+        column.append(data[:2])
+        column.append(data[2:])
+        column.close()
+
+        loaded = np.load(self.path, mmap_mode="r")
+        self.assertEqual(loaded.shape, (7, 3))
+        self.assertEqual(loaded.dtype, np.float32)
+        np.testing.assert_array_equal(loaded, data)
+        self.assertEqual(os.path.getsize(self.path), NPY_HEADER_SIZE + data.nbytes)
+
+    def test_resume_then_append(self):
+        """续跑时截断到记录的行数，之后写的内容丢掉，再接着追加"""
+        data = np.arange(20, dtype="int64").reshape([10, 2])
+        column = NpyColumn(self.path, "int64")
+        column.open()
+        column.append(data[:4])
+        column.sync()
+        rows = column.rows
+        # 记录进度之后又写了一些，然后中断，文件头里还是0行
+        column.append(np.full([3, 2], -1, dtype="int64"))
+        column.fw.close()
+        column.fw = None
+
+        resumed = NpyColumn(self.path, "int64")
+        self.assertTrue(resumed.valid(rows))
+        resumed.open(rows)
+        self.assertEqual(resumed.rows, 4)
+        resumed.append(data[4:])
+        resumed.close()
+        np.testing.assert_array_equal(np.load(self.path), data)
+
+    def test_valid(self):
+        """文件比记录的短时不能续跑"""
+        column = NpyColumn(self.path, "int64")
+        self.assertTrue(column.valid(0))
+        self.assertFalse(column.valid(1))
+        column.open()
+        column.append(np.arange(3, dtype="int64"))
+        column.close()
+        self.assertTrue(column.valid(3))
+        self.assertFalse(column.valid(4))
+
+    def test_empty(self):
+        """一行都没有写时也是合法的.npy，给了row_shape时维数正确"""
+        column = NpyColumn(self.path, "float32", row_shape=(3,))
+        column.open()
+        column.close()
+        self.assertEqual(np.load(self.path).shape, (0, 3))
+
+        column = NpyColumn(self.path, "int64")
+        column.open()
+        column.close()
+        self.assertEqual(np.load(self.path).shape, (0,))
+
+    def test_row_shape_mismatch(self):
+        """每次append的行shape必须相同"""
+        column = NpyColumn(self.path, "float32", row_shape=(3,))
+        column.open()
+        with self.assertRaises(ValueError):
+            column.append(np.zeros([2, 4]))
+        column.append(np.zeros([2, 3]))
+        with self.assertRaises(ValueError):
+            column.append(np.zeros([2, 2]))
+        column.close()
+
+
+class NpyResultWriterTest(unittest.TestCase):
+    """NpyResultWriter和merge_npy_results"""
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def write_part(self, name, batches, num_labels=2):
+        """按batch写一个分类结果目录"""
+        path = os.path.join(self.tmp_dir, name)
+        writer = NpyResultWriter(path, num_labels=num_labels)
+        writer.open()
+        qid = 0
+        for batch in batches:
+            qid += writer.write(batch, qid)
+        writer.close()
+        return path
+
+    def test_classification(self):
+        """pred是probs的argmax，qid从0连续编号"""
+        probs = np.array([[0.9, 0.1], [0.2, 0.8], [0.4, 0.6]], dtype="float32")
+        results = load_results(self.write_part("part", [probs[:2], probs[2:]]))
+        np.testing.assert_array_equal(results["qid"], [0, 1, 2])
+        np.testing.assert_array_equal(results["pred"], [0, 1, 1])
+        np.testing.assert_array_equal(results["probs"], probs)
+
+    def test_seq_lab(self):
+        """序列标注的labels首尾相接，按lengths切回每条"""
+        path = os.path.join(self.tmp_dir, "seq")
+        writer = NpyResultWriter(path, inference_type="seq_lab")
+        writer.open()
+        writer.write([[1, 2, 3], [4]], 0)
+        writer.write([[5, 6]], 2)
+        writer.close()
+        results = load_results(path)
+        np.testing.assert_array_equal(results["lengths"], [3, 1, 2])
+        np.testing.assert_array_equal(results["labels"], [1, 2, 3, 4, 5, 6])
+
+    def test_empty_output(self):
+        """没有结果时probs.npy也是(0, num_labels)"""
+        results = load_results(self.write_part("empty", []))
+        self.assertEqual(results["probs"].shape, (0, 2))
+        self.assertEqual(results["pred"].shape, (0,))
+        self.assertEqual(results["qid"].shape, (0,))
+
+    def test_resume_position(self):
+        """按position续跑，截掉记录之后写的batch"""
+        probs = np.random.RandomState(1).rand(6, 2).astype("float32")
+        path = os.path.join(self.tmp_dir, "resume")
+        writer = NpyResultWriter(path, num_labels=2)
+        writer.open()
+        writer.write(probs[:2], 0)
+        writer.sync()
+        position = writer.position()
+        writer.write(probs[2:4] + 1, 2)
+        writer.sync()
+
+        resumed = NpyResultWriter(path, num_labels=2)
+        self.assertTrue(resumed.valid(position))
+        resumed.open(position)
+        resumed.write(probs[2:], 2)
+        resumed.close()
+        results = load_results(path)
+        np.testing.assert_array_equal(results["qid"], np.arange(6))
+        np.testing.assert_array_equal(results["probs"], probs)
+
+    def test_merge_renumbers_qid(self):
+        """合并时qid重新从0编号，空的分片不影响结果的维数"""
+        rng = np.random.RandomState(2)
+        first = rng.rand(3, 2).astype("float32")
+        second = rng.rand(4, 2).astype("float32")
+        parts = [self.write_part("part-0", [first]), self.write_part("part-1", []),
+                 self.write_part("part-2", [second[:1], second[1:]])]
+        merged = os.path.join(self.tmp_dir, "merged")
+        self.assertEqual(merge_npy_results(parts, merged, chunk_rows=2), 7)
+
+        results = load_results(merged)
+        np.testing.assert_array_equal(results["qid"], np.arange(7))
+        np.testing.assert_array_equal(results["probs"], np.concatenate([first, second]))
+        np.testing.assert_array_equal(results["pred"], np.concatenate([first, second]).argmax(axis=1))
+
+    def test_merge_all_empty(self):
+        """全部分片都没有结果时也保留probs的列数"""
+        parts = [self.write_part("part-%d" % i, [], num_labels=3) for i in range(2)]
+        merged = os.path.join(self.tmp_dir, "merged")
+        self.assertEqual(merge_npy_results(parts, merged), 0)
+        self.assertEqual(load_results(merged)["probs"].shape, (0, 3))
+
+
+if __name__ == "__main__":
+    unittest.main()
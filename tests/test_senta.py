@@ -0,0 +1,43 @@
+# -*- coding: utf-8 -*
+"""
+senta.train.Senta不需要加载模型的接口
+"""
+import unittest
+
+from senta.train import ResidentModel, Senta
+
+
+class SentaTest(unittest.TestCase):
+    """Senta"""
+
+    def setUp(self):
+        self.senta = Senta()
+        self.senta.current = ResidentModel("ernie_1.0_skep_large_ch", "sentiment_classify")
+
+    def test_predict_aspects_task(self):
+        """当前模型不是aspect_sentiment_classify时报错，不会把aspect当作普通文本预测"""
+        with self.assertRaises(ValueError):
+            self.senta.predict_aspects([u"酒店很好"], [u"服务"])
+
+    def test_current_model_attributes(self):
+        """tokenizer、inference、model_class和max_seq_len是当前模型的，只读"""
+        model = self.senta.current
+        model.tokenizer, model.inference, model.model_class, model.max_seq_len = "tokenizer", "inference", "model", 128
+        self.assertEqual((self.senta.tokenizer, self.senta.inference, self.senta.model_class, self.senta.max_seq_len),
+                         ("tokenizer", "inference", "model", 128))
+        with self.assertRaises(AttributeError):
+            self.senta.max_seq_len = 256
+
+        self.senta.current = ResidentModel("roberta_skep_large_en", "sentiment_classify")
+        self.assertEqual(self.senta.max_seq_len, 512)
+        self.assertIsNone(self.senta.tokenizer)
+
+    def test_no_model(self):
+        """还没有init_model时报错"""
+        self.senta.current = None
+        with self.assertRaises(ValueError):
+            self.senta.tokenizer
+
+
+if __name__ == "__main__":
+    unittest.main()
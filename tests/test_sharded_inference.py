@@ -0,0 +1,104 @@
+# -*- coding: utf-8 -*
+"""
+senta.inference.sharded_inference按字节切分输入：各片读出的样本拼起来与顺序读原始文件相同
+"""
+import os
+import shutil
+import tempfile
+import unittest
+
+from senta.data.data_set_reader.ernie_onesentclassification_dataset_reader_ch import OneSentClassifyReaderCh
+from senta.data.data_set_reader.ernie_onesentclassification_dataset_reader_en import OneSentClassifyReaderEn
+from senta.inference.sharded_inference import merge_shard_outputs, plan_shards, write_shard_input
+
+
+class ShardedInputTest(unittest.TestCase):
+    """plan_shards和write_shard_input"""
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.data_path = os.path.join(self.tmp_dir, "data")
+        os.makedirs(self.data_path)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def write_data(self, name, rows, trailing_newline=True):
+        """写一个带label\ttext_a表头的文件"""
+        content = "label\ttext_a\n" + "\n".join("%d\t%s" % (i % 2, text) for i, text in enumerate(rows))
+        if trailing_newline:
+            content += "\n"
+        with open(os.path.join(self.data_path, name), "w") as fw:
+            fw.write(content)
+
+    def read_sequential(self, reader):
+        """与data_generator相同的文件顺序读原始输入"""
+        examples = []
+        for name in os.listdir(self.data_path):
+            examples.extend(reader.read_files(os.path.join(self.data_path, name)))
+        return examples
+
+    def read_sharded(self, reader, num_shards):
+        """切分之后各片依次读"""
+        shards, header = plan_shards(self.data_path, num_shards, reader.has_header)
+        examples = []
+        for shard_id, ranges in enumerate(shards):
+            if not ranges:
+                continue
+            part_file = os.path.join(self.tmp_dir, "part-%d" % shard_id)
+            write_shard_input(ranges, header, part_file)
+            examples.extend(reader.read_files(part_file))
+        return examples
+
+    def build_readers(self):
+        """只用到read_files，不需要构造完整的reader"""
+        return [OneSentClassifyReaderCh.__new__(OneSentClassifyReaderCh),
+                OneSentClassifyReaderEn.__new__(OneSentClassifyReaderEn)]
+
+    def test_header(self):
+        """表头只在每片的第一行出现一次，切分点上的数据行不会被当成表头丢掉"""
+        self.write_data("dev", ["row %d" % i for i in range(10)])
+        for reader in self.build_readers():
+            self.assertTrue(reader.has_header)
+            expected = self.read_sequential(reader)
+            self.assertEqual(len(expected), 10)
+            for num_shards in range(1, 8):
+                self.assertEqual(self.read_sharded(reader, num_shards), expected, num_shards)
+
+    def test_multiple_files(self):
+        """多个文件的表头不会混进数据行，最后一行没有换行符也不会和下一个文件连起来"""
+        self.write_data("a", ["first %d" % i for i in range(7)])
+        self.write_data("b", [u"第二个文件 %d" % i for i in range(5)], trailing_newline=False)
+        self.write_data("c", ["third %d" % i for i in range(3)])
+        for reader in self.build_readers():
+            expected = self.read_sequential(reader)
+            self.assertEqual(len(expected), 15)
+            self.assertNotIn("text_a", [example.text_a for example in expected])
+            for num_shards in range(1, 10):
+                self.assertEqual(self.read_sharded(reader, num_shards), expected, num_shards)
+
+    def test_different_headers(self):
+        """各文件表头不同时不能切分"""
+        self.write_data("a", ["row"])
+        with open(os.path.join(self.data_path, "b"), "w") as fw:
+            fw.write("text_a\tlabel\nrow\t0\n")
+        with self.assertRaises(ValueError):
+            plan_shards(self.data_path, 2, True)
+
+    def test_merge_outputs(self):
+        """各片从0开始的qid合并成全局的qid"""
+        part_files = []
+        for shard_id, num in enumerate([2, 0, 3]):
+            part_file = os.path.join(self.tmp_dir, "output-%d" % shard_id)
+            with open(part_file, "w") as fw:
+                for qid in range(num):
+                    fw.write("%d\t1\t0.1 0.9\n" % qid)
+            part_files.append(part_file)
+        test_save = os.path.join(self.tmp_dir, "result")
+        self.assertEqual(merge_shard_outputs(part_files, test_save), 5)
+        with open(test_save) as fr:
+            self.assertEqual([line.split("\t")[0] for line in fr], ["0", "1", "2", "3", "4"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,93 @@
+# -*- coding: utf-8 -*
+"""
+senta.data.tokenizer.tokenization_chars.CharTable一次遍历的结果与BasicTokenizer逐步处理的结果相同
+"""
+import os
+import shutil
+import tempfile
+import unittest
+
+import six
+
+from senta.data.tokenizer.tokenization_chars import FALLBACK, CharTable
+from senta.data.tokenizer.tokenization_wp import BasicTokenizer
+
+TEXTS = [
+    u"Hello, World! It's a test.",
+    u"  leading and trailing\twhitespace\n",
+    u"UNaffable  naïve café Ünïcödé",
+    u"中山大学是岭南第一学府，环境很好！",
+    u"混合English和中文，123个数字。",
+    # \x00是FALLBACK本身，�和控制字符要删掉
+    u"a\x00b �c d\x01e\x7ff",
+    FALLBACK * 3,
+    # 希腊文大写Σ转小写时词尾是ς，其他位置是σ
+    u"ΟΔΟΣ ΣΟΦΟΣ Σ ΑΣ.",
+    # NFD之后是标点或者组合字符被重排序
+    u"a;b ΅ x́ͅy",
+    # 兼容区汉字NFD之后是别的汉字
+    u"豈更丽",
+    # 不是Zs的空白
+    u"a b c\u0085d",
+    u"",
+]
+
+
+class CharTableTest(unittest.TestCase):
+    """CharTable"""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.tmp_dir = tempfile.mkdtemp()
+        cls.vocab_file = os.path.join(cls.tmp_dir, "vocab.txt")
+        with open(cls.vocab_file, "w") as fw:
+            fw.write("[UNK]\n[PAD]\n")
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.tmp_dir)
+
+    def tokenizers(self):
+        """
+        :return: do_lower_case为True和False的BasicTokenizer
+        """
+        return [BasicTokenizer(self.vocab_file, params={"do_lower_case": do_lower_case})
+                for do_lower_case in (True, False)]
+
+    def assert_same(self, tokenizer, text):
+        """CharTable能处理时结果与逐步处理相同，不能处理时返回None"""
+        expected = tokenizer._tokenize_by_steps(text)
+        tokens = tokenizer.char_table.tokenize(text)
+        if tokens is not None:
+            self.assertEqual(tokens, expected, "do_lower_case=%s: %r" % (tokenizer.do_lower_case, text))
+        self.assertEqual(tokenizer.tokenize(text), expected)
+
+    def test_texts(self):
+        """句子、控制字符、希腊文词尾σ、汉字"""
+        for tokenizer in self.tokenizers():
+            for text in TEXTS:
+                self.assert_same(tokenizer, text)
+
+    def test_code_points(self):
+        """逐个码位放在词中间和词尾"""
+        code_points = list(range(0x3000)) + list(range(0x4e00, 0x4e80)) + list(range(0xf900, 0xf980)) \
+            + list(range(0xff00, 0xfff0))
+        for tokenizer in self.tokenizers():
+            for cp in code_points:
+                char = six.unichr(cp)
+                self.assert_same(tokenizer, u"ab%scd %sx%s" % (char, char, char))
+
+    def test_fallback(self):
+        """要看上下文的字符退回逐步处理"""
+        self.assertIsNone(CharTable(True).tokenize(u"ΟΔΟΣ"))
+        self.assertEqual(CharTable(False).tokenize(u"ΟΔΟΣ"), [u"ΟΔΟΣ"])
+        self.assertEqual(CharTable(True).tokenize(u"a\x00b"), [u"ab"])
+
+    def test_chinese_chars(self):
+        """汉字和标点各自成词"""
+        self.assertEqual(CharTable(True).tokenize(u"中文,Ab"), [u"中", u"文", u",", u"ab"])
+        self.assertEqual(CharTable(False).tokenize(u"中文,Ab"), [u"中", u"文", u",", u"Ab"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,39 @@
+# -*- coding: utf-8 -*
+"""
+senta.inference.tuning.select_profile：Inference按配置的batch_size选用调优出的CPU选项
+"""
+import unittest
+
+from senta.inference.tuning import select_profile
+
+PROFILE = {"cpu_threads": 4, "analysis_predictor": True, "ir_optim": True, "use_mkldnn": True,
+           "batch_size": 32, "ms_per_example": 1.0, "speedup": 2.0,
+           "by_batch_size": {"8": {"cpu_threads": 2, "analysis_predictor": False, "use_mkldnn": True,
+                                   "ms_per_example": 1.5},
+                             "32": {"cpu_threads": 4, "analysis_predictor": True, "ir_optim": True,
+                                    "use_mkldnn": True, "ms_per_example": 1.0}}}
+
+
+class SelectProfileTest(unittest.TestCase):
+    """select_profile"""
+
+    def test_tuned_batch_size(self):
+        """用为这个batch_size调出的选项，不混入最快组合的其他选项"""
+        profile = select_profile(PROFILE, 8)
+        self.assertEqual(profile["batch_size"], 8)
+        self.assertEqual(profile["cpu_threads"], 2)
+        self.assertFalse(profile["analysis_predictor"])
+        self.assertNotIn("ir_optim", profile)
+        self.assertEqual(profile["ms_per_example"], 1.5)
+        self.assertEqual(select_profile(PROFILE, 32)["cpu_threads"], 4)
+
+    def test_untuned_batch_size(self):
+        """没有调过的batch_size和旧格式的profile用最快组合的选项"""
+        self.assertIs(select_profile(PROFILE, 16), PROFILE)
+        old = dict((key, value) for key, value in PROFILE.items() if key != "by_batch_size")
+        self.assertIs(select_profile(old, 8), old)
+        self.assertIsNone(select_profile(None, 8))
+
+
+if __name__ == "__main__":
+    unittest.main()
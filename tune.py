@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*
+"""
+CPU预测参数调优，配置文件与infer.py相同。在predict_reader的输入里取num_samples条样本，对inference_model_path
+按线程数、ir优化、内存优化、mkldnn及其shape缓存、batch_size的网格测试，把最快且结果与默认配置一致的组合写到
+inference_model_path/cpu_tuning_profile.json，之后infer.py、serve.py和Senta加载这个模型时自动使用。配置里predict_reader的
+batch_size总会参与测试，infer.py不改batch_size，infer.py和serve.py都只用profile里为这个batch_size选出的选项
+
+usage:
+    python tune.py --param_path ./config/ernie_1.0_skep_large_ch.Chnsenticorp.infer.json --cpu_threads 1,2,4,8
+"""
+import argparse
+import logging
+import os
+
+from infer import build_inference, dataset_reader_from_params, model_from_params
+from senta.common import register
+from senta.inference.tuning import build_grid, save_tuning_profile, tune
+from senta.utils import log
+from senta.utils import params
+from senta.utils.args import ArgumentGroup, str2bool
+
+
+def parse_list(value, item_type=int):
+    """"1,2,4" -> [1, 2, 4]"""
+    return [item_type(item) for item in value.split(",") if item]
+
+
+def parse_bools(value):
+    """"true,false" -> [True, False]"""
+    return [str2bool(item) for item in value.split(",") if item]
+
+
+def build_arguments():
+    """build_arguments"""
+    parser = argparse.ArgumentParser(__doc__)
+    model_g = ArgumentGroup(parser, "model", "model configuration and paths.")
+    model_g.add_arg("param_path", str, None, "path to parameter file describing the model to be tuned")
+    model_g.add_arg("log_dir", str, "log", "log dir")
+    tune_g = ArgumentGroup(parser, "tune", "tuning grid.")
+    tune_g.add_arg("cpu_threads", str, "1,2,4", "comma separated math library thread counts.")
+    tune_g.add_arg("batch_sizes", str, "1,8,32", "comma separated batch sizes.")
+    tune_g.add_arg("use_mkldnn", str, "true,false", "comma separated mkldnn switches.")
+    tune_g.add_arg("ir_optim", str, "true,false", "comma separated ir optimization switches.")
+    tune_g.add_arg("memory_optim", str, "false,true", "comma separated memory optimization switches.")
+    tune_g.add_arg("mkldnn_cache_capacity", str, "0", "comma separated mkldnn shape cache sizes, 0 is unlimited.")
+    tune_g.add_arg("num_samples", int, 64, "number of input examples to time.")
+    tune_g.add_arg("repeat", int, 2, "timed passes per candidate, the fastest one counts.")
+    tune_g.add_arg("tolerance", float, 1e-3, "max abs diff of the probabilities from the default config.")
+    tune_g.add_arg("dry_run", bool, False, "print the best profile without writing it.")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = build_arguments()
+    log.init_log(os.path.join(args.log_dir, "tune"), level=logging.INFO)
+    param_dict = params.from_file(args.param_path)
+    _params = params.replace_none(param_dict)
+
+    register.import_modules()
+
+    inference_params = _params.get("inference")
+    if inference_params.get("PADDLE_USE_GPU"):
+        raise ValueError("tune.py tunes cpu inference, set PADDLE_USE_GPU to false")
+    # 以默认配置为基准，已有的profile和cpu_threads都不生效
+    inference_params["cpu_tuning"] = False
+    inference_params.pop("cpu_threads", None)
+    dataset_reader = dataset_reader_from_params(_params.get("dataset_reader"))
+    model = model_from_params(_params.get("model"))
+    inference = build_inference(inference_params, dataset_reader, model)
+
+    grid = build_grid(parse_list(args.cpu_threads),
+                      use_mkldnn=parse_bools(args.use_mkldnn),
+                      ir_optim=parse_bools(args.ir_optim),
+                      memory_optim=parse_bools(args.memory_optim),
+                      mkldnn_cache_capacity=parse_list(args.mkldnn_cache_capacity))
+    profile = tune(inference, grid, parse_list(args.batch_sizes), num_samples=args.num_samples,
+                   repeat=args.repeat, tolerance=args.tolerance)
+    summary = dict((key, value) for key, value in profile.items() if key != "trials")
+    logging.info("best profile: %s" % summary)
+    print(summary)
+    if not args.dry_run:
+        profile_path = save_tuning_profile(inference_params["inference_model_path"], profile)
+        logging.info("profile written to %s" % profile_path)
+    os._exit(0)